@@ -27,57 +27,129 @@ from __future__ import absolute_import
 import os
 import logging
 import sys
+from multiprocessing.pool import ThreadPool
 
 from ..tools.load_tool import load_syn_tool, load_sim_tool
 from ..util import shell
+from ..util import path as path_mod
+from ..util import context as context_mod
 from ..sourcefiles import new_dep_solver as dep_solver
 from ..sourcefiles.srcfile import VHDLFile, VerilogFile, SVFile
 from ..sourcefiles.sourcefileset import SourceFileSet
+from ..sourcefiles.dep_graph import CompactDepGraph
 from ..module.module import Module, ModuleArgs
+from ..manifest_parser.manifestcache import ManifestCache
+from ..sourcefiles.parse_pipeline import ParsePipeline
+
+logger = logging.getLogger(__name__)
 
 class Action(object):
 
     """This is the base class providing the common Action methods"""
 
-    def __init__(self, options):
+    # Commands solving the dependencies (and so parsing the HDL files)
+    _PARSING_COMMANDS = (None, "makefile", "list-files", "impact",
+                         "select-tests")
+
+    def __init__(self, options, context=None):
         super(Action, self).__init__()
+        self.context = context or context_mod.current()
         self.top_manifest = None
         self.manifests = []
+        self._module_index = {}
         self.parseable_fileset = SourceFileSet()
         self.privative_fileset = SourceFileSet()
         self._deps_solved = False
+        self.dep_graph = None
+        self.manifest_cache = None
+        self.parse_pipeline = None
         self.options = options
+        self.context.fs_cache = path_mod.FsCache()
 
-    def __contains(self, module):
-        """Check if the pool contains the given module by checking the URL"""
-        for mod in self.manifests:
-            if mod.url == module.url:
-                return True
-        return False
+    @staticmethod
+    def _module_key(url, source):
+        """Get the key identifying a module in the pool: its URL without
+        the branch, revision or sparse paths, or its normalized path for
+        local modules"""
+        if source is None or source == 'local':
+            return os.path.normpath(url)
+        url = path_mod.sparse_parse(url)[0]
+        if source == 'svn':
+            return path_mod.svn_parse(url)[0]
+        return path_mod.url_parse(url)[0]
 
     def new_module(self, parent, url, source, fetchto):
         """Add new module to the pool.
 
         This is the only way to add new modules to the pool
-        Thanks to it the pool can easily control its content
+        Thanks to it the pool can easily control its content: if the
+        module is already in the pool, the registered instance is returned
         """
+        key = self._module_key(url, source)
+        module = self._module_index.get(key)
+        if module is not None:
+            if url != module.module_args.url:
+                logger.warning("Module %s is also required as %s (from %s), "
+                               "using the first one", module.module_args.url,
+                               url, parent)
+            return module
         self._deps_solved = False
         args = ModuleArgs()
         args.set_args(parent, url, source, fetchto)
         new_module = Module(args, self)
-        if not self.__contains(new_module):
-            self.manifests.append(new_module)
+        self._module_index[key] = new_module
+        self.manifests.append(new_module)
         return new_module
 
+    def evaluate_manifests(self, modules):
+        """Evaluate concurrently the manifests of the given modules (which
+        are then processed in order by Module.parse_manifest) if requested
+        with --parallel-manifests and several jobs are allowed"""
+        if not self.options.parallel_manifests:
+            return
+        pending = [mod_aux for mod_aux in modules
+                   if mod_aux.isfetched and not mod_aux.isparsed
+                   and mod_aux.evaluation is None]
+        jobs = min(self.options.jobs, len(pending))
+        if jobs < 2:
+            return
+        logger.debug("Evaluating %d manifests with %d jobs",
+                     len(pending), jobs)
+        pool = ThreadPool(jobs)
+        try:
+            pool.map(self.context.bind(Module.evaluate_manifest), pending)
+        finally:
+            pool.close()
+            pool.join()
+
     def load_all_manifests(self):
         # Top level module.
         assert self.top_manifest is None
+        if self.options.manifest_cache:
+            self.manifest_cache = ManifestCache(path_mod.get_cache_dir(
+                self.options.cache_dir, "manifests"))
+        if (getattr(self.options, "pipeline", False)
+                and self.options.command in self._PARSING_COMMANDS):
+            self.parse_pipeline = ParsePipeline(self.options.jobs,
+                                                self.context)
         self.top_manifest = self.new_module(parent=None,
-                                            url=os.getcwd(),
+                                            url=self.context.root_dir,
                                             source=None,
                                             fetchto=".")
         # Parse the top manifest and all sub-modules.
         self.top_manifest.parse_manifest()
+        if self.manifest_cache is not None:
+            self.manifest_cache.report()
+
+    def reload_manifests(self):
+        """Drop the module pool and load all the manifests again, e.g. after
+        the fetched modules changed on the disk"""
+        self.top_manifest = None
+        self.manifests = []
+        self._module_index = {}
+        self._deps_solved = False
+        self.context.fs_cache = path_mod.FsCache()
+        self.load_all_manifests()
 
     def setup(self):
         """Set tool and top_entity"""
@@ -104,14 +176,16 @@ class Action(object):
             top_dict["syn_top"] = self.top_entity
         else:
             raise Exception("Unknown requested action: {}".format(action))
+        if self.tool is not None:
+            self.tool.context = self.context
 
     def build_complete_file_set(self):
         """Build file set with all the files listed in the complete pool"""
-        logging.debug("Begin build complete file set")
+        logger.debug("Begin build complete file set")
         all_manifested_files = SourceFileSet()
         for manifest in self.manifests:
             all_manifested_files.add(manifest.files)
-        logging.debug("End build complete file set")
+        logger.debug("End build complete file set")
         return all_manifested_files
 
     def build_file_set(self):
@@ -132,34 +206,87 @@ class Action(object):
                        for file_type in self.tool.get_privative_files()):
                     self.privative_fileset.add(file_aux)
                 else:
-                    logging.debug("File not supported by the tool: %s",
-                                  file_aux.path)
+                    logger.debug("File not supported by the tool: %s",
+                                 file_aux.path)
         if len(self.privative_fileset) > 0:
-            logging.info("Detected %d supported files that are not parseable",
-                         len(self.privative_fileset))
+            logger.info("Detected %d supported files that are not parseable",
+                        len(self.privative_fileset))
             for f in self.privative_fileset:
-                logging.info("not parseable: %s", f)
+                logger.info("not parseable: %s", f)
         if len(self.parseable_fileset) > 0:
-            logging.info("Detected %d supported files that can be parsed",
-                         len(self.parseable_fileset))
+            logger.info("Detected %d supported files that can be parsed",
+                        len(self.parseable_fileset))
 
-    def solve_file_set(self):
-        """Build file set with only those files required by the top entity"""
+    def _get_provider_policy(self):
+        """Get the policy choosing a single file for the units provided by
+        multiple files, or None if every provider has to be used"""
+        top_dict = self.top_manifest.manifest_dict
+        resolution = top_dict.get("dep_resolution", "all")
+        if resolution == "all":
+            return None
+        elif resolution != "single":
+            raise Exception(
+                "Unknown dep_resolution: {}".format(resolution))
+        overrides = {}
+        for unit, path in top_dict.get("dep_providers", {}).items():
+            overrides[unit] = path_mod.rel2abs(path, self.top_manifest.path)
+        return dep_solver.ProviderPolicy(
+            library_order=top_dict.get("dep_library_order"),
+            overrides=overrides)
+
+    def solve_dependencies(self, extra_tops=None):
+        """Solve the dependencies of the whole parseable file set.  Unless
+        all the files are requested, the modules not used by the top entity
+        (or by any of the extra_tops) are pruned first"""
         if not self._deps_solved:
+            if self.parse_pipeline is not None:
+                self.parse_pipeline.wait()
+                self.parse_pipeline = None
+            if not self.options.all_files:
+                tops = [top_aux for top_aux in
+                        [self.top_entity] + (extra_tops or [])
+                        if top_aux is not None]
+                extra_modules = list(
+                    self.top_manifest.manifest_dict.get("extra_modules")
+                    or [])
+                if len(tops) > 0:
+                    self.parseable_fileset = (
+                        dep_solver.make_module_pruned_set(
+                            self.parseable_fileset, tops[0],
+                            tops[1:] + extra_modules))
+            policy = self._get_provider_policy()
             if self.tool == None:
-                dep_solver.solve(self.parseable_fileset)
+                dep_solver.solve(self.parseable_fileset, policy=policy)
             else:
                 dep_solver.solve(self.parseable_fileset,
-                                 self.tool.get_standard_libs())
+                                 self.tool.get_standard_libs(),
+                                 policy=policy,
+                                 primitives=self.tool.get_primitives())
+            if self.options.compact_graph:
+                self.dep_graph = CompactDepGraph(self.parseable_fileset)
+                self.dep_graph.release_file_sets()
             self._deps_solved = True
+
+    def solve_file_set(self):
+        """Build file set with only those files required by the top entity"""
+        self.solve_dependencies()
         if self.options.all_files:
             return
         solved_files = SourceFileSet()
         solved_files.add(dep_solver.make_dependency_set(
             self.parseable_fileset, self.top_entity,
-            self.top_manifest.manifest_dict.get("extra_modules")))
+            self.top_manifest.manifest_dict.get("extra_modules"),
+            dep_graph=self.dep_graph))
         self.parseable_fileset = solved_files
 
+    def get_dependencies(self, dep_file):
+        """Get the files the given file depends on, from the compact
+        dependency graph if available (the per-file sets are released
+        once it is built)"""
+        if self.dep_graph is not None and dep_file in self.dep_graph:
+            return self.dep_graph.get_dependencies(dep_file)
+        return dep_file.depends_on
+
     def get_top_manifest(self):
         """Get the Top module from the pool"""
         return self.top_manifest
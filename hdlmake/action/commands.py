@@ -23,30 +23,59 @@
 
 from __future__ import absolute_import
 from __future__ import print_function
+import json
 import logging
 import os
 import sys
 import os.path
+from multiprocessing.pool import ThreadPool
+import six
+from six.moves import queue
 
 from ..sourcefiles import new_dep_solver as dep_solver
+from ..sourcefiles.dep_file import DepRelation
 from ..util import path as path_mod
 from ..fetch.svn import Svn
 from ..fetch.git import Git, GitSM
 from ..fetch.local import Local
+from ..fetch.archive import Archive
+from ..fetch.lockfile import LockFile
+from ..fetch.mirror import MirrorCache
+from ..fetch.store import ModuleStore
 from .action import Action
 from ..util import shell
 
+logger = logging.getLogger(__name__)
+
 
 class Commands(Action):
 
     """Class that contains the methods for core actions"""
 
-    def __init__(self, *args):
-        super(Commands, self).__init__(*args)
+    def __init__(self, *args, **kwargs):
+        super(Commands, self).__init__(*args, **kwargs)
         self.git_backend = Git()
         self.gitsm_backend = GitSM()
+        if self.options.git_mirrors or self.options.offline:
+            max_size = self.options.mirror_max_size
+            mirrors = MirrorCache(
+                path_mod.get_cache_dir(self.options.cache_dir, "mirrors"),
+                max_size=None if max_size is None else max_size << 20,
+                offline=self.options.offline)
+            self.git_backend.mirrors = mirrors
+            self.gitsm_backend.mirrors = mirrors
         self.svn_backend = Svn()
+        self.archive_backend = Archive(
+            path_mod.get_cache_dir(self.options.cache_dir, "archives"))
         self.local_backend = Local()
+        self.lock_file = None
+        self.store = None
+        if self.options.store:
+            max_size = self.options.store_max_size
+            self.store = ModuleStore(
+                path_mod.get_cache_dir(self.options.cache_dir, "store"),
+                link=self.options.store_link,
+                max_size=None if max_size is None else max_size << 20)
 
     def _check_all_fetched(self):
         """Check if every module in the pool is fetched"""
@@ -72,92 +101,329 @@ class Commands(Action):
         self.solve_file_set()
         combined_fileset = self.parseable_fileset
         combined_fileset.add(self.privative_fileset)
+        self.tool.dep_graph = self.dep_graph
         self.tool.write_makefile(self.top_manifest,
                                  combined_fileset,
                                  filename=filename)
 
+    def _get_backend(self, module):
+        """Get the fetcher for the given remote module"""
+        if module.source == 'svn':
+            return self.svn_backend
+        elif module.source == 'git':
+            return self.git_backend
+        elif module.source == 'archive':
+            return self.archive_backend
+        assert module.source == 'gitsm'
+        return self.gitsm_backend
+
+    def _remote_modules(self):
+        """Get the remote modules (git, gitsm, svn and archive) of the
+        pool"""
+        return [mod_aux for mod_aux in self.manifests
+                if mod_aux.source in ['git', 'gitsm', 'svn', 'archive']]
+
+    def _get_revisions(self, modules):
+        """Get the revisions checked out in the given modules (None for
+        the ones not fetched), without network access.  Up to --jobs
+        modules are queried concurrently"""
+        def _get_revision(module):
+            if not module.isfetched:
+                return None
+            stored = ModuleStore.read_marker(module)
+            if stored is not None:
+                return stored[1]
+            try:
+                return self._get_backend(module).get_revision(module)
+            except Exception as revision_error:
+                logger.warning("Cannot get the revision of %s: %s",
+                               module.url, revision_error)
+                return None
+        pool = ThreadPool(max(min(self.options.jobs, len(modules)), 1))
+        try:
+            return pool.map(self.context.bind(_get_revision), modules)
+        finally:
+            pool.close()
+            pool.join()
+
+    def _load_lock_file(self):
+        """Get the lock file of the design, None if it does not exist"""
+        lock_file = LockFile(self.context.abspath(self.options.lock_file))
+        if not lock_file.exists():
+            return None
+        lock_file.load()
+        return lock_file
+
+    def _apply_lock(self, module):
+        """Pin the module to its locked revision, if any"""
+        if self.lock_file is None:
+            return
+        revision = self.lock_file.get(module)
+        if revision is not None:
+            logger.info("Using the locked revision %s of %s",
+                        revision, module.url)
+            module.branch, module.revision = None, revision
+
+    def _fetch_backend(self, module):
+        """Fetch the module with its fetcher, or from the module store if
+        enabled and the module is pinned to an immutable revision"""
+        backend = self._get_backend(module)
+        if ModuleStore.read_marker(module) is not None:
+            # Leftover of a module linked from the store
+            ModuleStore.remove(module)
+        if self.store is not None and self.store.accepts(module):
+            return self.store.fetch(module, backend)
+        return backend.fetch(module)
+
+    def _fetch_module(self, module):
+        """Fetch the given module from the remote origin.  Return the
+        module and the error message (None on success)"""
+        logger.debug("Fetching module: %s", str(module))
+        self._apply_lock(module)
+        try:
+            result = self._fetch_backend(module)
+        except Exception as fetch_error:
+            return module, str(fetch_error)
+        if result is False:
+            return module, "the checkout failed"
+        return module, None
+
     def _fetch_all(self):
-        """Fetch all the modules declared in the design"""
-
-        def _fetch_module(module):
-            """Fetch the given module from the remote origin"""
-            new_modules = []
-            logging.debug("Fetching module: %s", str(module))
-            if module.source == 'svn':
-                result = self.svn_backend.fetch(module)
-            elif module.source == 'git':
-                result = self.git_backend.fetch(module)
-            else:
-                assert module.source == 'gitsm'
-                result = self.gitsm_backend.fetch(module)
-            if result is False:
-                raise Exception("Unable to fetch module {}".format(module.url))
-            module.parse_manifest()
-            for m in module.modules:
-                new_modules.extend(module.modules[m])
-            return new_modules
-
-        fetch_queue = self.manifests[:] # Need a copy of the list
-
-        while len(fetch_queue) > 0:
-            cur_mod = fetch_queue.pop()
-            new_modules = []
-            if cur_mod.isfetched:
-                new_modules = cur_mod.submodules()
-            else:
-                new_modules = _fetch_module(cur_mod)
-            for mod in new_modules:
-                if not mod.isfetched:
-                    logging.debug("Appended to fetch queue: "
-                                  + str(mod.url))
-                    fetch_queue.append(mod)
-                else:
-                    logging.debug("NOT appended to fetch queue: "
-                                  + str(mod.url))
+        """Fetch all the modules declared in the design.  Up to --jobs
+        modules are fetched concurrently; the manifest of a fetched module
+        is parsed as soon as it is available (in this thread), so its
+        submodules are queued right away.  The errors are reported at the
+        end, once all the modules that can be fetched have been.  An
+        unexpected exception in a fetch thread is raised in this thread"""
+        jobs = max(self.options.jobs, 1)
+        pool = ThreadPool(jobs)
+        done = queue.Queue()
+        scheduled = set()
+        errors = []
+
+        def _fetch_and_notify(mod):
+            """Fetch the module and hand the result (or the exception) over
+            to the main thread, which waits for every queued module"""
+            try:
+                done.put((self._fetch_module(mod), None))
+            except BaseException:
+                done.put((None, sys.exc_info()))
+
+        def _schedule(modules):
+            """Queue the modules that are not fetched nor queued yet"""
+            for mod in modules:
+                if mod.isfetched or id(mod) in scheduled:
+                    logger.debug("NOT appended to fetch queue: "
+                                 + str(mod.url))
+                    continue
+                logger.debug("Appended to fetch queue: " + str(mod.url))
+                scheduled.add(id(mod))
+                pool.apply_async(self.context.bind(_fetch_and_notify), (mod,))
+
+        try:
+            _schedule(self.manifests)
+            in_flight = len(scheduled)
+            while in_flight > 0:
+                result, exc_info = done.get()
+                in_flight -= 1
+                if exc_info is not None:
+                    six.reraise(*exc_info)
+                module, error = result
+                path_mod.invalidate_fs_cache(module.fetchto())
+                if error is None:
+                    try:
+                        module.parse_manifest()
+                    except Exception as parse_error:
+                        error = str(parse_error)
+                if error is not None:
+                    logger.error("Unable to fetch module %s: %s",
+                                 module.url, error)
+                    errors.append((module, error))
+                    continue
+                scheduled_count = len(scheduled)
+                _schedule(module.submodules())
+                in_flight += len(scheduled) - scheduled_count
+        finally:
+            pool.close()
+            pool.join()
+        if len(errors) > 0:
+            raise Exception("Unable to fetch {} module(s):\n {}".format(
+                len(errors), "\n ".join(["{}: {}".format(mod.url, error)
+                                         for mod, error in errors])))
 
     def fetch(self):
-        """Fetch the missing required modules from their remote origin"""
-        logging.info("Fetching needed modules.")
+        """Fetch the missing required modules from their remote origin.
+        If the design has a lock file, the modules are checked out at their
+        locked revision, and the lock file is completed with the revisions
+        of the modules it has no entry for"""
+        logger.info("Fetching needed modules.")
+        self.lock_file = self._load_lock_file()
         for mod in self.manifests:
             if mod.isfetched and not mod.manifest_dict == None:
                 if 'fetch_pre_cmd' in mod.manifest_dict:
-                    os.system(mod.manifest_dict.get("fetch_pre_cmd", ''))
-        self._fetch_all()
+                    shell.system(mod.manifest_dict.get("fetch_pre_cmd", ''))
+        try:
+            self._fetch_all()
+        finally:
+            if self.lock_file is not None:
+                self._update_lock_file()
         for mod in self.manifests:
             if mod.isfetched and not mod.manifest_dict == None:
                 if 'fetch_post_cmd' in mod.manifest_dict:
-                    os.system(mod.manifest_dict.get("fetch_post_cmd", ''))
-        logging.info("All modules fetched.")
+                    shell.system(mod.manifest_dict.get("fetch_post_cmd", ''))
+        logger.info("All modules fetched.")
+
+    def _update_module(self, module):
+        """Update the given fetched module in place.  Return the module and
+        the error message (None on success)"""
+        logger.debug("Updating module: %s", str(module))
+        self._apply_lock(module)
+        stored = ModuleStore.read_marker(module)
+        try:
+            if stored is None:
+                result = self._get_backend(module).update(module)
+            elif (ModuleStore.accepts(module)
+                  and stored[0] == ModuleStore.entry_name(module)):
+                result = True
+            else:
+                # A store copy is replaced, not updated
+                ModuleStore.remove(module)
+                result = self._fetch_backend(module)
+        except Exception as update_error:
+            return module, str(update_error)
+        if result is False:
+            return module, "the update failed"
+        return module, None
+
+    def update(self):
+        """Update the fetched modules in place and fetch the missing ones.
+        The fetched modules are updated (up to --jobs at a time), then the
+        manifests are loaded again, so the modules they now reference are
+        updated too, until no fetched module is left.  The new modules are
+        finally fetched as with the fetch command"""
+        logger.info("Updating fetched modules.")
+        self.lock_file = self._load_lock_file()
+        updated = set()
+        errors = []
+        while True:
+            modules = [mod_aux for mod_aux in self._remote_modules()
+                       if mod_aux.isfetched and mod_aux.url not in updated]
+            if len(modules) == 0:
+                break
+            updated.update([mod_aux.url for mod_aux in modules])
+            pool = ThreadPool(max(min(self.options.jobs, len(modules)), 1))
+            try:
+                results = pool.map(self.context.bind(self._update_module),
+                                   modules)
+            finally:
+                pool.close()
+                pool.join()
+            for module, error in results:
+                if error is not None:
+                    logger.error("Unable to update module %s: %s",
+                                 module.url, error)
+                    errors.append((module, error))
+            self.reload_manifests()
+        try:
+            self._fetch_all()
+        finally:
+            if self.lock_file is not None:
+                self._update_lock_file()
+        if len(errors) > 0:
+            raise Exception("Unable to update {} module(s):\n {}".format(
+                len(errors), "\n ".join(["{}: {}".format(mod.url, error)
+                                         for mod, error in errors])))
+        logger.info("All modules updated.")
+
+    def _update_lock_file(self):
+        """Add to the lock file the modules it has no valid entry for"""
+        modules = [mod_aux for mod_aux in self._remote_modules()
+                   if mod_aux.isfetched
+                   and self.lock_file.get(mod_aux) is None]
+        changed = False
+        for mod_aux, revision in zip(modules, self._get_revisions(modules)):
+            if revision is not None:
+                changed |= self.lock_file.record(mod_aux, revision)
+        if changed:
+            logger.info("Lock file %s updated", self.options.lock_file)
+            self.lock_file.save()
+
+    def lock(self):
+        """Write the lock file with the revisions checked out in the
+        fetched modules"""
+        self._check_all_fetched()
+        lock_file = LockFile(self.context.abspath(self.options.lock_file))
+        modules = self._remote_modules()
+        for mod_aux, revision in zip(modules, self._get_revisions(modules)):
+            if revision is None:
+                raise Exception("Cannot get the revision of {}".format(
+                    mod_aux.url))
+            lock_file.record(mod_aux, revision)
+        lock_file.save()
+        logger.info("%d module(s) locked in %s", len(modules),
+                    self.options.lock_file)
+
+    def verify(self):
+        """Check that the fetched modules are at the revisions recorded in
+        the lock file, without network access"""
+        lock_file = self._load_lock_file()
+        if lock_file is None:
+            raise Exception("The lock file {} does not exist".format(
+                self.options.lock_file))
+        modules = self._remote_modules()
+        errors = []
+        for mod_aux, revision in zip(modules, self._get_revisions(modules)):
+            locked = lock_file.get(mod_aux)
+            if not mod_aux.isfetched:
+                errors.append((mod_aux, "not fetched"))
+            elif locked is None:
+                errors.append((mod_aux, "not in the lock file"))
+            elif revision != locked:
+                errors.append((mod_aux, "at {}, locked at {}".format(
+                    revision, locked)))
+        for url in lock_file.stale_urls(modules):
+            logger.warning("Lock file entry for an unused module: %s", url)
+        if len(errors) > 0:
+            raise Exception("{} module(s) do not match {}:\n {}".format(
+                len(errors), self.options.lock_file,
+                "\n ".join(["{}: {}".format(mod.url, error)
+                             for mod, error in errors])))
+        logger.info("All %d module(s) match %s", len(modules),
+                    self.options.lock_file)
 
     def clean(self):
         """Delete the local copy of the fetched modules"""
-        logging.info("Removing fetched modules..")
+        logger.info("Removing fetched modules..")
         remove_list = [mod_aux for mod_aux in self.manifests
-                       if mod_aux.source in ['git', 'gitsm', 'svn']
+                       if mod_aux.source in ['git', 'gitsm', 'svn',
+                                             'archive']
                        and mod_aux.isfetched]
         remove_list.reverse()  # we will remove modules in backward order
         if len(remove_list):
             for mod_aux in remove_list:
-                logging.info("... clean: " + mod_aux.url +
-                             " [from: " + mod_aux.path + "]")
+                logger.info("... clean: " + mod_aux.url +
+                            " [from: " + mod_aux.path + "]")
                 mod_aux.remove_dir_from_disk()
         else:
-            logging.info("There are no modules to be removed")
-        logging.info("Modules cleaned.")
+            logger.info("There are no modules to be removed")
+        logger.info("Modules cleaned.")
 
     def list_files(self):
         """List the files added to the design across the pool hierarchy"""
         unfetched_modules = [mod_aux for mod_aux in self.manifests
                              if not mod_aux.isfetched]
         for mod_aux in unfetched_modules:
-            logging.warning(
+            logger.warning(
                 "List incomplete, module %s has not been fetched!", mod_aux)
         if self.options.top != None:
             self.top_entity = self.options.top
         self.build_file_set()
         self.solve_file_set()
+        if self.options.waves is True:
+            self._list_waves()
+            return
         file_list = dep_solver.make_dependency_sorted_list(
-            self.parseable_fileset)
+            self.parseable_fileset, dep_graph=self.dep_graph)
         files_str = [file_aux.path for file_aux in file_list]
         if self.options.reverse is True:
             files_str.reverse()
@@ -167,6 +433,108 @@ class Commands(Action):
             delimiter = self.options.delimiter
         print(delimiter.join(files_str))
 
+    def _list_waves(self):
+        """Print the compilation wavefronts, one line per wave"""
+        waves = dep_solver.make_dependency_waves(self.parseable_fileset,
+                                                 dep_graph=self.dep_graph)
+        if self.options.reverse is True:
+            waves.reverse()
+        if self.options.delimiter is None:
+            delimiter = " "
+        else:
+            delimiter = self.options.delimiter
+        for wave in waves:
+            print(delimiter.join([file_aux.path for file_aux in wave]))
+
+    def _get_changed_paths(self):
+        """Get the absolute paths of the changed files given to the
+        impact command, either on the command line, in a list file
+        (use '-' for stdin) or from a git diff against a revision"""
+        changed = list(self.options.files)
+        if self.options.from_file is not None:
+            if self.options.from_file == '-':
+                changed.extend(sys.stdin.read().split())
+            else:
+                with open(self.context.abspath(self.options.from_file),
+                          "r") as list_file:
+                    changed.extend(list_file.read().split())
+        paths = [self.context.abspath(path_aux) for path_aux in changed]
+        if self.options.git_diff is not None:
+            git_root = shell.run("git rev-parse --show-toplevel")
+            git_list = shell.run_lines(
+                "git diff --name-only {}".format(self.options.git_diff))
+            paths.extend([self.context.abspath(os.path.join(git_root,
+                                                             path_aux))
+                          for path_aux in git_list if path_aux])
+        return paths
+
+    def impact(self):
+        """List the files (or design units) that must be recompiled
+        when the given files change, in compilation order"""
+        if self.options.top != None:
+            self.top_entity = self.options.top
+        self.build_file_set()
+        self.solve_file_set()
+        changed_paths = self._get_changed_paths()
+        design_paths = set([file_aux.path
+                            for file_aux in self.parseable_fileset])
+        for path_aux in changed_paths:
+            if path_aux not in design_paths:
+                logger.debug("Changed file not in the design: %s", path_aux)
+        file_list = dep_solver.make_dependency_sorted_list(
+            dep_solver.make_impact_set(self.parseable_fileset, changed_paths,
+                                       dep_graph=self.dep_graph),
+            dep_graph=self.dep_graph)
+        if self.options.units is True:
+            files_str = []
+            for file_aux in file_list:
+                if self.dep_graph is not None:
+                    files_str.extend(self.dep_graph.get_units(file_aux))
+                    continue
+                units = sorted([rel for rel in file_aux.provides
+                                if rel.rel_type != DepRelation.ARCHITECTURE],
+                               key=(lambda x: (x.lib_name, x.obj_name)))
+                files_str.extend(["{}.{}".format(rel.lib_name, rel.obj_name)
+                                  for rel in units])
+        else:
+            files_str = [file_aux.path for file_aux in file_list]
+        if self.options.delimiter is None:
+            delimiter = "\n"
+        else:
+            delimiter = self.options.delimiter
+        print(delimiter.join(files_str))
+
+    def select_tests(self):
+        """List the testbench tops that depend on the given changed files,
+        so that only the affected simulations need to be rerun"""
+        tops = (self.options.tests
+                or self.top_manifest.manifest_dict.get("sim_tops")
+                or [top_aux for top_aux in [self.top_entity]
+                    if top_aux is not None])
+        if len(tops) == 0:
+            raise Exception("No testbench tops: set sim_tops in the top "
+                            "manifest or use the --test option")
+        self.build_file_set()
+        self.solve_dependencies(extra_tops=tops)
+        selected = dep_solver.make_test_selection(
+            self.parseable_fileset, tops, self._get_changed_paths(),
+            self.top_manifest.manifest_dict.get("extra_modules"),
+            dep_graph=self.dep_graph)
+        if self.options.format == "json":
+            print(json.dumps({"selected": selected,
+                              "skipped": [top_aux for top_aux in tops
+                                          if top_aux not in selected]},
+                             indent=2))
+        elif self.options.format == "make":
+            print("{} := {}".format(self.options.make_var,
+                                    " ".join(selected)))
+        else:
+            if self.options.delimiter is None:
+                delimiter = "\n"
+            else:
+                delimiter = self.options.delimiter
+            print(delimiter.join(selected))
+
     def _print_comment(self, message):
         """Private method that prints a message to stdout if not terse"""
         if not self.options.terse:
@@ -186,14 +554,14 @@ class Commands(Action):
 
         for mod_aux in self.manifests:
             if not mod_aux.isfetched:
-                logging.warning("Module not fetched: %s", mod_aux.url)
+                logger.warning("Module not fetched: %s", mod_aux.url)
                 self._print_comment("# MODULE UNFETCHED! -> %s" % mod_aux.url)
             else:
                 self._print_comment("# MODULE START -> %s" % mod_aux.url)
-                if mod_aux.source in ['svn', 'git', 'gitsm']:
+                if mod_aux.source in ['svn', 'git', 'gitsm', 'archive']:
                     self._print_comment("# * URL: " + mod_aux.url)
                 if (mod_aux.source
-                        in ['svn', 'git', 'gitsm', 'local']
+                        in ['svn', 'git', 'gitsm', 'archive', 'local']
                         and mod_aux.parent):
                     self._print_comment("# * The parent for this module is: %s"
                                         % mod_aux.parent.url)
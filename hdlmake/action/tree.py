@@ -29,6 +29,8 @@ import logging
 from .action import Action
 from ..sourcefiles.dep_file import DepFile
 
+logger = logging.getLogger(__name__)
+
 
 class ActionTree(Action):
 
@@ -51,7 +53,7 @@ class ActionTree(Action):
             hierarchy = nx.bfs_tree(hierarchy, top_id, reverse=False)
         data = json_graph.tree_data(hierarchy, root=top_id)
         json_string = json.dumps(data)
-        json_file = open("hierarchy.json", "w")
+        json_file = open(self.context.abspath("hierarchy.json"), "w")
         json_file.write(json_string)
         json_file.close()
 
@@ -83,7 +85,7 @@ class ActionTree(Action):
               self.options.mode == 'bfs'):
 
 
-            logging.warning("This is the solved tree")
+            logger.warning("This is the solved tree")
             #self.top_entity = self.options.top
             self.build_file_set()
             self.solve_file_set()
@@ -102,21 +104,21 @@ class ActionTree(Action):
             top_file = None
             for chk_file in fset:
                 hierarchy.add_node(path.relpath(chk_file.path))
-                for file_required in chk_file.depends_on:
+                for file_required in self.get_dependencies(chk_file):
                     hierarchy.add_edge(path.relpath(chk_file.path), path.relpath(file_required.path))
                 for rel in chk_file.rels:
                     if (rel == top_rel_vhdl) or (rel == top_rel_vlog):
                         top_file = chk_file
                         top_id = path.relpath(chk_file.path)
             if top_file is None:
-                logging.critical('Could not find a top level file that provides the '
-                                 'top_module="%s". Continuing with the full file set.',
-                                 top_level_entity)
+                logger.critical('Could not find a top level file that provides the '
+                                'top_module="%s". Continuing with the full file set.',
+                                top_level_entity)
 
         else:
             raise Exception('Unknown tree mode: %s', self.options.mode)
 
         if unfetched_modules:
-            logging.warning("Some of the modules have not been fetched!")
+            logger.warning("Some of the modules have not been fetched!")
 
         self._generate_tree_web(hierarchy, top_id)
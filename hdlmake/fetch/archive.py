@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Hdlmake.
+#
+# Hdlmake is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Hdlmake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Hdlmake.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Module providing the fetcher for the modules distributed as archives"""
+
+from __future__ import absolute_import
+import hashlib
+import logging
+import os
+import shutil
+import tarfile
+import threading
+import zipfile
+
+from six.moves.urllib.request import urlopen
+
+from ..util import path as path_utils
+from .fetcher import Fetcher
+
+logger = logging.getLogger(__name__)
+
+
+def parse_digest(digest):
+    """Split a declared digest 'algorithm:hexdigest' (sha256 if there is
+    no algorithm) into (algorithm, hexdigest)"""
+    if ":" in digest:
+        algorithm, value = digest.split(":", 1)
+    else:
+        algorithm, value = "sha256", digest
+    algorithm = algorithm.lower()
+    try:
+        hashlib.new(algorithm)
+    except ValueError:
+        raise Exception("Unknown hash algorithm '{}'".format(algorithm))
+    return (algorithm, value.lower())
+
+
+def _check_member(name, archive):
+    """Refuse the archive members that would be extracted out of the
+    destination directory"""
+    path = os.path.normpath(name)
+    if os.path.isabs(path) or path.split(os.sep)[0] == "..":
+        raise Exception("Unsafe path {} in the archive {}".format(
+            name, archive))
+
+
+class Archive(Fetcher):
+
+    """This class provides the fetcher for the modules distributed as tar
+    or zip archives (a path, a file:// or a http(s):// URL).
+
+    The archives are kept unpacked in a content-addressed cache, by the
+    digest declared in the manifest: an archive is downloaded (or copied),
+    verified and unpacked once per machine, then the workspaces get a copy
+    of the unpacked tree."""
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+
+    def _lock(self, entry):
+        """Get the lock serializing the accesses to a cache entry"""
+        with self._locks_lock:
+            return self._locks.setdefault(entry, threading.Lock())
+
+    @staticmethod
+    def _marker_path(module, mod_path):
+        """Get the path of the file recording the digest of the archive
+        extracted in mod_path (next to it, not to pollute the module)"""
+        head, tail = os.path.split(mod_path)
+        return module.context.abspath(
+            os.path.join(head, ".{}.archive".format(tail)))
+
+    @staticmethod
+    def _download(module, dest, algorithm):
+        """Copy the archive at the module URL or path (relative to the top
+        module) into dest, return its digest"""
+        digest = hashlib.new(algorithm)
+        if "://" in module.url:
+            source = urlopen(module.url)
+        else:
+            source = open(module.context.abspath(module.url), "rb")
+        try:
+            with open(dest, "wb") as dest_file:
+                while True:
+                    chunk = source.read(1 << 20)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    dest_file.write(chunk)
+        finally:
+            source.close()
+        return digest.hexdigest()
+
+    @staticmethod
+    def _extract(archive, dest):
+        """Unpack the archive into dest"""
+        if zipfile.is_zipfile(archive):
+            with zipfile.ZipFile(archive) as zip_file:
+                for name in zip_file.namelist():
+                    _check_member(name, archive)
+                zip_file.extractall(dest)
+            return
+        with tarfile.open(archive) as tar_file:
+            members = tar_file.getmembers()
+            for member in members:
+                _check_member(member.name, archive)
+                if member.issym():
+                    _check_member(os.path.join(
+                        os.path.dirname(member.name), member.linkname),
+                        archive)
+                elif member.islnk():
+                    _check_member(member.linkname, archive)
+                elif not (member.isfile() or member.isdir()):
+                    raise Exception("Unsupported member {} in the archive "
+                                    "{}".format(member.name, archive))
+            kwargs = {}
+            if hasattr(tarfile, "data_filter"):
+                kwargs["filter"] = "data"
+            tar_file.extractall(dest, members, **kwargs)
+
+    @staticmethod
+    def _tree_root(tree):
+        """Get the root of an unpacked tree: its single top directory, if
+        the archive has one (as most releases do)"""
+        entries = os.listdir(tree)
+        if len(entries) == 1 and os.path.isdir(
+                os.path.join(tree, entries[0])):
+            return os.path.join(tree, entries[0])
+        return tree
+
+    def get_tree(self, module):
+        """Get the unpacked tree of the module archive, adding it to the
+        cache first if needed"""
+        algorithm, value = parse_digest(module.revision)
+        entry = os.path.join(self.cache_dir, "{}-{}".format(algorithm, value))
+        tree = os.path.join(entry, "tree")
+        with self._lock(entry):
+            if os.path.isdir(tree):
+                logger.debug("Archive %s found in the cache", module.url)
+                return self._tree_root(tree)
+            logger.info("Adding the archive %s to the cache", module.url)
+            # Unpack aside, so an interrupted unpack is never used.
+            tmp_entry = "{}.{}.tmp".format(entry, os.getpid())
+            shutil.rmtree(tmp_entry, ignore_errors=True)
+            os.makedirs(tmp_entry)
+            try:
+                archive = os.path.join(tmp_entry, "archive")
+                actual = self._download(module, archive, algorithm)
+                if actual != value:
+                    raise Exception(
+                        "Wrong {0} digest for the archive {1}: {2} expected, "
+                        "got {3}".format(algorithm, module.url, value, actual))
+                self._extract(archive, os.path.join(tmp_entry, "tree"))
+                os.remove(archive)
+                if os.path.isdir(entry) and not os.path.isdir(tree):
+                    shutil.rmtree(entry, ignore_errors=True)
+                try:
+                    os.rename(tmp_entry, entry)
+                except OSError:
+                    # Another process may have added it first
+                    if not os.path.isdir(tree):
+                        raise
+            finally:
+                shutil.rmtree(tmp_entry, ignore_errors=True)
+        return self._tree_root(tree)
+
+    def fetch(self, module):
+        """Extract the archive into the fetchto folder of the module"""
+        if module.revision is None:
+            raise Exception("No digest for the archive {} (use "
+                            "'url@@sha256:<digest>')".format(module.url))
+        fetchto = module.fetchto()
+        self.make_fetchto(module)
+        basename = path_utils.archive_basename(module.url)
+        mod_path = os.path.join(fetchto, basename)
+        tree = self.get_tree(module)
+        logger.info("Extracting archive module %s", mod_path)
+        dest = module.context.abspath(mod_path)
+        shutil.rmtree(dest, ignore_errors=True)
+        shutil.copytree(tree, dest, symlinks=True)
+        with open(self._marker_path(module, mod_path), "w") as marker_file:
+            marker_file.write(module.revision + "\n")
+        module.isfetched = True
+        module.path = mod_path
+        return True
+
+    def update(self, module):
+        """Extract the archive again if the declared digest changed"""
+        if self.get_revision(module) == module.revision:
+            return True
+        module.isfetched = False
+        return self.fetch(module)
+
+    def get_revision(self, module):
+        """Get the digest of the archive extracted in the module"""
+        try:
+            with open(self._marker_path(module, module.path)) as marker_file:
+                return marker_file.read().strip()
+        except (IOError, OSError):
+            return None
@@ -21,6 +21,9 @@
 
 """Module providing the base class for the different code fetchers"""
 
+import os
+
+
 class Fetcher(object):
 
     """Base class for the code fetcher objects"""
@@ -28,3 +31,25 @@ class Fetcher(object):
     def fetch(self, module):
         """Stub method, this must be implemented by the code fetcher"""
         pass
+
+    def update(self, module):
+        """Update a fetched module in place.  Stub method, implemented by
+        the remote fetchers"""
+        return True
+
+    def get_revision(self, module):
+        """Get the revision checked out in the fetched module, without
+        network access.  Stub method, implemented by the remote fetchers"""
+        return None
+
+    @staticmethod
+    def make_fetchto(module):
+        """Create the fetchto folder of the module if needed.  Several
+        modules can be fetched concurrently into the same folder"""
+        fetchto = module.context.abspath(module.fetchto())
+        if not os.path.isdir(fetchto):
+            try:
+                os.makedirs(fetchto)
+            except OSError:
+                if not os.path.isdir(fetchto):
+                    raise
@@ -23,12 +23,15 @@
 
 from __future__ import absolute_import
 import os
+import shutil
 from ..util import path as path_utils
 from ..util import shell
 from subprocess import PIPE, Popen
 import logging
 from .fetcher import Fetcher
 
+logger = logging.getLogger(__name__)
+
 
 class Git(Fetcher):
 
@@ -37,11 +40,17 @@ class Git(Fetcher):
 
     def __init__(self):
         self.submodule = False
+        # Cache of mirrors the repositories are cloned from, if any
+        self.mirrors = None
 
     def get_submodule_commit(self, submodule_dir):
         """Get the commit for a repository if defined in Git submodules"""
-        status_line = shell.run("git submodule status %s" % submodule_dir)
-        status_line = status_line.split()
+        try:
+            status_line = shell.run("git submodule status %s" % submodule_dir)
+        except Exception:
+            # Not in a Git repository, or not a submodule of it
+            return None
+        status_line = (status_line or "").split()
         if len(status_line) == 2 or len(status_line) == 3:
             if status_line[0][0] in ['-', '+', 'U']:
                 return status_line[0][1:]
@@ -50,43 +59,196 @@ class Git(Fetcher):
         else:
             return None
 
+    @staticmethod
+    def _sparse_options(module):
+        """Get the clone options for a module: a sparse module is checked
+        out after setting its sparse paths, and only the contents of the
+        files in these paths are downloaded"""
+        if module.sparse:
+            return " --no-checkout --filter=blob:none"
+        return ""
+
+    def get_revision(self, module):
+        """Get the commit checked out in the fetched module"""
+        return shell.run("(cd {0} && git rev-parse HEAD)".format(module.path))
+
+    def _clone_pinned(self, module, fetchto, basename):
+        """Clone a module pinned to a branch or a revision without its
+        history: a shallow clone of the branch, or a shallow fetch of the
+        commit (or tag), to be checked out from FETCH_HEAD as no local ref
+        names it.  If the server refuses it (e.g. fetching by an abbreviated
+        or unadvertised SHA), fall back to a partial clone.  Return True if
+        the clone is shallow"""
+        if module.branch is not None:
+            cmd = "(cd {0} && git clone --depth 1{4} --branch {1} {2} {3})"
+            cmd = cmd.format(fetchto, module.branch, module.url, basename,
+                             self._sparse_options(module))
+        else:
+            cmd = ("(cd {0} && git init -q {3} && cd {3} && "
+                   "git remote add origin {2} && "
+                   "git fetch --depth 1{4} origin {1})")
+            partial = " --filter=blob:none" if module.sparse else ""
+            cmd = cmd.format(fetchto, module.revision, module.url, basename,
+                             partial)
+        if shell.system(cmd) == 0:
+            return True
+        logger.info("Shallow clone of %s refused, using a partial clone",
+                    module.url)
+        self._clone_partial(module, fetchto, basename)
+        return False
+
+    @staticmethod
+    def _clone_partial(module, fetchto, basename):
+        """Clone a module with its history but without the file contents
+        (a blobless partial clone, that servers without filter support
+        serve as a full clone), replacing any previous clone"""
+        mod_path = os.path.join(fetchto, basename)
+        shutil.rmtree(module.context.abspath(mod_path), ignore_errors=True)
+        shell.run("(cd {0} && git clone --filter=blob:none --no-checkout "
+                  "{1} {2})".format(fetchto, module.url, basename))
+
+    @staticmethod
+    def _checkout(module, mod_path, checkout_id):
+        """Set the sparse paths of the module, if any, and check out the
+        given version (HEAD for a sparse module if None).  Return True on
+        success"""
+        if module.sparse:
+            logger.info("Sparse checkout of %s", ", ".join(module.sparse))
+            cmd = "(cd {0} && git sparse-checkout set --cone {1})"
+            cmd = cmd.format(mod_path, " ".join(module.sparse))
+            if shell.system(cmd) != 0:
+                return False
+            if checkout_id is None:
+                checkout_id = "HEAD"
+        if checkout_id is not None:
+            logger.info("Checking out version %s", checkout_id)
+            cmd = "(cd {0} && git checkout {1})"
+            cmd = cmd.format(mod_path, checkout_id)
+            if shell.system(cmd) != 0:
+                return False
+        return True
+
     def fetch(self, module):
         """Get the code from the remote Git repository"""
         fetchto = module.fetchto()
-        if not os.path.exists(fetchto):
-            os.mkdir(fetchto)
+        self.make_fetchto(module)
         basename = path_utils.url_basename(module.url)
         mod_path = os.path.join(fetchto, basename)
         assert not module.isfetched
-        logging.info("Fetching git module %s", mod_path)
-        shell.run("(cd {0} && git clone {1})".format(fetchto, module.url))
+        logger.info("Fetching git module %s", mod_path)
+        shallow = False
+        if self.mirrors is not None:
+            self.mirrors.clone(module.url, fetchto, basename,
+                               checkout=not module.sparse)
+        elif module.branch is not None or module.revision is not None:
+            shallow = self._clone_pinned(module, fetchto, basename)
+        else:
+            shell.run("(cd {0} && git clone{2} {1})".format(
+                fetchto, module.url, self._sparse_options(module)))
         checkout_id = None
         if module.branch is not None:
             checkout_id = module.branch
-            logging.debug("Git branch requested: %s", checkout_id)
+            logger.debug("Git branch requested: %s", checkout_id)
         elif module.revision is not None:
             checkout_id = module.revision
-            logging.debug("Git commit requested: %s", checkout_id)
+            logger.debug("Git commit requested: %s", checkout_id)
         else:
             checkout_id = self.get_submodule_commit(module.path)
-            logging.debug("Git submodule commit: %s", checkout_id)
-        if checkout_id is not None:
-            logging.info("Checking out version %s", checkout_id)
-            cmd = "(cd {0} && git checkout {1})"
-            cmd = cmd.format(mod_path, checkout_id)
-            if os.system(cmd) != 0:
+            logger.debug("Git submodule commit: %s", checkout_id)
+        if shallow and module.branch is None:
+            # No local ref names a fetched revision (e.g. a tag)
+            shallow_id = "FETCH_HEAD"
+        else:
+            shallow_id = checkout_id
+        if not self._checkout(module, mod_path, shallow_id):
+            if not shallow:
+                return False
+            logger.info("Checkout of the shallow clone of %s failed, "
+                        "using a partial clone", module.url)
+            self._clone_partial(module, fetchto, basename)
+            if not self._checkout(module, mod_path, checkout_id):
                 return False
         if self.submodule and not module.isfetched:
             cmd = ("(cd {0} && git submodule init &&"
                 "git submodule update --recursive)")
             cmd = cmd.format(mod_path)
-            if os.system(cmd) != 0:
+            if shell.system(cmd) != 0:
                 return False
         module.isfetched = True
         module.path = mod_path
         return True
 
 
+    @staticmethod
+    def _git_output(mod_path, command):
+        """Get the first output line of a git command run in the module,
+        None if it fails"""
+        try:
+            return shell.run("(cd {0} && git {1})".format(mod_path, command))
+        except Exception:
+            return None
+
+    def update(self, module):
+        """Update a fetched module in place: fetch only the missing objects
+        and check out the requested branch or revision.  A branch is reset
+        to the fetched head, an unpinned module on a branch is fast
+        forwarded"""
+        if self.mirrors is None:
+            return self._update(module, "origin")
+        with self.mirrors.use(module.url) as mirror:
+            return self._update(module, '"{}"'.format(mirror))
+
+    def _update(self, module, remote):
+        """Update the module, fetching from the given remote"""
+        mod_path = module.path
+        depth = ""
+        if self._git_output(mod_path,
+                            "rev-parse --is-shallow-repository") == "true":
+            depth = " --depth 1"
+        logger.info("Updating git module %s", mod_path)
+        if module.branch is None and module.revision is None:
+            revision = self.get_submodule_commit(mod_path)
+        else:
+            revision = module.revision
+        fetch, checkout = [], []
+        if module.branch is not None:
+            fetch = ["git fetch{0} {1} {2}".format(
+                depth, remote, module.branch)]
+            checkout = ["git checkout -q -B {0} FETCH_HEAD".format(
+                module.branch)]
+        elif revision is not None:
+            checkout = ["git checkout -q {0}".format(revision)]
+            if self._git_output(mod_path, "rev-parse -q --verify "
+                                "{0}^{{commit}}".format(revision)) is None:
+                fetch = ["git fetch{0} {1} {2}".format(
+                    depth, remote, revision)]
+                checkout = ["git checkout -q FETCH_HEAD"]
+        else:
+            branch = self._git_output(mod_path, "rev-parse --abbrev-ref HEAD")
+            if branch is None or branch == "HEAD":
+                logger.info("Module %s is not on a branch, not updated",
+                            mod_path)
+            else:
+                fetch = ["git fetch {0} {1}".format(remote, branch)]
+                checkout = ["git merge -q --ff-only FETCH_HEAD"]
+        # The sparse paths are set before checking out the new files
+        sparse = []
+        if module.sparse:
+            sparse = ["git sparse-checkout set --cone {0}".format(
+                " ".join(module.sparse))]
+        elif self._git_output(mod_path,
+                              "config --get core.sparseCheckout") == "true":
+            sparse = ["git sparse-checkout disable"]
+        steps = fetch + sparse + checkout
+        if self.submodule:
+            steps.append("git submodule update --init --recursive")
+        if len(steps) == 0:
+            return True
+        cmd = "(cd {0} && {1})".format(mod_path, " && ".join(steps))
+        return shell.system(cmd) == 0
+
+
 class GitSM(Git):
     def __init__(self):
+        super(GitSM, self).__init__()
         self.submodule = True
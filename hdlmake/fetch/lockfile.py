@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Hdlmake.
+#
+# Hdlmake is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Hdlmake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Hdlmake.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Module providing the lock file recording the revisions of the fetched
+modules"""
+
+from __future__ import absolute_import
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+class LockFile(object):
+
+    """Lock file of a design (hdlmake.lock by default).
+
+    It records, for every remote module (identified by its URL without
+    branch or revision), the module specification in the manifest and the
+    revision it was resolved to: a Git commit or a SVN revision number.
+    An entry only applies while the specification in the manifest is
+    unchanged, so changing the branch or revision of a module in a
+    manifest resolves it again."""
+
+    VERSION = 1
+
+    def __init__(self, path):
+        self.path = path
+        self.modules = {}
+
+    def exists(self):
+        """Check if the lock file exists on the disk"""
+        return os.path.isfile(self.path)
+
+    def load(self):
+        """Read the lock file"""
+        with open(self.path, "r") as lock_file:
+            content = json.load(lock_file)
+        if content.get("version") != self.VERSION:
+            raise Exception("Unsupported version of the lock file {}".format(
+                self.path))
+        self.modules = content.get("modules", {})
+
+    def save(self):
+        """Write the lock file"""
+        tmp_path = "{}.{}.tmp".format(self.path, os.getpid())
+        with open(tmp_path, "w") as lock_file:
+            json.dump({"version": self.VERSION, "modules": self.modules},
+                      lock_file, indent=2, sort_keys=True)
+            lock_file.write("\n")
+        getattr(os, "replace", os.rename)(tmp_path, self.path)
+        logger.debug("Lock file %s written", self.path)
+
+    def get(self, module):
+        """Get the locked revision of the module, None if it has no entry
+        or the entry was recorded for another specification"""
+        entry = self.modules.get(module.url)
+        if (entry is None or entry.get("source") != module.source
+                or entry.get("spec") != module.module_args.url):
+            return None
+        return entry.get("revision")
+
+    def record(self, module, revision):
+        """Record the revision of the module, return True if the entry
+        changed"""
+        entry = {"source": module.source,
+                 "spec": module.module_args.url,
+                 "revision": revision}
+        if self.modules.get(module.url) == entry:
+            return False
+        self.modules[module.url] = entry
+        return True
+
+    def stale_urls(self, modules):
+        """Get the URLs of the entries for none of the given modules"""
+        urls = set([mod.url for mod in modules])
+        return sorted([url for url in self.modules if url not in urls])
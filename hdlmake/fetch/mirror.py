@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Hdlmake.
+#
+# Hdlmake is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Hdlmake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Hdlmake.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+"""Module providing the machine-wide cache of bare Git mirrors"""
+
+from __future__ import absolute_import
+import contextlib
+import hashlib
+import logging
+import os
+import shutil
+import threading
+
+from ..util import path as path_utils
+from ..util import shell
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class PathLocks(object):
+
+    """Locks of the entries of a cache directory, for the threads of this
+    process and, with a lock file next to every entry (where supported),
+    for the other processes"""
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def lock(self, path, blocking=True):
+        """Lock the entry at the given path.  If not blocking, yield False
+        when the entry is in use"""
+        with self._locks_lock:
+            thread_lock = self._locks.setdefault(path, threading.Lock())
+        if not thread_lock.acquire(blocking):
+            yield False
+            return
+        try:
+            if fcntl is None:
+                yield True
+                return
+            try:
+                os.makedirs(self.cache_dir)
+            except OSError:
+                if not os.path.isdir(self.cache_dir):
+                    raise
+            with open(path + ".lock", "a") as lock_file:
+                try:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX
+                                | (0 if blocking else fcntl.LOCK_NB))
+                except (IOError, OSError):
+                    if blocking:
+                        raise
+                    yield False
+                    return
+                try:
+                    yield True
+                finally:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+        finally:
+            thread_lock.release()
+
+
+class MirrorCache(object):
+
+    """Cache of bare mirrors of the Git repositories, shared by all the
+    workspaces of the machine.
+
+    Every repository is mirrored once (git clone --mirror) and updated
+    before a workspace is cloned from it, so only the new objects are
+    downloaded.  In offline mode the mirrors are never updated, and a
+    repository without a mirror cannot be fetched.  If a maximum size (in
+    bytes) is given, the least recently used mirrors are evicted when the
+    cache grows beyond it.
+
+    The accesses to a mirror are serialized with a lock file next to it
+    (where supported), so the workspaces of different processes can share
+    the cache."""
+
+    def __init__(self, cache_dir, max_size=None, offline=False):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.offline = offline
+        self._locks = PathLocks(cache_dir)
+
+    def mirror_path(self, url):
+        """Get the path of the mirror for the repository URL"""
+        digest = hashlib.sha1(url.encode()).hexdigest()[:16]
+        return os.path.join(self.cache_dir, "{}-{}.git".format(
+            path_utils.url_basename(url), digest))
+
+    def _update(self, url, mirror):
+        """Create or update the mirror, the caller holds its lock"""
+        if os.path.isdir(mirror):
+            if not self.offline:
+                logger.debug("Updating the mirror %s", mirror)
+                try:
+                    shell.run('git --git-dir="{}" remote update '
+                              '--prune'.format(mirror))
+                except Exception as update_error:
+                    logger.warning("Cannot update the mirror of %s, "
+                                   "using the cached one: %s",
+                                   url, update_error)
+        elif self.offline:
+            raise Exception("No mirror of {} in {} (offline mode)".format(
+                url, self.cache_dir))
+        else:
+            logger.info("Mirroring %s", url)
+            # Clone aside, so an interrupted clone is never used.
+            tmp_mirror = "{}.{}.tmp".format(mirror, os.getpid())
+            shutil.rmtree(tmp_mirror, ignore_errors=True)
+            shell.run('git clone --mirror {} "{}"'.format(url, tmp_mirror))
+            try:
+                os.rename(tmp_mirror, mirror)
+            except OSError:
+                # Created meanwhile by a process not using the lock
+                if not os.path.isdir(mirror):
+                    raise
+                logger.debug("The mirror %s already exists, using it",
+                             mirror)
+                shutil.rmtree(tmp_mirror, ignore_errors=True)
+        # The modification time records the last use, for the eviction
+        os.utime(mirror, None)
+
+    @contextlib.contextmanager
+    def use(self, url):
+        """Create or update the mirror of the repository and yield its
+        path.  The mirror stays locked, so it cannot be evicted, until the
+        end of the with block"""
+        mirror = self.mirror_path(url)
+        with self._locks.lock(mirror):
+            self._update(url, mirror)
+            yield mirror
+        self.evict(keep=mirror)
+
+    def clone(self, url, fetchto, basename, checkout=True):
+        """Clone the repository into fetchto/basename from its mirror, with
+        no network access.  The clone does not depend on the mirror (the
+        objects are hard linked or copied) and its origin remote points to
+        the repository URL"""
+        options = "" if checkout else " --no-checkout"
+        with self.use(url) as mirror:
+            shell.run('(cd {0} && git clone{4} "{1}" {2} && cd {2} && '
+                      'git remote set-url origin {3})'.format(
+                          fetchto, mirror, basename, url, options))
+
+    def _get_mirrors(self):
+        """Get the (last use, size, path) of the cached mirrors"""
+        mirrors = []
+        if not os.path.isdir(self.cache_dir):
+            return mirrors
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if not name.endswith(".git") or not os.path.isdir(path):
+                continue
+            mirrors.append((os.path.getmtime(path),
+                            path_utils.tree_size(path), path))
+        return mirrors
+
+    def evict(self, keep=None):
+        """Remove the least recently used mirrors (but keep) until the
+        cache is not larger than its maximum size"""
+        if self.max_size is None:
+            return
+        mirrors = sorted(self._get_mirrors())
+        total = sum([size for _, size, _ in mirrors])
+        for _, size, path in mirrors:
+            if total <= self.max_size:
+                break
+            if path == keep:
+                continue
+            with self._locks.lock(path, blocking=False) as locked:
+                # Never evict a mirror in use, by any process
+                if not locked:
+                    continue
+                logger.info("Evicting the mirror %s (%d bytes)", path, size)
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Hdlmake.
+#
+# Hdlmake is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Hdlmake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Hdlmake.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Module providing the machine-wide store of materialized modules"""
+
+from __future__ import absolute_import
+import hashlib
+import logging
+import os
+import re
+import shutil
+import stat
+import threading
+
+from ..util import path as path_utils
+from .mirror import PathLocks
+
+logger = logging.getLogger(__name__)
+
+# The version control metadata is not kept in the store
+_VCS_NAMES = (".git", ".svn")
+
+
+def _set_read_only(path):
+    """Remove the write permissions of the files of a tree.  The
+    directories stay writable, so the tree can still be removed"""
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            name = os.path.join(dirpath, name)
+            if os.path.islink(name):
+                continue
+            mode = os.stat(name).st_mode
+            os.chmod(name, mode & ~(stat.S_IWUSR | stat.S_IWGRP
+                                    | stat.S_IWOTH))
+
+
+def _link_tree(src, dest):
+    """Copy a tree by hard linking its files (copying them if they cannot
+    be linked, e.g. on another file system)"""
+    os.makedirs(dest)
+    for name in os.listdir(src):
+        src_name = os.path.join(src, name)
+        dest_name = os.path.join(dest, name)
+        if os.path.islink(src_name):
+            os.symlink(os.readlink(src_name), dest_name)
+        elif os.path.isdir(src_name):
+            _link_tree(src_name, dest_name)
+        else:
+            try:
+                os.link(src_name, dest_name)
+            except OSError:
+                shutil.copy2(src_name, dest_name)
+
+
+class _StoreModule(object):
+
+    """Stand-in for a module fetched into the store instead of its
+    workspace, as seen by the fetchers"""
+
+    def __init__(self, module, fetchto):
+        self.url = module.url
+        self.source = module.source
+        self.branch = module.branch
+        self.revision = module.revision
+        self.sparse = module.sparse
+        self.context = module.context
+        self.isfetched = False
+        self.path = None
+        self._fetchto = fetchto
+
+    def fetchto(self):
+        """The folder the module is fetched into"""
+        return self._fetchto
+
+
+class ModuleStore(object):
+
+    """Store of the remote modules materialized once per machine.
+
+    Every (url, revision, sparse paths) of a git or svn module pinned to
+    an immutable revision (a full commit id, possibly from the lock file,
+    or a svn revision number) is fetched once into the store, without its
+    version control metadata, and its files are made read-only.  The
+    workspaces get a hard linked copy of the tree (or a symbolic link to
+    it), and a marker next to it records the store entry it comes from.
+    If a maximum size (in bytes) is given, the least recently used entries
+    are evicted when the store grows beyond it.
+
+    The accesses to an entry are serialized with a lock file next to it
+    (where supported), so the workspaces of different processes can share
+    the store."""
+
+    def __init__(self, store_dir, link="hardlink", max_size=None):
+        self.store_dir = store_dir
+        self.link = link
+        self.max_size = max_size
+        self._locks = PathLocks(store_dir)
+        # The entries linked by this run, never evicted
+        self._used = set()
+
+    @staticmethod
+    def accepts(module):
+        """Check if the module is pinned to an immutable revision"""
+        if module.source in ('git', 'gitsm'):
+            return (module.branch is None and module.revision is not None
+                    and re.match("^[0-9a-f]{40}$", module.revision)
+                    is not None)
+        if module.source == 'svn':
+            return module.revision is not None and module.revision.isdigit()
+        return False
+
+    @staticmethod
+    def entry_name(module):
+        """Get the name of the store entry for the module"""
+        key = "\n".join([module.source, module.url, module.revision]
+                        + sorted(module.sparse or []))
+        return "{}-{}".format(os.path.basename(module.path),
+                              hashlib.sha1(key.encode()).hexdigest()[:16])
+
+    @staticmethod
+    def _marker_path(module):
+        """Get the path of the file recording the store entry a workspace
+        module comes from (next to it, not to pollute the module)"""
+        head, tail = os.path.split(module.path)
+        return module.context.abspath(
+            os.path.join(head, ".{}.store".format(tail)))
+
+    @classmethod
+    def read_marker(cls, module):
+        """Get the (entry name, revision) the workspace module was linked
+        from, None if it does not come from the store"""
+        try:
+            with open(cls._marker_path(module)) as marker_file:
+                entry, revision = marker_file.read().split()
+        except (IOError, OSError, ValueError):
+            return None
+        return (entry, revision)
+
+    @classmethod
+    def remove(cls, module):
+        """Remove the workspace copy of a module linked from the store"""
+        dest = module.context.abspath(module.path)
+        logger.debug("Removing the store copy %s", module.path)
+        if os.path.islink(dest):
+            os.remove(dest)
+        else:
+            shutil.rmtree(dest, ignore_errors=True)
+        try:
+            os.remove(cls._marker_path(module))
+        except OSError:
+            pass
+        path_utils.invalidate_fs_cache(module.path)
+        module.isfetched = False
+
+    @staticmethod
+    def _materialize(module, backend, entry):
+        """Fetch the store tree of the module with the backend, unless
+        it is already in the store.  The caller holds the entry lock"""
+        if os.path.isdir(entry):
+            logger.debug("Module %s found in the store", module.url)
+            return
+        logger.info("Adding %s@%s to the module store",
+                    module.url, module.revision)
+        # Fetch aside, so an interrupted fetch is never used.
+        tmp_dir = "{}.{}.{}.tmp".format(entry, os.getpid(),
+                                        threading.current_thread().ident)
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        try:
+            store_module = _StoreModule(module, tmp_dir)
+            if backend.fetch(store_module) is False:
+                raise Exception("the checkout failed")
+            tree = os.path.join(tmp_dir, os.path.basename(store_module.path))
+            for dirpath, dirnames, filenames in os.walk(tree):
+                for name in [d for d in dirnames if d in _VCS_NAMES]:
+                    dirnames.remove(name)
+                    shutil.rmtree(os.path.join(dirpath, name))
+                for name in [f for f in filenames if f in _VCS_NAMES]:
+                    os.remove(os.path.join(dirpath, name))
+            # Moved before being made read-only: moving a directory to
+            # another parent needs write permission on it.
+            try:
+                os.rename(tree, entry)
+            except OSError:
+                # Added meanwhile by a process not using the lock
+                if not os.path.isdir(entry):
+                    raise
+            else:
+                _set_read_only(entry)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def fetch(self, module, backend):
+        """Fetch the module into its workspace from the store"""
+        entry = os.path.join(self.store_dir, self.entry_name(module))
+        with self._locks.lock(entry):
+            self._materialize(module, backend, entry)
+            # The modification time records the last use, for the eviction
+            os.utime(entry, None)
+            dest = module.context.abspath(module.path)
+            if os.path.islink(dest) or os.path.exists(dest):
+                self.remove(module)
+            backend.make_fetchto(module)
+            logger.info("Linking module %s from the store", module.path)
+            if self.link == "symlink":
+                os.symlink(entry, dest)
+            else:
+                _link_tree(entry, dest)
+        with open(self._marker_path(module), "w") as marker_file:
+            marker_file.write("{}\n{}\n".format(self.entry_name(module),
+                                                module.revision))
+        module.isfetched = True
+        self._used.add(entry)
+        self.evict()
+        return True
+
+    def _get_entries(self):
+        """Get the (last use, size, path) of the store entries"""
+        entries = []
+        if not os.path.isdir(self.store_dir):
+            return entries
+        for name in os.listdir(self.store_dir):
+            path = os.path.join(self.store_dir, name)
+            if (re.search("-[0-9a-f]{16}$", name) is None
+                    or not os.path.isdir(path)):
+                continue
+            entries.append((os.path.getmtime(path),
+                            path_utils.tree_size(path), path))
+        return entries
+
+    def evict(self):
+        """Remove the least recently used entries (but the ones linked by
+        this run) until the store is not larger than its maximum size.  The
+        workspaces hard linked from an evicted entry keep their files"""
+        if self.max_size is None:
+            return
+        entries = sorted(self._get_entries())
+        total = sum([size for _, size, _ in entries])
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            if path in self._used:
+                continue
+            with self._locks.lock(path, blocking=False) as locked:
+                # Never evict an entry being linked, by any process
+                if not locked:
+                    continue
+                logger.info("Evicting the store entry %s (%d bytes)",
+                            path, size)
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
@@ -25,8 +25,11 @@ from __future__ import absolute_import
 import os
 import logging
 from ..util import path as path_utils
+from ..util import shell
 from .fetcher import Fetcher
 
+logger = logging.getLogger(__name__)
+
 
 class Svn(Fetcher):
 
@@ -36,11 +39,31 @@ class Svn(Fetcher):
     def __init__(self):
         pass
 
+    def get_revision(self, module):
+        """Get the revision of the fetched module working copy"""
+        return shell.run("svn info --show-item revision {0}".format(
+            module.path))
+
+    def update(self, module):
+        """Update a fetched module working copy to the requested revision
+        (the head if none), keeping its sparse paths"""
+        revision = ""
+        if module.revision:
+            revision = " -r " + module.revision
+        if module.sparse:
+            cmd = ("cd {0} && svn update{1} && svn update --parents "
+                   "--set-depth infinity{1} {2}").format(
+                       module.path, revision, " ".join(module.sparse))
+        else:
+            cmd = "cd {0} && svn update --set-depth infinity{1}".format(
+                module.path, revision)
+        logger.info("Updating module %s", module.path)
+        return shell.system(cmd) == 0
+
     def fetch(self, module):
         """Get the code from the remote SVN repository"""
         fetchto = module.fetchto()
-        if not os.path.exists(fetchto):
-            os.mkdir(fetchto)
+        self.make_fetchto(module)
         basename = path_utils.svn_basename(module.url)
         mod_path = os.path.join(fetchto, basename)
         cmd = "cd {0} && svn checkout {1} " + basename
@@ -48,10 +71,18 @@ class Svn(Fetcher):
             cmd = cmd.format(fetchto, module.url + '@' + module.revision)
         else:
             cmd = cmd.format(fetchto, module.url)
+        if module.sparse:
+            # Check out the top files (the manifest), then the sparse paths
+            cmd = cmd.replace("svn checkout", "svn checkout --depth files")
+            cmd += (" && cd " + basename
+                    + " && svn update --parents --set-depth infinity")
+            if module.revision:
+                cmd += " -r " + module.revision
+            cmd += " " + " ".join(module.sparse)
         success = True
-        logging.info("Checking out module %s", mod_path)
-        logging.debug(cmd)
-        if os.system(cmd) != 0:
+        logger.info("Checking out module %s", mod_path)
+        logger.debug(cmd)
+        if shell.system(cmd) != 0:
             success = False
         module.isfetched = True
         module.path = mod_path
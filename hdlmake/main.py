@@ -29,18 +29,24 @@ import sys
 import logging
 from .util import shell
 from .util.termcolor import colored
+from .util import path as path_mod
+from .util.context import Context
 
 from .manifest_parser.manifestparser import ManifestParser
 from .action.commands import Commands
 from ._version import __version__
 
+logger = logging.getLogger(__name__)
 
-def hdlmake(args):
+
+def hdlmake(args, context=None):
     """This is the main function, where HDLMake starts.
     Here, we make the next processes:
         -- parse command
         -- check and set the environment
         -- prepare the global module containing the heavy common stuff
+    The run uses the given context (see util.context.Context), by default
+    the one of the current directory.
     """
 
     # Command 'makefile' is impled by '-f'.
@@ -51,28 +57,33 @@ def hdlmake(args):
     parser = _get_parser()
     options = parser.parse_args(args)
 
-    try:
-        set_logging_level(options)
+    if context is None:
+        context = Context()
+    with context.activate():
+        try:
+            set_logging_level(options, context)
 
-        # Create a ModulePool object, this will become our workspace
-        action = Commands(options)
+            # Create a ModulePool object, this will become our workspace
+            action = Commands(options, context)
 
-        # Load all manifests, starting from the top-one (the one in the
-        # current directory)
-        action.load_all_manifests()
+            # Load all manifests, starting from the top-one (the one in the
+            # root directory)
+            action.load_all_manifests()
 
-        # Extract tool and top entity.
-        action.setup()
+            # Extract tool and top entity.
+            action.setup()
 
-        # Execute the appropriated action for the freshly created modules pool
-        _action_runner(action)
-    except Exception as e:
-        import traceback
-        logging.error(e)
-        if options.full_error:
-            logging.error("Trace:")
-            traceback.print_exc()
-        quit(2)
+            # Execute the appropriated action for the freshly created
+            # modules pool
+            _action_runner(action)
+            path_mod.report_fs_cache()
+        except Exception as e:
+            import traceback
+            logger.error(e)
+            if options.full_error:
+                logger.error("Trace:")
+                traceback.print_exc()
+            sys.exit(2)
 
 
 def _action_runner(action):
@@ -84,12 +95,22 @@ def _action_runner(action):
         action.makefile()
     elif options.command == "fetch":
         action.fetch()
+    elif options.command == "update":
+        action.update()
+    elif options.command == "lock":
+        action.lock()
+    elif options.command == "verify":
+        action.verify()
     elif options.command == "clean":
         action.clean()
     elif options.command == "list-mods":
         action.list_modules()
     elif options.command == "list-files":
         action.list_files()
+    elif options.command == "impact":
+        action.impact()
+    elif options.command == "select-tests":
+        action.select_tests()
     elif options.command == "tree":
         action.generate_tree()
     else:
@@ -132,6 +153,18 @@ def _get_parser():
         "fetch",
         help="fetch and/or update all of the remote modules")
 
+    subparsers.add_parser(
+        "update",
+        help="update the fetched modules in place and fetch the new ones")
+
+    subparsers.add_parser(
+        "lock",
+        help="record the revisions of the fetched modules in the lock file")
+
+    subparsers.add_parser(
+        "verify",
+        help="check that the fetched modules match the lock file")
+
     subparsers.add_parser(
         "clean",
         help="clean all of the already fetched remote modules")
@@ -158,6 +191,58 @@ def _get_parser():
     listfiles.add_argument(
         "--top", dest="top", default=None,
         help="print only those files required to build 'top'")
+    listfiles.add_argument(
+        "--waves", dest="waves", default=False, action="store_true",
+        help="print the files grouped in parallel compilation waves")
+
+    impact = subparsers.add_parser(
+        "impact",
+        help="list the files to be recompiled when the given files change")
+    impact.add_argument(
+        "files", nargs="*", default=[],
+        help="changed files (relative to the current directory)")
+    impact.add_argument(
+        "--from-file", dest="from_file", default=None,
+        help="read the changed files from a list file ('-' for stdin)")
+    impact.add_argument(
+        "--git-diff", dest="git_diff", default=None,
+        help="add the files changed with respect to a git revision")
+    impact.add_argument(
+        "--units", default=False, action="store_true", dest="units",
+        help="print the affected design units instead of the files")
+    impact.add_argument(
+        "--delimiter", dest="delimiter", default=None,
+        help="set delimitier for the list of files")
+    impact.add_argument(
+        "--top", dest="top", default=None,
+        help="consider only those files required to build 'top'")
+
+    select_tests = subparsers.add_parser(
+        "select-tests",
+        help="list the testbench tops depending on the given changed files")
+    select_tests.add_argument(
+        "files", nargs="*", default=[],
+        help="changed files (relative to the current directory)")
+    select_tests.add_argument(
+        "--from-file", dest="from_file", default=None,
+        help="read the changed files from a list file ('-' for stdin)")
+    select_tests.add_argument(
+        "--git-diff", dest="git_diff", default=None,
+        help="add the files changed with respect to a git revision")
+    select_tests.add_argument(
+        "-t", "--test", dest="tests", default=[], action="append",
+        help="testbench top to be considered, can be repeated "
+             "(default: sim_tops from the top manifest)")
+    select_tests.add_argument(
+        "--format", dest="format", default="list",
+        choices=["list", "json", "make"],
+        help="output format for the selected testbench tops")
+    select_tests.add_argument(
+        "--make-var", dest="make_var", default="TESTS",
+        help="name of the variable written with --format make")
+    select_tests.add_argument(
+        "--delimiter", dest="delimiter", default=None,
+        help="set delimitier for the list of testbench tops")
 
     tree = subparsers.add_parser(
         "tree",
@@ -193,18 +278,77 @@ def _get_parser():
     parser.add_argument(
         "-s", "--suffix", dest="suffix_code", default="",
         help="Python code executed after every Manifest.py")
+    parser.add_argument(
+        "-j", "--jobs", default=1, type=int, dest="jobs",
+        help="number of parallel jobs (e.g. fetched modules)")
+    parser.add_argument(
+        "--parallel-manifests", default=False, action="store_true",
+        dest="parallel_manifests",
+        help="evaluate the manifests of sibling modules with --jobs "
+             "threads, without changing the current directory")
+    parser.add_argument(
+        "--manifest-cache", default=False, action="store_true",
+        dest="manifest_cache",
+        help="reuse the results of the previous manifest evaluations")
+    parser.add_argument(
+        "--pipeline", default=False, action="store_true", dest="pipeline",
+        help="parse the HDL files (with --jobs threads) while the manifests "
+             "are being loaded")
+    parser.add_argument(
+        "--cache-dir", default=None, dest="cache_dir",
+        help="directory for the hdlmake caches (default: $HDLMAKE_CACHE_DIR "
+             "or ~/.cache/hdlmake)")
+    parser.add_argument(
+        "--git-mirrors", default=False, action="store_true",
+        dest="git_mirrors",
+        help="clone the git modules from a cache of mirrors shared by all "
+             "the workspaces (in the cache directory)")
+    parser.add_argument(
+        "--mirror-max-size", default=None, type=int, dest="mirror_max_size",
+        help="maximum size of the mirror cache in MB, the least recently "
+             "used mirrors are evicted")
+    parser.add_argument(
+        "--offline", default=False, action="store_true", dest="offline",
+        help="fetch the git modules only from the mirror cache, without "
+             "network access")
+    parser.add_argument(
+        "--store", default=False, action="store_true", dest="store",
+        help="link the modules pinned to an immutable revision from a store "
+             "shared by all the workspaces (in the cache directory)")
+    parser.add_argument(
+        "--store-link", default="hardlink", dest="store_link",
+        choices=["hardlink", "symlink"],
+        help="how the workspaces reference the store trees "
+             "(default: hardlink)")
+    parser.add_argument(
+        "--store-max-size", default=None, type=int, dest="store_max_size",
+        help="maximum size of the module store in MB, the least recently "
+             "used entries are evicted")
+    parser.add_argument(
+        "--lock-file", default="hdlmake.lock", dest="lock_file",
+        help="lock file with the revisions of the remote modules, relative "
+             "to the top manifest directory (default: hdlmake.lock)")
+    parser.add_argument(
+        "--compact-graph", default=False, action="store_true",
+        dest="compact_graph",
+        help="keep the solved dependencies in a compact array based graph")
     parser.add_argument(
         "--full-error", default=False, action="store_true", dest="full_error",
         help="display full error log with traceback")
     return parser
 
 
-def set_logging_level(options):
-    """Set the log level and config (A.K.A. log verbosity)"""
+def set_logging_level(options, context=None):
+    """Set the log level and config (A.K.A. log verbosity).  If the
+    context has its own logger, only its level is set"""
     numeric_level = getattr(logging, options.log.upper(), None)
     if not isinstance(numeric_level, int):
         raise Exception('Invalid log level: %s' % options.log)
 
+    if context is not None and context.logger is not None:
+        context.logger.setLevel(numeric_level)
+        return
+
     if not shell.check_windows_tools() and options.logfile == None:
         logging.basicConfig(
             format=colored(
@@ -220,7 +364,7 @@ def set_logging_level(options):
                    "%(message)s",
             level=numeric_level,
             filename=options.logfile)
-    logging.debug(str(options))
+    logger.debug(str(options))
 
 
 def main():
@@ -23,6 +23,7 @@
 
 from __future__ import print_function
 from __future__ import absolute_import
+import ast
 import logging
 import os
 import sys
@@ -32,6 +33,15 @@ else:
     from StringIO import StringIO
 import contextlib
 
+import six
+from six.moves import builtins
+
+from .manifestcache import track_reads, tracked_builtins
+from ..util import path as path_mod
+from ..util import context as context_mod
+
+logger = logging.getLogger(__name__)
+
 
 @contextlib.contextmanager
 def capture_stdout():
@@ -43,6 +53,103 @@ def capture_stdout():
     sys.stdout = old
 
 
+class InheritedContext(dict):
+
+    """Read-only, copy-free view of the variables a manifest inherits from
+    the top manifest, used as the builtins of the manifest evaluation.
+    The Python builtins are stored in the dictionary, except those hidden by
+    an inherited variable; any other name is looked up in the top manifest
+    variables, unless it is one of the purged keys"""
+
+    _supported = []
+
+    def __init__(self, parent, purge_keys):
+        dict.__init__(self, [(k, v) for k, v in vars(builtins).items()
+                             if k not in parent or k in purge_keys])
+        self.parent = parent
+        self.purge_keys = frozenset(purge_keys)
+
+    def __missing__(self, key):
+        if key in self.purge_keys:
+            raise KeyError(key)
+        return self.parent[key]
+
+    def copy(self):
+        """Get a copy of the context (e.g. to override some builtins)"""
+        context = InheritedContext(self.parent, self.purge_keys)
+        context.update(self)
+        return context
+
+    def visible_items(self):
+        """Get the inherited (not purged) variables"""
+        return [(k, v) for k, v in self.parent.items()
+                if k not in self.purge_keys]
+
+    @classmethod
+    def get(cls, parent, purge_keys):
+        """Get the context for the given parent variables, the context is
+        shared by the consecutive evaluations of the run with the same
+        parent"""
+        run_context = context_mod.current()
+        last = run_context.inherited_context
+        if last is None or last[0] is not parent or last[1] != purge_keys:
+            last = (parent, purge_keys, cls(parent, purge_keys))
+            run_context.inherited_context = last
+        return last[2]
+
+    @classmethod
+    def is_supported(cls):
+        """Check if the Python interpreter looks up the builtins through
+        the mapping interface, otherwise the context must be copied"""
+        if not cls._supported:
+            try:
+                context = cls({'_hdlmake_probe': True}, [])
+                supported = eval('_hdlmake_probe',
+                                 {'__builtins__': context}) is True
+            except Exception:
+                supported = False
+            cls._supported.append(supported)
+        return cls._supported[0]
+
+
+def manifest_helpers(manifest_dir, stdout=None):
+    """Get the helpers injected in the manifest context: the manifest
+    directory, a function to get the absolute path of a file given
+    relative to it and a function to expand glob patterns.  If an output buffer is given, also provide the 'open'
+    and 'print' functions that do not depend on the current directory and
+    on sys.stdout, so the manifest can be evaluated concurrently"""
+
+    def manifest_path(path):
+        """Get the absolute path of a path relative to the manifest"""
+        return os.path.normpath(os.path.join(manifest_dir, path))
+
+    def manifest_glob(pattern):
+        """Get the sorted paths, relative to the manifest, of the files
+        matching the pattern (see path_mod.glob_files)"""
+        return [os.path.relpath(path, manifest_dir)
+                for path in path_mod.glob_files(pattern, manifest_dir)]
+
+    helpers = {'manifest_dir': manifest_dir, 'manifest_path': manifest_path,
+               'manifest_glob': manifest_glob}
+    if stdout is not None:
+        builtin_open = open
+
+        def manifest_open(path, *args, **kwargs):
+            """Open a file, relative paths are taken from the manifest"""
+            if isinstance(path, six.string_types):
+                path = manifest_path(path)
+            return builtin_open(path, *args, **kwargs)
+
+        def manifest_print(*args, **kwargs):
+            """Print to the output buffer of the manifest"""
+            kwargs.setdefault('file', stdout)
+            print(*args, **kwargs)
+
+        helpers['open'] = manifest_open
+        helpers['print'] = manifest_print
+    return helpers
+
+
 class ConfigParser(object):
 
     """Class for parsing python configuration files
@@ -144,6 +251,10 @@ types:[<type 'int'>]
     >>> os.remove("test.py")
     """
 
+    # These HDLMake keys must not be inherited from parent module
+    KEY_PURGE_LIST = ("modules", "files", "include_dirs", "inc_makefiles",
+                      "library")
+
     class Option(object):
 
         """This subclass provides instances acting as a convenient storage
@@ -189,6 +300,10 @@ types:[<type 'int'>]
         self.prefix_code = ""
         self.suffix_code = ""
         self.config_file = None
+        self.manifest_cache = None
+        self.isolated = False
+        self.executed = False
+        self.printed = ""
 
     def __getitem__(self, name):
         if name in self.__names():
@@ -241,36 +356,109 @@ types:[<type 'int'>]
         empty object in the parser's option instance list"""
         return [o.name for o in self.options if o is not None]
 
-    def __parser_runner(self, content, extra_context):
-        """method that acts as an 'exec' wraper to run the Python code.  Return the locals"""
+    def report_printed(self):
+        """Show the output printed by the manifest (only once)"""
+        printed, self.printed = self.printed, ""
+        if len(printed) > 0:
+            logger.info(
+                "The manifest inside {} tried to print something:".format(
+                    self.config_file))
+            for line in printed.split('\n'):
+                print("> " + line)
+
+    def __literal_runner(self, content):
+        """Get the variables assigned by the Python code if it only has
+        assignments of literal values (and docstrings), which can be
+        evaluated without running the code.  Return None otherwise"""
+        try:
+            tree = ast.parse(content, self.config_file)
+        except SyntaxError:
+            return None
         options = {}
+        for node in tree.body:
+            if isinstance(node, ast.Assign):
+                if not all([isinstance(target, ast.Name)
+                            for target in node.targets]):
+                    return None
+            elif not isinstance(node, ast.Expr):
+                return None
+            try:
+                value = ast.literal_eval(node.value)
+            except (ValueError, TypeError, SyntaxError):
+                return None
+            if isinstance(node, ast.Assign):
+                for target in node.targets:
+                    options[target.id] = value
+        logger.debug("Literal manifest %s evaluated without running it",
+                     self.config_file)
+        return options
+
+    def __cached_parser_runner(self, content, extra_context):
+        """Run the Python code unless the manifest cache holds the result
+        of an identical evaluation.  Return the locals and the output"""
+        cache = self.manifest_cache
+        key_context = dict(extra_context)
+        inherited = key_context.pop("__builtins__", None)
+        if isinstance(inherited, InheritedContext):
+            key_context.update(inherited.visible_items())
+        key = cache.make_key(self.config_file, content, key_context)
+        cached = cache.load(key)
+        if cached is not None:
+            logger.debug("Manifest %s taken from the cache", self.config_file)
+            return cached
+        code = cache.get_code(key)
+        if code is None:
+            code = self.__compile(content)
+        with track_reads() as tracker:
+            if tracker is not None:
+                extra_context["__builtins__"] = tracked_builtins(
+                    extra_context.get("__builtins__"))
+            options, printed = self.__parser_runner(content, extra_context,
+                                                    code)
+        cache.store(key, code, options, printed, tracker)
+        return options, printed
+
+    def __compile(self, content):
+        """Compile the Python code of the manifest"""
         try:
-            with capture_stdout() as stdout_aux:
-                root_path = os.getcwd()
-                exec_path = os.path.dirname(self.config_file)
-                os.chdir(exec_path)
-                exec(content, extra_context, options)
-                os.chdir(root_path)
-            printed = stdout_aux.getvalue()
-            if len(printed) > 0:
-                logging.info(
-                    "The manifest inside {} tried to print something:".format(
-                        self.config_file))
-                for line in printed.split('\n'):
-                    print("> " + line)
+            return compile(content, self.config_file, "exec")
         except SyntaxError as error_syntax:
             raise Exception("Invalid syntax in the manifest file {}:\n {}{}".format(
                             self.config_file, str(error_syntax), content))
+
+    def __parser_runner(self, content, extra_context, code=None):
+        """method that acts as an 'exec' wraper to run the Python code.
+        Return the locals and the output printed by the code"""
+        options = {}
+        if code is None:
+            code = self.__compile(content)
+        exec_path = os.path.abspath(os.path.dirname(self.config_file))
+        self.executed = True
+        try:
+            if self.isolated:
+                # No process state is changed: the manifest gets its own
+                # 'open' and 'print' functions.
+                stdout_aux = StringIO()
+                extra_context.update(manifest_helpers(exec_path, stdout_aux))
+                exec(code, extra_context, options)
+            else:
+                extra_context.update(manifest_helpers(exec_path))
+                with capture_stdout() as stdout_aux:
+                    root_path = os.getcwd()
+                    os.chdir(exec_path)
+                    exec(code, extra_context, options)
+                    os.chdir(root_path)
+            printed = stdout_aux.getvalue()
         except SystemExit as error_exit:
             raise Exception("Exit requested by the manifest file {}:\n{}{}".format(
                             self.config_file, str(error_exit), content))
         except:
-            logging.error("Encountered unexpected error while parsing {}".format(
-                          self.config_file))
-            logging.error(content)
+            logger.error("Encountered unexpected error while parsing {}".format(
+                         self.config_file))
+            logger.error(content)
             print(str(sys.exc_info()[0]) + ':' + str(sys.exc_info()[1]))
             raise
-        return options
+        return options, printed
 
     def __read_config_content(self):
         """Load the Manifest.py file content in a local variable and return
@@ -278,25 +466,43 @@ types:[<type 'int'>]
         assert self.config_file is not None
         return open(self.config_file, "r").read()
 
-    def parse(self, config_file, extra_context=None):
+    def parse(self, config_file, extra_context=None, inherited_context=None):
         """Parse the stored manifest plus arbitrary code.  Return a dictionnary
-        of variables defined in the manifest."""
+        of variables defined in the manifest.  The variables from the
+        inherited_context (a parent manifest) are visible from the manifest,
+        without being copied if the interpreter allows it."""
         assert isinstance(extra_context, dict) or extra_context is None
 
         self.config_file = config_file
 
         # These HDLMake keys must not be inherited from parent module
-        key_purge_list = ["modules", "files", "include_dirs",
-                          "inc_makefiles", "library"]
-        for key_to_be_deleted in key_purge_list:
+        for key_to_be_deleted in self.KEY_PURGE_LIST:
             extra_context.pop(key_to_be_deleted, None)
+        if inherited_context is not None:
+            context = InheritedContext.get(inherited_context,
+                                           self.KEY_PURGE_LIST)
+            if InheritedContext.is_supported():
+                extra_context["__builtins__"] = context
+            else:
+                for key, value in context.visible_items():
+                    extra_context.setdefault(key, value)
         # Load the Manifest.py file content in a local variable
         content = self.__read_config_content()
         # Now, grab the options coming from Manifest.py plus arbitrary_code:
         # - extra_context as global variables.
         # - options as local variables.
         content = self.prefix_code + '\n' + content + '\n' + self.suffix_code
-        options = self.__parser_runner(content, extra_context)
+        options = self.__literal_runner(content)
+        if options is not None:
+            printed = ""
+        elif self.manifest_cache is None:
+            options, printed = self.__parser_runner(content, extra_context)
+        else:
+            options, printed = self.__cached_parser_runner(content,
+                                                           extra_context)
+        self.printed = printed
+        if not self.isolated:
+            self.report_printed()
         # Check the options that were defined in the local context
         ret = {}
         for opt_name, val in list(options.items()):
@@ -311,7 +517,7 @@ types:[<type 'int'>]
             # children modules' Manifest
             if opt_name not in self.__names():
                 ret[opt_name] = val
-                logging.debug("New variable found: %s (=%s).", opt_name, val)
+                logger.debug("New variable found: %s (=%s).", opt_name, val)
                 continue
             # If we are here, is because this is a meaningful option,
             # e.g. syn_top, modules, files... grab the option instance!
@@ -321,8 +527,9 @@ types:[<type 'int'>]
                     "Given option '%s' is of type %s: '%s', it doesn't match allowed types: (%s), file %s" %
                     (opt_name, str(type(val)), val, str(opt.types), self.config_file))
             ret[opt_name] = val
-            # This is only for the options of the dictionary class:
-            if isinstance(val, dict):
+            # This is only for the options of the dictionary class
+            # restricting the allowed keys:
+            if isinstance(val, dict) and self[opt_name].keys:
                 for key in val:
                     if key not in self[opt_name].keys:
                         raise RuntimeError(
@@ -0,0 +1,434 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Hdlmake.
+#
+# Hdlmake is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Hdlmake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Hdlmake.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Module providing a persistent cache for the Manifest.py evaluations"""
+
+from __future__ import absolute_import
+import contextlib
+import hashlib
+import importlib
+import io
+import logging
+import marshal
+import os
+import pickle
+import stat
+import sys
+import threading
+import types
+
+import six
+from six.moves import builtins, collections_abc, copyreg
+
+logger = logging.getLogger(__name__)
+
+
+# Audit events raised by the operations a cached evaluation would skip.
+_SIDE_EFFECT_EVENTS = (
+    "os.system", "subprocess.Popen", "os.posix_spawn", "os.spawn",
+    "os.exec", "os.fork", "os.remove", "os.rename", "os.mkdir", "os.rmdir",
+    "os.chmod", "os.symlink", "os.link", "os.truncate", "os.putenv",
+    "os.unsetenv", "shutil.copyfile", "shutil.rmtree", "shutil.move",
+    "socket.connect", "urllib.Request")
+
+_WRITE_FLAGS = (os.O_WRONLY | os.O_RDWR | os.O_APPEND | os.O_CREAT
+                | os.O_TRUNC)
+
+# The functions checking paths have no audit event: the manifests get
+# tracked versions of them (see tracked_builtins).
+_PATH_FUNCTIONS = ("exists", "lexists", "isfile", "isdir", "islink",
+                   "getmtime", "getsize", "getatime", "getctime")
+_OS_PATH_FUNCTIONS = ("stat", "lstat", "access")
+
+_local = threading.local()
+_hook_installed = []
+
+
+class _Uncacheable(Exception):
+    """Raised when a value cannot be part of a cache key"""
+
+
+def _stable_repr(value):
+    """Get a representation of the value that is stable between runs"""
+    if value is None or isinstance(
+            value, six.string_types + (bytes, bool, int, float)):
+        return repr(value)
+    if isinstance(value, (list, tuple)):
+        return "[{}]".format(", ".join([_stable_repr(v) for v in value]))
+    if isinstance(value, (set, frozenset)):
+        return "{{{}}}".format(
+            ", ".join(sorted([_stable_repr(v) for v in value])))
+    if isinstance(value, dict):
+        return "{{{}}}".format(", ".join(sorted(
+            ["{}: {}".format(_stable_repr(k), _stable_repr(v))
+             for k, v in value.items()])))
+    if isinstance(value, types.ModuleType):
+        return "<module {}>".format(value.__name__)
+    raise _Uncacheable(type(value))
+
+
+def _reduce_module(module):
+    """Pickle the modules imported by a manifest by name"""
+    return (importlib.import_module, (module.__name__,))
+
+
+def _dumps(value):
+    """Pickle a manifest evaluation result"""
+    buf = io.BytesIO()
+    pickler = pickle.Pickler(buf, pickle.HIGHEST_PROTOCOL)
+    pickler.dispatch_table = copyreg.dispatch_table.copy()
+    pickler.dispatch_table[types.ModuleType] = _reduce_module
+    pickler.dump(value)
+    return buf.getvalue()
+
+
+def _fingerprint(path, kind):
+    """Get the fingerprint of a file (its content digest), of a
+    directory (its listing), of a stat call (the file type, size and
+    modification time), of an environment variable (its value) or of the
+    whole environment.  None if it does not exist"""
+    if kind == "env":
+        return os.environ.get(path)
+    if kind == "environ":
+        return hashlib.sha1(
+            _stable_repr(dict(os.environ)).encode()).hexdigest()
+    try:
+        if kind == "stat":
+            stat_result = os.stat(path)
+            return "{}:{}:{}".format(stat.S_IFMT(stat_result.st_mode),
+                                     stat_result.st_size,
+                                     stat_result.st_mtime)
+        if kind == "dir":
+            return hashlib.sha1(
+                "\n".join(sorted(os.listdir(path))).encode()).hexdigest()
+        with open(path, "rb") as read_file:
+            return hashlib.sha1(read_file.read()).hexdigest()
+    except (IOError, OSError):
+        return None
+
+
+class _ReadTracker(object):
+    """Collect the files and directories read (or checked) by a manifest
+    evaluation"""
+
+    def __init__(self):
+        self.reads = set()
+        self.side_effects = []
+
+    def add_read(self, path, kind):
+        """Record a read path, relative paths are taken from the current
+        directory (the manifest directory during the evaluation)"""
+        if hasattr(path, "__fspath__"):
+            path = path.__fspath__()
+        if isinstance(path, bytes):
+            path = path.decode(sys.getfilesystemencoding())
+        if not isinstance(path, six.string_types):
+            return
+        self.reads.add((os.path.abspath(path or "."), kind))
+
+    def add_env(self, name=None):
+        """Record a read environment variable, None for all of them"""
+        if name is None:
+            self.reads.add(("*", "environ"))
+        elif isinstance(name, six.string_types):
+            self.reads.add((name, "env"))
+
+
+def _audit_hook(event, args):
+    """Audit hook recording the read operations of the tracked thread"""
+    tracker = getattr(_local, "tracker", None)
+    if tracker is None:
+        return
+    if event == "open":
+        path, mode, flags = args
+        if mode is None:
+            writes = flags & _WRITE_FLAGS
+        else:
+            writes = any([c in mode for c in "wax+"])
+        if writes:
+            tracker.side_effects.append(event)
+        else:
+            tracker.add_read(path, "file")
+    elif event in ("os.listdir", "os.scandir", "hdlmake.scan_dir"):
+        tracker.add_read(args[0], "dir")
+    elif event.startswith(_SIDE_EFFECT_EVENTS):
+        tracker.side_effects.append(event)
+
+
+def _get_function(module_name, name):
+    """Get a function of a module, to unpickle the tracked functions"""
+    return getattr(importlib.import_module(module_name), name)
+
+
+class _TrackedPathFunction(object):
+
+    """Function checking a path, recording it in the evaluation tracked in
+    the current thread, if any.  It is pickled as the function itself"""
+
+    def __init__(self, module, name):
+        self.module_name = module.__name__
+        self.name = name
+        self.function = getattr(module, name)
+
+    def __call__(self, path, *args, **kwargs):
+        tracker = getattr(_local, "tracker", None)
+        if tracker is not None:
+            tracker.add_read(path, "stat")
+        return self.function(path, *args, **kwargs)
+
+    def __reduce__(self):
+        return (_get_function, (self.module_name, self.name))
+
+
+class _TrackedEnviron(collections_abc.MutableMapping):
+
+    """os.environ recording the variables read by the tracked evaluation"""
+
+    def _add_env(self, name=None):
+        tracker = getattr(_local, "tracker", None)
+        if tracker is not None:
+            tracker.add_env(name)
+
+    def __getitem__(self, name):
+        self._add_env(name)
+        return os.environ[name]
+
+    def __setitem__(self, name, value):
+        os.environ[name] = value
+
+    def __delitem__(self, name):
+        del os.environ[name]
+
+    def __iter__(self):
+        self._add_env()
+        return iter(os.environ)
+
+    def __len__(self):
+        self._add_env()
+        return len(os.environ)
+
+    def copy(self):
+        """Get a copy of the environment, as a dict"""
+        return dict(self)
+
+
+def _tracked_getenv(name, default=None):
+    """os.getenv recording the variable read by the tracked evaluation"""
+    return _TRACKED_ENVIRON.get(name, default)
+
+
+class _TrackedModule(types.ModuleType):
+
+    """View of a module given to the manifests, with some functions
+    replaced by tracked ones.  It is pickled as the module itself"""
+
+    def __init__(self, module, overrides):
+        types.ModuleType.__init__(self, module.__name__, module.__doc__)
+        self.__dict__.update(overrides)
+        self.__dict__["_module"] = module
+
+    def __getattr__(self, name):
+        return getattr(self._module, name)
+
+    def __reduce__(self):
+        return (importlib.import_module, (self.__name__,))
+
+
+_TRACKED_ENVIRON = _TrackedEnviron()
+_TRACKED_PATH = _TrackedModule(os.path, dict(
+    [(name, _TrackedPathFunction(os.path, name))
+     for name in _PATH_FUNCTIONS]))
+_TRACKED_OS = _TrackedModule(os, dict(
+    [(name, _TrackedPathFunction(os, name))
+     for name in _OS_PATH_FUNCTIONS],
+    path=_TRACKED_PATH, environ=_TRACKED_ENVIRON, getenv=_tracked_getenv))
+
+
+def _tracked_import(name, globals=None, locals=None, fromlist=(), level=0):
+    """__import__ of the tracked manifests: os and os.path are replaced by
+    their tracked views"""
+    module = builtins.__import__(name, globals, locals, fromlist, level)
+    if level == 0 and name in ("os", "os.path"):
+        if not fromlist:
+            return _TRACKED_OS
+        return _TRACKED_OS if name == "os" else _TRACKED_PATH
+    return module
+
+
+def tracked_builtins(manifest_builtins):
+    """Get a copy of the builtins mapping of a manifest (None for the
+    Python builtins) whose __import__ gives the tracked os module, so the
+    environment variables and the paths checked by the manifest are
+    recorded.  Only the evaluation using it is affected"""
+    if manifest_builtins is None:
+        tracked = dict(vars(builtins))
+    else:
+        tracked = manifest_builtins.copy()
+    tracked["__import__"] = _tracked_import
+    return tracked
+
+
+@contextlib.contextmanager
+def track_reads():
+    """Track the reads done in the current thread by the code executed
+    in the with block.  Yield None if it cannot be tracked.
+
+    The audit hook is installed for the whole process at the first call,
+    as it cannot be removed, but it ignores the threads not tracked"""
+    if not hasattr(sys, "addaudithook"):
+        yield None
+        return
+    if not _hook_installed:
+        sys.addaudithook(_audit_hook)
+        _hook_installed.append(True)
+    tracker = _ReadTracker()
+    _local.tracker = tracker
+    try:
+        yield tracker
+    finally:
+        _local.tracker = None
+
+
+class ManifestCache(object):
+
+    """Persistent cache of the manifest evaluations.
+
+    An entry is kept for every manifest path.  It holds the compiled code
+    object of the manifest (plus prefix and suffix code) and, if the
+    evaluation had no side effects and its result can be pickled, the
+    resulting variables and printed output.  The result is reused if the
+    code, the inherited context and what the manifest read (files,
+    directories, checked paths and environment variables) are unchanged."""
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        self.code_hits = 0
+        self._codes = {}
+
+    def make_key(self, config_file, content, extra_context):
+        """Get the key for an evaluation: the digests of the manifest
+        path, of the code and of the inherited context (None if the
+        context cannot be represented)"""
+        path_digest = hashlib.sha1(
+            os.path.abspath(config_file).encode()).hexdigest()
+        code_digest = hashlib.sha1(
+            (sys.version + content).encode()).hexdigest()
+        try:
+            context = dict([(k, v) for k, v in extra_context.items()
+                            if k != "__builtins__"])
+            context_digest = hashlib.sha1(
+                _stable_repr(context).encode()).hexdigest()
+        except _Uncacheable as uncacheable:
+            logger.debug("Manifest context cannot be cached: %s",
+                         uncacheable)
+            context_digest = None
+        return (path_digest, code_digest, context_digest)
+
+    def _entry_path(self, key):
+        """Get the path of the cache file for the key"""
+        return os.path.join(self.cache_dir, key[0] + ".pickle")
+
+    def _read_entry(self, key):
+        """Read the cache entry for the key, None if there is none"""
+        try:
+            with open(self._entry_path(key), "rb") as entry_file:
+                return pickle.load(entry_file)
+        except Exception:
+            return None
+
+    def load(self, key):
+        """Get the (variables, printed output) of a previous evaluation
+        with the same key, None if it must be evaluated again"""
+        entry = self._read_entry(key)
+        if (entry is None or entry["options"] is None
+                or key[2] is None
+                or entry["code_digest"] != key[1]
+                or entry["context_digest"] != key[2]):
+            self.misses += 1
+            return None
+        for path, kind, fingerprint in entry["reads"]:
+            if _fingerprint(path, kind) != fingerprint:
+                logger.debug("Manifest cache: %s changed", path)
+                self.misses += 1
+                return None
+        try:
+            options = pickle.loads(entry["options"])
+        except Exception:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return (options, entry["printed"])
+
+    def get_code(self, key):
+        """Get the compiled code object for the key, None if it has not
+        been compiled before"""
+        code = self._codes.get(key[1])
+        if code is not None:
+            self.code_hits += 1
+            return code
+        entry = self._read_entry(key)
+        if entry is not None and entry["code_digest"] == key[1]:
+            try:
+                code = marshal.loads(entry["code"])
+            except Exception:
+                return None
+            self._codes[key[1]] = code
+            self.code_hits += 1
+        return code
+
+    def store(self, key, code, options, printed, tracker):
+        """Store the result of an evaluation.  Only the code is kept if
+        the reads could not be tracked or the manifest had side effects"""
+        self._codes[key[1]] = code
+        entry = {"code_digest": key[1],
+                 "code": marshal.dumps(code),
+                 "context_digest": key[2],
+                 "reads": [],
+                 "options": None,
+                 "printed": printed}
+        if tracker is None or key[2] is None:
+            pass
+        elif len(tracker.side_effects) > 0:
+            logger.debug("Manifest with side effects (%s), not cached",
+                         ", ".join(sorted(set(tracker.side_effects))))
+        else:
+            try:
+                entry["options"] = _dumps(options)
+            except Exception as pickle_error:
+                logger.debug("Manifest variables cannot be cached: %s",
+                             pickle_error)
+            entry["reads"] = [(path, kind, _fingerprint(path, kind))
+                              for path, kind in sorted(tracker.reads)]
+        try:
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            entry_path = self._entry_path(key)
+            tmp_path = "{}.{}.tmp".format(entry_path, os.getpid())
+            with open(tmp_path, "wb") as entry_file:
+                pickle.dump(entry, entry_file, pickle.HIGHEST_PROTOCOL)
+            getattr(os, "replace", os.rename)(tmp_path, entry_path)
+        except (IOError, OSError) as store_error:
+            logger.debug("Cannot write the manifest cache: %s", store_error)
+
+    def report(self):
+        """Log the cache statistics"""
+        logger.info("Manifest cache: %d hits, %d misses "
+                    "(%d compiled code reused).",
+                    self.hits, self.misses, self.code_hits)
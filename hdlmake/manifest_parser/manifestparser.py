@@ -76,6 +76,22 @@ class ManifestParser(ConfigParser):
              'type': {}}]
         self.add_option_list(general_options)
         self.add_delimiter()
+        dep_options = [
+            {'name': 'dep_resolution',
+             'default': 'all',
+             'help': "Files added when a unit is provided by many files "
+             "(all/single)",
+             'type': ''},
+            {'name': 'dep_library_order',
+             'default': [],
+             'help': "Library search order to choose a single provider",
+             'type': []},
+            {'name': 'dep_providers',
+             'default': {},
+             'help': "File chosen to provide a unit (unit: path)",
+             'type': {}}]
+        self.add_option_list(dep_options)
+        self.add_delimiter()
         self.add_type('include_dirs', type_new="")
         self.add_type('incl_makefiles', type_new='')
         self.add_type('files', type_new=[])
@@ -83,6 +99,7 @@ class ManifestParser(ConfigParser):
         self.add_allowed_key('modules', key="git")
         self.add_allowed_key('modules', key="gitsm")
         self.add_allowed_key('modules', key="local")
+        self.add_allowed_key('modules', key="archive")
         fetch_options = [
             {'name': 'fetchto',
              'default': None,
@@ -205,6 +222,10 @@ class ManifestParser(ConfigParser):
              'default': None,
              'help': "Top level module for simulation",
              'type': ''},
+            {'name': 'sim_tops',
+             'default': None,
+             'help': "Testbench tops considered by select-tests",
+             'type': []},
             {'name': 'sim_tool',
              'default': None,
              'help': "Simulation tool to be used (e.g. isim, vsim, iverilog)",
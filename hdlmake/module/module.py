@@ -38,6 +38,8 @@ from ..fetch import git
 from ..manifest_parser.manifestparser import ManifestParser
 import six
 
+logger = logging.getLogger(__name__)
+
 
 class ModuleArgs(object):
     """This class is just a container for the main Module args"""
@@ -73,10 +75,12 @@ class Module(object):
         # Manifest Files Properties
         self.files = None
         # Manifest Modules Properties
-        self.modules = {'local': [], 'git': [], 'gitsm': [], 'svn': []}
+        self.modules = {'local': [], 'git': [], 'gitsm': [], 'svn': [],
+                        'archive': []}
         self.incl_makefiles = []                # List of paths of makefile files to include.
         self.library = "work"
         self.action = None
+        self.context = action.context
         self.top_manifest = action.get_top_manifest()
         self.manifest_dict = {}
         self.source = module_args.source        # The fetcher (module, git, ...)
@@ -84,8 +88,11 @@ class Module(object):
         self.url = None
         self.branch = None
         self.revision = None
-        self.path = None                        # Relative path to the module.
+        self.sparse = None                      # Directories to check out, None for all.
+        self.path = None                        # Path to the module, relative to the root dir.
         self.isfetched = False                  # True if the module exists on the file system.
+        self.evaluation = None                  # Evaluated, not processed manifest.
+        self.isparsed = False                   # True once the manifest is processed.
         self.init_config(module_args)
         self.action = action
         self.module_args = module_args
@@ -102,7 +109,7 @@ class Module(object):
         if self.source == 'local':
             self.url, self.branch, self.revision = url, None, None
 
-            if not os.path.exists(url):
+            if not path_mod.path_exists(url):
                 raise Exception(
                     "Path to the local module doesn't exist:\n" + url
                     + "\nThis module was instantiated in: " + str(self.parent))
@@ -110,28 +117,38 @@ class Module(object):
             self.isfetched = True
         else:
             # Split URL (extract basename, revision, branch...)
+            url_clean, self.sparse = path_mod.sparse_parse(url)
             if self.source == 'svn':
-                self.url, self.revision = path_mod.svn_parse(url)
+                self.url, self.revision = path_mod.svn_parse(url_clean)
                 basename = path_mod.svn_basename(self.url)
+            elif self.source == 'archive':
+                self.url, self.branch, self.revision = path_mod.url_parse(
+                    url_clean)
+                basename = path_mod.archive_basename(self.url)
             else:
-                self.url, self.branch, self.revision = path_mod.url_parse(url)
+                self.url, self.branch, self.revision = path_mod.url_parse(
+                    url_clean)
                 basename =  path_mod.url_basename(self.url)
-            self.path = path_mod.relpath(os.path.abspath(
+            self.path = path_mod.relpath(self.context.abspath(
                 os.path.join(fetchto, basename)))
 
-            # Check if the module dir exists and is not empty
-            if os.path.exists(self.path) and os.listdir(self.path):
+            # Check if the module dir exists and is not empty.  The modules
+            # linked from the module store (see fetch/store.py) are either
+            # a tree of hard links or a symbolic link, which is dangling
+            # (so not fetched) if the store entry was removed.
+            if (path_mod.path_isdir(self.path)
+                    and path_mod.list_dir(self.path)):
                 self.isfetched = True
-                logging.debug("Module %s (parent: %s) is fetched.",
-                              url, self.parent.path)
+                logger.debug("Module %s (parent: %s) is fetched.",
+                             url, self.parent.path)
             else:
                 self.isfetched = False
-                logging.debug("Module %s (parent: %s) is NOT fetched.",
-                              url, self.parent.path)
+                logger.debug("Module %s (parent: %s) is NOT fetched.",
+                             url, self.parent.path)
 
     def process_manifest(self):
         """Process the content section of the manifest_dict"""
-        logging.debug("Process manifest at: " + os.path.dirname(self.path))
+        logger.debug("Process manifest at: " + os.path.dirname(self.path))
         self._process_manifest_universal()
         self._process_manifest_files()
         self._process_manifest_modules()
@@ -150,19 +167,19 @@ class Module(object):
         """Check the provided filepath against several conditions"""
         if filepath:
             if path_mod.is_abs_path(filepath):
-                logging.warning(
+                logger.warning(
                     "Specified path seems to be an absolute path: " +
                     filepath + "\nOmitting.")
                 return False
             filepath = os.path.join(self.path, filepath)
-            if not os.path.exists(filepath):
+            if not path_mod.path_exists(filepath):
                 raise Exception(
                     "Path specified in manifest {} doesn't exist: {}".format(
                     self.path, filepath))
 
             filepath = path_mod.rel2abs(filepath, self.path)
-            if os.path.isdir(filepath):
-                logging.warning(
+            if path_mod.path_isdir(filepath):
+                logger.warning(
                     "Path specified in manifest %s is a directory: %s",
                     self.path, filepath)
         return True
@@ -171,7 +188,15 @@ class Module(object):
         """Get a list with only the valid absolute paths from the provided"""
         paths = []
         for filepath in list_of_paths:
-            if self._check_filepath(filepath):
+            if path_mod.has_magic(filepath) and not path_mod.is_abs_path(
+                    filepath):
+                matches = path_mod.glob_files(filepath, self.path)
+                if len(matches) == 0:
+                    logger.warning(
+                        "Pattern specified in manifest %s matches no file: %s",
+                        self.path, filepath)
+                paths.extend(matches)
+            elif self._check_filepath(filepath):
                 paths.append(path_mod.rel2abs(filepath, self.path))
         return paths
 
@@ -190,12 +215,11 @@ class Module(object):
             include_dirs = self.top_manifest.manifest_dict.get(
                 'include_dirs', [])
         for path_aux in paths:
-            if os.path.isdir(path_aux):
+            if path_mod.path_isdir(path_aux):
                 # If a path is a dir, add all the files of that dir.
-                dir_ = os.listdir(path_aux)
-                for f_dir in dir_:
+                for f_dir, is_dir, _ in path_mod.scan_dir(path_aux):
                     f_dir = os.path.join(self.path, path_aux, f_dir)
-                    if not os.path.isdir(f_dir):
+                    if not is_dir:
                         srcs.add(create_source_file(path=f_dir,
                                                     module=self,
                                                     library=self.library,
@@ -214,17 +238,19 @@ class Module(object):
         files = self.manifest_dict.get('files')
         if files is None:
             self.files = SourceFileSet()
-            logging.debug("No files in the manifest at %s", self.path or '?')
+            logger.debug("No files in the manifest at %s", self.path or '?')
         else:
             # Be sure it is a list.
             files = path_mod.flatten_list(files)
             self.manifest_dict["files"] = files
-            logging.debug("Files in %s: %s to library %s" ,
-                          self.path,
-                          str(self.manifest_dict["files"]),
-                          self.library)
+            logger.debug("Files in %s: %s to library %s" ,
+                         self.path,
+                         str(self.manifest_dict["files"]),
+                         self.library)
             paths = self._make_list_of_paths(files)
             self.files = self._create_file_list_from_paths(paths=paths)
+            if self.action.parse_pipeline is not None:
+                self.action.parse_pipeline.add(self.files)
 
     def fetchto(self):
         """Get the fetchto folder for the module"""
@@ -257,6 +283,10 @@ class Module(object):
                         raise Exception("Found an absolute path (" + path +
                                         ") in a manifest(" + self.path + ")")
                     path = path_mod.rel2abs(path, self.path)
+                elif m == 'archive' and "://" not in path:
+                    # Archive paths are relative to the manifest, they are
+                    # kept relative to the top module (as in the lock file)
+                    path = path_mod.relpath(path_mod.rel2abs(path, self.path))
                 mods.append(self.action.new_module(
                     parent=self, url=path, source=m, fetchto=fetchto))
             self.modules[m] = mods
@@ -278,20 +308,22 @@ class Module(object):
     def submodules(self):
         """Get a list with all the submodules this module instance requires"""
         return self.modules['local'] + self.modules['git'] \
-            + self.modules['gitsm'] + self.modules['svn']
+            + self.modules['gitsm'] + self.modules['svn'] \
+            + self.modules['archive']
 
     def remove_dir_from_disk(self):
         """Delete the module dir if it is already fetched and available"""
         assert self.isfetched
-        logging.debug("Removing " + self.path)
+        logger.debug("Removing " + self.path)
         command_tmp = shell.rmdir_command() + " " + self.path
         shell.run(command_tmp)
+        path_mod.invalidate_fs_cache(self.path)
 
     def _search_for_manifest(self):
         """Look for manifest in the given folder and create a Manifest object
         """
-        logging.debug("Looking for manifest in " + self.path)
-        dir_files = os.listdir(self.path)
+        logger.debug("Looking for manifest in " + self.path)
+        dir_files = path_mod.list_dir(self.path)
         if "manifest.py" in dir_files and "Manifest.py" in dir_files:
             raise Exception(
                 "Both manifest.py and Manifest.py" +
@@ -299,12 +331,53 @@ class Module(object):
                 self.path)
         for filename in dir_files:
             if filename == "manifest.py" or filename == "Manifest.py":
-                if not os.path.isdir(filename):
-                    logging.debug("Found manifest for module %s: %s",
-                                  self.path, filename)
-                    return os.path.join(self.path, filename)
+                if not path_mod.path_isdir(
+                        os.path.join(self.path, filename)):
+                    logger.debug("Found manifest for module %s: %s",
+                                 self.path, filename)
+                    return self.context.abspath(
+                        os.path.join(self.path, filename))
         raise Exception("No manifest found in path: {}".format(self.path))
 
+    def evaluate_manifest(self):
+        """
+        Evaluate the module Manifest.py, without processing the obtained
+        manifest_dict, and store it (and the parser) in the evaluation
+        property.  With --parallel-manifests (or if the run is isolated),
+        the manifest is evaluated in isolation (without changing the current
+        directory or stdout), so the manifests of different modules (or
+        runs) can be evaluated concurrently.
+        """
+        filename = self._search_for_manifest()
+        logger.debug("Parse manifest in: %s", filename)
+
+        manifest_parser = ManifestParser()
+
+        manifest_parser.add_prefix_code(self.action.options.prefix_code)
+        manifest_parser.add_suffix_code(self.action.options.suffix_code)
+        manifest_parser.manifest_cache = self.action.manifest_cache
+        manifest_parser.isolated = (self.action.options.parallel_manifests
+                                    or self.context.isolated)
+
+        # Parse and extract variables from it, a submodule inherits the
+        # variables from the top module.
+        if self.parent is None:
+            inherited_context = None
+        else:
+            inherited_context = self.top_manifest.manifest_dict
+        extra_context = {"__manifest": self.path}
+
+        # The parse method is where most of the parser action takes place!
+        try:
+            manifest_dict = manifest_parser.parse(
+                config_file=filename, extra_context=extra_context,
+                inherited_context=inherited_context)
+        except NameError as name_error:
+            raise Exception(
+                "Error while parsing {0}:\n{1}: {2}.".format(
+                    self.path, type(name_error), name_error))
+        self.evaluation = (manifest_dict, manifest_parser)
+
     def parse_manifest(self):
         """
         Create a dictionary from the module Manifest.py and assign it
@@ -323,46 +396,37 @@ class Module(object):
             - ...but deleting some key fields that needs to be respected.
         """
 
-        if self.manifest_dict or self.isfetched is False:
+        if self.isparsed or self.isfetched is False:
             return
         assert self.path is not None
+        self.isparsed = True
 
-        filename = self._search_for_manifest()
-        logging.debug("Parse manifest in: %s", filename)
-
-        logging.debug("""
+        logger.debug("""
 ***********************************************************
 PARSE START: %s
 ***********************************************************""", self.path)
 
-        manifest_parser = ManifestParser()
-
-        manifest_parser.add_prefix_code(self.action.options.prefix_code)
-        manifest_parser.add_suffix_code(self.action.options.suffix_code)
-
-        # Parse and extract variables from it.
-        if self.parent is None:
-            extra_context = {}
-        else:
-            extra_context = dict(self.top_manifest.manifest_dict)
-        extra_context["__manifest"] = self.path
-
-        # The parse method is where most of the parser action takes place!
-        try:
-            self.manifest_dict = manifest_parser.parse(config_file=filename, extra_context=extra_context)
-        except NameError as name_error:
-            raise Exception(
-                "Error while parsing {0}:\n{1}: {2}.".format(
-                    self.path, type(name_error), name_error))
+        if self.evaluation is None:
+            self.evaluate_manifest()
+        self.manifest_dict, manifest_parser = self.evaluation
+        self.evaluation = None
+        manifest_parser.report_printed()
+        if manifest_parser.executed:
+            # The manifest code may have generated files in the module
+            # directory, after it has been listed.
+            path_mod.invalidate_fs_cache(self.path)
 
         # Process the parsed manifest_dict to assign the module properties
         self.process_manifest()
 
-        # Recurse: parse every detected submodule
-        for submod in self.submodules():
+        # Recurse: parse every detected submodule, the sibling manifests
+        # can be evaluated in parallel first.
+        submodules = self.submodules()
+        self.action.evaluate_manifests(submodules)
+        for submod in submodules:
             submod.parse_manifest()
 
-        logging.debug("""
+        logger.debug("""
 ***********************************************************
 PARSE END: %s
 ***********************************************************
@@ -29,6 +29,8 @@ import logging
 from ..util import path as path_mod
 import six
 
+logger = logging.getLogger(__name__)
+
 
 class DepRelation(object):
 
@@ -107,10 +109,8 @@ class File(object):
 
     def rel_path(self, directory=None):
         """Returns the relative path for the file calculated with (directory)
-        as the origin reference -- if none, it will be defaulted to current
-        folder from which we are launching the program"""
-        if directory is None:
-            directory = os.getcwd()
+        as the origin reference -- if none, it will be defaulted to the
+        root directory of the run (the folder of the top manifest)"""
         return path_mod.relpath(self.path, directory)
 
     def __str__(self):
@@ -139,6 +139,7 @@ class DepFile(File):
         self.requires = set()
         self.depends_on = set()     # Set of files this file depends on.
         self.included_files = set()
+        self.libraries = set()      # Libraries visible from this file.
         self.dep_level = None
         self.is_parsed = False
 
@@ -173,8 +174,8 @@ class DepFile(File):
                 self.dep_level = 1 + \
                     max([dep.get_dep_level() for dep in self.depends_on])
         elif self.dep_level < 0:
-            logging.warning("Probably run into a circular reference of file "
-                            "dependencies. It appears %s depends on itself, "
-                            "indirectly via atleast one other file.",
-                            self.path)
+            logger.warning("Probably run into a circular reference of file "
+                           "dependencies. It appears %s depends on itself, "
+                           "indirectly via atleast one other file.",
+                           self.path)
         return self.dep_level
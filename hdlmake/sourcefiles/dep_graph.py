@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Hdlmake.
+#
+# Hdlmake is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Hdlmake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Hdlmake.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Module providing a compact, array based representation of a solved
+dependency graph, suitable for very large designs"""
+
+from __future__ import absolute_import
+import logging
+from array import array
+from bisect import bisect_left, bisect_right
+
+from .dep_file import DepFile, DepRelation
+
+logger = logging.getLogger(__name__)
+
+
+class CompactDepGraph(object):
+
+    """Array based dependency graph built from a solved fileset.
+
+    Every file gets an integer id (files are sorted by path) and every
+    string (paths, libraries, unit names) is stored once in a string table.
+    The paths are interned first, so the id of a file is also the id of its
+    path and is found by bisecting the head of the string table.
+    The provided units, the dependencies and the included files of each
+    file are stored as CSR adjacency arrays: the entries for the file with
+    id N are the ones between offsets[N] and offsets[N + 1]. The entities
+    are also indexed by unit name in two parallel arrays sorted by string id.
+    """
+
+    def __init__(self, fileset):
+        files = {}
+        for dep_file in fileset:
+            if isinstance(dep_file, DepFile):
+                files.setdefault(dep_file.path, dep_file)
+        self.files = [files[path] for path in sorted(files)]
+        self.strings = []
+        self._string_ids = {}
+        self.libraries = array('i')
+        self.unit_offsets = array('i', [0])
+        self.units = array('i')
+        self.unit_types = array('b')
+        self.dep_offsets = array('i', [0])
+        self.deps = array('i')
+        self.include_offsets = array('i', [0])
+        self.includes = array('i')
+        self.provider_units = array('i')
+        self.provider_files = array('i')
+        self._levels = None
+        self._reverse = None
+        for dep_file in self.files:
+            self._intern(dep_file.path)
+        for dep_file in self.files:
+            self._add_file(dep_file)
+        self._index_providers()
+        logger.debug("Compact graph: %d files, %d dependencies, %d strings",
+                     len(self.files), len(self.deps), len(self.strings))
+
+    def _intern(self, text):
+        """Get the id for the string, adding it to the table if needed"""
+        string_id = self._string_ids.get(text)
+        if string_id is None:
+            string_id = len(self.strings)
+            self.strings.append(text)
+            self._string_ids[text] = string_id
+        return string_id
+
+    def _path_id(self, path):
+        """Get the id for the file with the given path, or None"""
+        file_id = bisect_left(self.strings, path, 0, len(self.files))
+        if file_id < len(self.files) and self.strings[file_id] == path:
+            return file_id
+        return None
+
+    def _add_file(self, dep_file):
+        """Append the file entries to the arrays"""
+        self.libraries.append(
+            self._intern(getattr(dep_file, "library", "work")))
+        for rel in sorted(dep_file.provides, key=repr):
+            self.units.append(
+                self._intern("{}.{}".format(rel.lib_name, rel.obj_name)))
+            self.unit_types.append(rel.rel_type)
+        self.unit_offsets.append(len(self.units))
+        dep_ids = [self._path_id(f.path) for f in dep_file.depends_on]
+        self.deps.extend(sorted(set(dep_ids) - set([None])))
+        self.dep_offsets.append(len(self.deps))
+        for include in sorted(dep_file.included_files):
+            self.includes.append(self._intern(include))
+        self.include_offsets.append(len(self.includes))
+
+    def _index_providers(self):
+        """Build the (unit string id, file id) arrays of the entities,
+        sorted by unit so the providers are found by bisection"""
+        pairs = []
+        for file_id in range(len(self.files)):
+            for index in range(self.unit_offsets[file_id],
+                               self.unit_offsets[file_id + 1]):
+                if self.unit_types[index] == DepRelation.ENTITY:
+                    pairs.append((self.units[index], file_id))
+        pairs.sort()
+        self.provider_units.extend([pair[0] for pair in pairs])
+        self.provider_files.extend([pair[1] for pair in pairs])
+
+    def release_file_sets(self):
+        """Drop the per-file sets, the graph is the only copy from now on"""
+        for dep_file in self.files:
+            dep_file.provides = frozenset()
+            dep_file.requires = frozenset()
+            dep_file.depends_on = frozenset()
+            dep_file.included_files = frozenset()
+
+    def __contains__(self, dep_file):
+        path = getattr(dep_file, "path", None)
+        return path is not None and self._path_id(path) is not None
+
+    def file_id(self, dep_file):
+        """Get the integer id for the given file"""
+        file_id = self._path_id(dep_file.path)
+        if file_id is None:
+            raise KeyError(dep_file.path)
+        return file_id
+
+    def get_dependencies(self, dep_file):
+        """Get the list of files the given file depends on"""
+        file_id = self.file_id(dep_file)
+        return [self.files[dep_id] for dep_id in
+                self.deps[self.dep_offsets[file_id]:
+                          self.dep_offsets[file_id + 1]]]
+
+    def get_included_files(self, dep_file):
+        """Get the list of paths included by the given file"""
+        file_id = self.file_id(dep_file)
+        return [self.strings[string_id] for string_id in
+                self.includes[self.include_offsets[file_id]:
+                              self.include_offsets[file_id + 1]]]
+
+    def get_units(self, dep_file):
+        """Get the names ('lib.unit') of the design units provided by the
+        given file, architectures excluded"""
+        file_id = self.file_id(dep_file)
+        start = self.unit_offsets[file_id]
+        end = self.unit_offsets[file_id + 1]
+        return sorted([self.strings[self.units[index]]
+                       for index in range(start, end)
+                       if self.unit_types[index] != DepRelation.ARCHITECTURE])
+
+    def get_levels(self):
+        """Get the dependency level for every file id: 0 for files without
+        dependencies, otherwise one more than the highest dependency"""
+        if self._levels is not None:
+            return self._levels
+        # -2: not visited yet, -1: being visited (to detect cycles).
+        levels = array('i', [-2]) * len(self.files)
+        for root_id in range(len(self.files)):
+            if levels[root_id] != -2:
+                continue
+            levels[root_id] = -1
+            stack = [(root_id, self.dep_offsets[root_id])]
+            while len(stack) > 0:
+                file_id, index = stack[-1]
+                if index < self.dep_offsets[file_id + 1]:
+                    stack[-1] = (file_id, index + 1)
+                    dep_id = self.deps[index]
+                    if levels[dep_id] == -2:
+                        levels[dep_id] = -1
+                        stack.append((dep_id, self.dep_offsets[dep_id]))
+                    elif levels[dep_id] == -1:
+                        logger.warning(
+                            "Probably run into a circular reference of file "
+                            "dependencies. It appears %s depends on itself, "
+                            "indirectly via atleast one other file.",
+                            self.files[dep_id].path)
+                    continue
+                stack.pop()
+                dep_ids = self.deps[self.dep_offsets[file_id]:
+                                    self.dep_offsets[file_id + 1]]
+                if len(dep_ids) == 0:
+                    levels[file_id] = 0
+                else:
+                    levels[file_id] = 1 + max([levels[dep_id]
+                                               for dep_id in dep_ids])
+        self._levels = levels
+        return levels
+
+    def sorted_files(self, fileset):
+        """Sort the files of the fileset in order of dependency, like
+        make_dependency_sorted_list"""
+        levels = self.get_levels()
+        dependable = [f for f in fileset if f in self]
+        non_dependable = [f for f in fileset if f not in self]
+        dependable.sort(key=lambda f: (levels[self.file_id(f)],
+                                       f.path.lower()))
+        return non_dependable + dependable
+
+    def waves(self, fileset):
+        """Group the files of the fileset in compilation waves, like
+        make_dependency_waves"""
+        levels = self.get_levels()
+        waves = {}
+        for dep_file in fileset:
+            if dep_file in self:
+                waves.setdefault(levels[self.file_id(dep_file)],
+                                 []).append(dep_file)
+        return [sorted(waves[level], key=lambda f: f.path.lower())
+                for level in sorted(waves)]
+
+    def _reverse_edges(self):
+        """Build (once) the reverse CSR arrays: the files depending on
+        every file id"""
+        if self._reverse is not None:
+            return self._reverse
+        counts = array('i', [0]) * (len(self.files) + 1)
+        for dep_id in self.deps:
+            counts[dep_id + 1] += 1
+        for file_id in range(len(self.files)):
+            counts[file_id + 1] += counts[file_id]
+        offsets = array('i', counts)
+        fill = array('i', counts)
+        rdeps = array('i', [0]) * len(self.deps)
+        for file_id in range(len(self.files)):
+            for dep_id in self.deps[self.dep_offsets[file_id]:
+                                    self.dep_offsets[file_id + 1]]:
+                rdeps[fill[dep_id]] = file_id
+                fill[dep_id] += 1
+        self._reverse = (offsets, rdeps)
+        return self._reverse
+
+    def reachable(self, roots, reverse=False):
+        """Get the list of files reachable from the given root files,
+        following the dependencies (or the dependants if reverse)"""
+        if reverse:
+            offsets, edges = self._reverse_edges()
+        else:
+            offsets, edges = self.dep_offsets, self.deps
+        visited = bytearray(len(self.files))
+        stack = [self.file_id(f) for f in roots]
+        while len(stack) > 0:
+            file_id = stack.pop()
+            if visited[file_id]:
+                continue
+            visited[file_id] = 1
+            stack.extend(edges[offsets[file_id]:offsets[file_id + 1]])
+        return [self.files[file_id] for file_id in range(len(self.files))
+                if visited[file_id]]
+
+    def find_providers(self, unit, lib_name="work"):
+        """Get the files providing the entity/module 'lib_name.unit'"""
+        string_id = self._string_ids.get(
+            "{}.{}".format(lib_name, unit.lower()))
+        if string_id is None:
+            return []
+        start = bisect_left(self.provider_units, string_id)
+        end = bisect_right(self.provider_units, string_id)
+        return [self.files[file_id]
+                for file_id in self.provider_files[start:end]]
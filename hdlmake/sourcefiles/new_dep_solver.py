@@ -25,10 +25,15 @@
 
 from __future__ import print_function
 from __future__ import absolute_import
+import io
 import logging
+import os
+import re
 
 from ..sourcefiles.dep_file import DepFile
 
+logger = logging.getLogger(__name__)
+
 
 class DepParser(object):
 
@@ -42,75 +47,305 @@ class DepParser(object):
         pass
 
 
-def solve(fileset, standard_libs=None):
+class ProviderPolicy(object):
+
+    """Policy used to choose a single provider file when a relation is
+    satisfied by multiple files.  The criteria are applied in order:
+      - explicit overrides (unit name or 'lib.unit' -> absolute file path)
+      - library search order (providers in earlier libraries win)
+      - module proximity (the closest module in the hierarchy wins)
+      - file path, as the last tie breaker so the result is deterministic
+    """
+
+    def __init__(self, library_order=None, overrides=None):
+        self.library_order = [lib.lower() for lib in (library_order or [])]
+        self.overrides = {}
+        for unit, path in (overrides or {}).items():
+            self.overrides[unit.lower()] = path
+        self.decisions = []
+
+    def _library_rank(self, dep_file):
+        """Position of the file library in the search order"""
+        library = getattr(dep_file, "library", "work").lower()
+        if library in self.library_order:
+            return self.library_order.index(library)
+        return len(self.library_order)
+
+    @staticmethod
+    def _module_distance(module_a, module_b):
+        """Number of hops between two modules in the module hierarchy"""
+        def _ancestors(module):
+            """List the module followed by all of its parents"""
+            chain = []
+            while module is not None:
+                chain.append(module)
+                module = module.parent
+            return chain
+        chain_a = _ancestors(module_a)
+        chain_b = _ancestors(module_b)
+        for index_a, mod_aux in enumerate(chain_a):
+            if mod_aux in chain_b:
+                return index_a + chain_b.index(mod_aux)
+        return len(chain_a) + len(chain_b)
+
+    def choose(self, rel, dep_file, providers):
+        """Choose the file providing :param rel: for :param dep_file: among
+        the given providers.  Return the chosen file and the reason"""
+        for key in ["{}.{}".format(rel.lib_name, rel.obj_name), rel.obj_name]:
+            if key in self.overrides:
+                for provider in providers:
+                    if provider.path == self.overrides[key]:
+                        return provider, "manifest override"
+        candidates = sorted(providers, key=lambda f: f.path)
+        if self.library_order:
+            best = min([self._library_rank(f) for f in candidates])
+            if best < len(self.library_order):
+                ranked = [f for f in candidates
+                          if self._library_rank(f) == best]
+                if len(ranked) == 1:
+                    return ranked[0], "library order"
+                candidates = ranked
+        distances = [self._module_distance(dep_file.module, f.module)
+                     for f in candidates]
+        best = min(distances)
+        ranked = [f for f, dist in zip(candidates, distances) if dist == best]
+        if len(ranked) == 1:
+            return ranked[0], "module proximity"
+        return ranked[0], "file path"
+
+    def report(self):
+        """Log a compact report of the decisions taken by the policy"""
+        if len(self.decisions) == 0:
+            return
+        summary = {}
+        for rel, chosen, losers, reason in self.decisions:
+            key = (str(rel), chosen.path, reason,
+                   tuple(sorted([f.path for f in losers])))
+            summary[key] = summary.get(key, 0) + 1
+        logger.info("Resolved %d relations satisfied by multiple files:",
+                    len(self.decisions))
+        for key in sorted(summary):
+            rel, chosen, reason, losers = key
+            logger.info("  %s -> %s (%s, %d uses) [dropped: %s]",
+                        rel, chosen, reason, summary[key], ", ".join(losers))
+
+
+def make_relation_index(fileset):
+    """Build a dictionary mapping every provided relation to the sorted
+    list of files providing it"""
+    index = {}
+    for dep_file in fileset:
+        for rel in dep_file.provides:
+            index.setdefault(rel, []).append(dep_file)
+    for providers in index.values():
+        providers.sort(key=lambda f: f.path)
+    return index
+
+
+def make_entity_library_index(relation_index):
+    """Build a dictionary mapping every provided entity/module name to a
+    dictionary with the providing files for each library"""
+    from .dep_file import DepRelation
+    index = {}
+    for rel, providers in relation_index.items():
+        if rel.rel_type == DepRelation.ENTITY:
+            index.setdefault(rel.obj_name, {})[rel.lib_name] = providers
+    return index
+
+
+def _find_visible_entity(entity_index, rel, dep_file):
+    """Look for the files providing the entity required by the relation
+    in the other libraries visible from the file (library clauses)"""
+    libraries = entity_index.get(rel.obj_name, {})
+    providers = []
+    for lib_name in sorted(dep_file.libraries - set([rel.lib_name])):
+        providers.extend(libraries.get(lib_name, []))
+    if len(providers) > 0:
+        logger.debug("Relation %s in %s satisfied from the visible "
+                     "libraries by: %s", str(rel), dep_file.name,
+                     ", ".join([f.path for f in providers]))
+    return providers
+
+
+def solve(fileset, standard_libs=None, policy=None, primitives=None):
     """Function that Parses and Solves the provided HDL fileset. Note
-       that it doesn't return a new fileset, but modifies the original one"""
+       that it doesn't return a new fileset, but modifies the original one.
+       If a provider policy is given, only one of the files satisfying a
+       relation is added as a dependency. The modules/entities named in
+       primitives (lowercase) are provided by the tool itself"""
     from .sourcefileset import SourceFileSet
     from .dep_file import DepRelation
     assert isinstance(fileset, SourceFileSet)
     fset = fileset.filter(DepFile)
     # print(fileset)
     # print(fset)
-    logging.debug("PARSE BEGIN: Here, we will parse all the files in the "
-                  "fileset: no parsing should be done beyond this point")
+    logger.debug("PARSE BEGIN: Here, we will parse all the files in the "
+                 "fileset: no parsing should be done beyond this point")
     for investigated_file in fset:
-        logging.debug("INVESTIGATED FILE: %s", investigated_file)
+        logger.debug("INVESTIGATED FILE: %s", investigated_file)
         if not investigated_file.is_parsed:
-            logging.debug("Not parsed yet, let's go!")
+            logger.debug("Not parsed yet, let's go!")
             investigated_file.parser.parse(investigated_file)
-    logging.debug("PARSE END: now the parsing is done")
+    logger.debug("PARSE END: now the parsing is done")
 
-    logging.debug("SOLVE BEGIN")
+    logger.debug("SOLVE BEGIN")
+    relation_index = make_relation_index(fset)
+    entity_index = make_entity_library_index(relation_index)
+    primitives = primitives or frozenset()
     not_satisfied = 0
+    from_primitives = 0
     for investigated_file in fset:
-        # logging.info("INVESTIGATED FILE: %s" % investigated_file)
+        # logger.info("INVESTIGATED FILE: %s" % investigated_file)
         for rel in investigated_file.requires:
-            # logging.info("- relation: %s" % rel)
+            # logger.info("- relation: %s" % rel)
             # Only analyze USE relations, we are looking for dependencies
-            satisfied_by = set()
-            for dep_file in fset:
-                if dep_file.satisfies(rel):
+            satisfied_by = relation_index.get(rel, [])
+            if (len(satisfied_by) == 0
+                    and rel.rel_type is DepRelation.ENTITY):
+                # The entity may be instantiated from another library
+                satisfied_by = _find_visible_entity(
+                    entity_index, rel, investigated_file)
+            if len(satisfied_by) > 1 and policy is not None:
+                # A file providing the relation by itself needs no other.
+                if investigated_file not in satisfied_by:
+                    chosen, reason = policy.choose(
+                        rel, investigated_file, satisfied_by)
+                    policy.decisions.append(
+                        (rel, chosen, [f for f in satisfied_by
+                                       if f is not chosen], reason))
+                    investigated_file.depends_on.add(chosen)
+            elif len(satisfied_by) > 1:
+                for dep_file in satisfied_by:
                     if dep_file is not investigated_file:
                         # A file cannot depends on itself.
                         investigated_file.depends_on.add(dep_file)
-                    satisfied_by.add(dep_file)
-            if len(satisfied_by) > 1:
-                logging.warning(
+                logger.warning(
                     "Relation %s satisfied by multiple (%d) files:\n %s",
                     str(rel),
                     len(satisfied_by),
                     '\n '.join([file_aux.path for
                                file_aux in list(satisfied_by)]))
-            elif len(satisfied_by) == 0:
+            elif len(satisfied_by) == 1:
+                if satisfied_by[0] is not investigated_file:
+                    investigated_file.depends_on.add(satisfied_by[0])
+            elif (rel.rel_type is DepRelation.ENTITY
+                  and rel.obj_name in primitives):
+                # Vendor primitive, provided by the tool libraries
+                from_primitives += 1
+            else:
                 # if relation is a USE PACKAGE, check against
                 # the standard libs provided by the tool HDL compiler
                 required_lib = rel.lib_name
                 if (standard_libs is not None
                      and rel.rel_type is DepRelation.PACKAGE
                      and required_lib in standard_libs):
-                    logging.debug("Not satisfied relation %s in %s will "
-                                  "be covered by the target compiler "
-                                  "standard libs.",
-                                  str(rel), investigated_file.name)
+                    logger.debug("Not satisfied relation %s in %s will "
+                                 "be covered by the target compiler "
+                                 "standard libs.",
+                                 str(rel), investigated_file.name)
                 else:
-                    logging.warning("Relation %s in %s not satisfied by "
-                                    "any source file",
-                                    str(rel), investigated_file.name)
+                    logger.warning("Relation %s in %s not satisfied by "
+                                   "any source file",
+                                   str(rel), investigated_file.name)
                     not_satisfied += 1
-    logging.debug("SOLVE END")
+    if policy is not None:
+        policy.report()
+    if from_primitives != 0:
+        logger.debug("%d relations covered by the tool primitives.",
+                     from_primitives)
+    logger.debug("SOLVE END")
     if not_satisfied != 0:
-        logging.warning(
+        logger.warning(
             "Dependencies solved, but %d relations were not satisfied",
             not_satisfied)
     else:
-        logging.info(
+        logger.info(
             "Dependencies solved, all of the relations were satisfied!")
 
 
-def make_dependency_sorted_list(fileset):
+def _prescan_modules(fileset):
+    """Do a fast textual scan of the HDL files, grouped by module: collect
+    the names of the units each module may provide, every word used in its
+    files and the basenames of the included files.  Modules with files that
+    cannot be scanned are returned in a separate set"""
+    from .srcfile import VHDLFile, VerilogFile
+    provide_pattern = re.compile(
+        r"^\s*(?:entity|package|module|macromodule|interface|program|"
+        r"primitive)\s+(\w+)", re.MULTILINE | re.IGNORECASE)
+    word_pattern = re.compile(r"\w+")
+    include_pattern = re.compile(r'`include\s+"([^"]+)"')
+    scan = {}
+    opaque_modules = set()
+    for dep_file in fileset:
+        mod_scan = scan.setdefault(dep_file.module, (set(), set(), set()))
+        if not isinstance(dep_file, (VHDLFile, VerilogFile)):
+            opaque_modules.add(dep_file.module)
+            continue
+        # Undecodable bytes (e.g. in comments) cannot be part of a name
+        with io.open(dep_file.path, "r", errors="ignore") as hdl_file:
+            buf = hdl_file.read().lower()
+        mod_scan[0].update(provide_pattern.findall(buf))
+        mod_scan[1].update(word_pattern.findall(buf))
+        mod_scan[2].update([os.path.basename(inc_aux)
+                            for inc_aux in include_pattern.findall(buf)])
+    return scan, opaque_modules
+
+
+def make_module_pruned_set(fileset, top_level_entity, extra_modules=None):
+    """Remove from the fileset the files belonging to modules that cannot
+    be reached from the top level entity, before any detailed parsing.
+    A coarse module graph is built from a textual pre-scan: a module is
+    reachable if any of the units it may provide (or any of its files, when
+    included) is named in an already reachable module.  The pre-scan is
+    conservative, so this never prunes a module the solver would keep."""
+    from ..sourcefiles.sourcefileset import SourceFileSet
+    assert isinstance(fileset, SourceFileSet)
+    if top_level_entity is None:
+        return fileset
+    scan, opaque_modules = _prescan_modules(fileset)
+    name_index = {}
+    for module, mod_scan in scan.items():
+        for name in mod_scan[0]:
+            name_index.setdefault(name, set()).add(module)
+    file_index = {}
+    for dep_file in fileset:
+        file_index.setdefault(dep_file.name.lower(), set()).add(dep_file.module)
+    hierarchy_drivers = [top_level_entity] + (extra_modules or [])
+    module_queue = set()
+    for entity_aux in hierarchy_drivers:
+        module_queue.update(name_index.get(entity_aux.lower(), set()))
+    if len(module_queue) == 0:
+        return fileset
+    provided_names = set(name_index)
+    file_names = set(file_index)
+    reachable = set(opaque_modules)
+    module_queue.update(opaque_modules)
+    while len(module_queue) > 0:
+        module = module_queue.pop()
+        reachable.add(module)
+        _, words, includes = scan[module]
+        for name in words & provided_names:
+            module_queue.update(name_index[name] - reachable)
+        for name in includes & file_names:
+            module_queue.update(file_index[name] - reachable)
+    pruned_files = SourceFileSet()
+    for dep_file in fileset:
+        if dep_file.module in reachable:
+            pruned_files.add(dep_file)
+    if len(reachable) < len(scan):
+        logger.info("Pruned %d of %d modules (%d files) not reachable "
+                    "from %s.", len(scan) - len(reachable), len(scan),
+                    len(fileset) - len(pruned_files),
+                    ", ".join(hierarchy_drivers))
+    return pruned_files
+
+
+def make_dependency_sorted_list(fileset, dep_graph=None):
     """Sort files in order of dependency.
     Files with no dependencies first.
     All files that another depends on will be earlier in the list."""
+    if dep_graph is not None:
+        return dep_graph.sorted_files(fileset)
     dependable = [f for f in fileset if isinstance(f, DepFile)]
     non_dependable = [f for f in fileset if not isinstance(f, DepFile)]
     dependable.sort(key=lambda f: f.path.lower())
@@ -120,7 +355,77 @@ def make_dependency_sorted_list(fileset):
     return non_dependable + dependable
 
 
-def make_dependency_set(fileset, top_level_entity, extra_modules=None):
+def make_dependency_waves(fileset, dep_graph=None):
+    """Group the files in compilation wavefronts: every file only depends
+    on files placed in earlier waves, so the files inside a wave can be
+    compiled in parallel.  The number of waves is the critical path depth
+    of the design."""
+    if dep_graph is not None:
+        waves = dep_graph.waves(fileset)
+    else:
+        levels = {}
+        for dep_file in fileset:
+            if isinstance(dep_file, DepFile):
+                levels.setdefault(dep_file.get_dep_level(),
+                                  []).append(dep_file)
+        waves = []
+        for level in sorted(levels):
+            waves.append(sorted(levels[level], key=lambda f: f.path.lower()))
+    if len(waves) > 0:
+        logger.info("Compile waves: %d (critical path depth), "
+                    "max parallelism: %d, average parallelism: %.1f",
+                    len(waves), max([len(wave) for wave in waves]),
+                    float(sum([len(wave) for wave in waves])) / len(waves))
+    return waves
+
+
+def make_reverse_dependency_index(fileset):
+    """Build the reverse dependency edges for the solved fileset: the
+    returned dictionary maps every file to the set of files that directly
+    depend on it"""
+    dependants = {}
+    for dep_file in fileset:
+        if not isinstance(dep_file, DepFile):
+            continue
+        dependants.setdefault(dep_file, set())
+        for required_file in dep_file.depends_on:
+            dependants.setdefault(required_file, set()).add(dep_file)
+    return dependants
+
+
+def make_impact_set(fileset, changed_paths, dep_graph=None):
+    """Create the set of all files that must be recompiled if any of the
+    files listed in changed_paths (absolute paths) is modified.  Verilog
+    included files are also considered, so a changed header affects every
+    file including it."""
+    changed_paths = set(changed_paths)
+    if dep_graph is not None:
+        changed_files = [
+            dep_file for dep_file in fileset
+            if isinstance(dep_file, DepFile) and (
+                dep_file.path in changed_paths or changed_paths & set(
+                    dep_graph.get_included_files(dep_file)))]
+        impact_set = set(dep_graph.reachable(changed_files, reverse=True))
+        impact_set &= set(fileset)
+    else:
+        dependants = make_reverse_dependency_index(fileset)
+        file_set = set()
+        for dep_file in dependants:
+            if (dep_file.path in changed_paths
+                    or changed_paths & set(dep_file.included_files)):
+                file_set.add(dep_file)
+        impact_set = set()
+        while len(file_set) > 0:
+            chk_file = file_set.pop()
+            impact_set.add(chk_file)
+            file_set.update(dependants.get(chk_file, set()) - impact_set)
+    logger.info("Found %d files affected by %d changed files.",
+                len(impact_set), len(changed_paths))
+    return impact_set
+
+
+def make_dependency_set(fileset, top_level_entity, extra_modules=None,
+                        dep_graph=None):
     """Create the set of all files required to build the named
      top_level_entity."""
     from ..sourcefiles.sourcefileset import SourceFileSet
@@ -140,35 +445,64 @@ def make_dependency_set(fileset, top_level_entity, extra_modules=None):
 
     top_file = None
     extra_files = []
-    for chk_file in fset:
-        if _check_entity(chk_file, top_level_entity):
-            top_file = chk_file
-        if extra_modules is not None:
-            for entity_aux in extra_modules:
-                if _check_entity(chk_file, entity_aux):
-                    extra_files.append(chk_file)
+    if dep_graph is not None:
+        if top_level_entity is not None:
+            top_files = dep_graph.find_providers(top_level_entity)
+            if len(top_files) > 0:
+                top_file = top_files[-1]
+        for entity_aux in (extra_modules or []):
+            extra_files.extend(dep_graph.find_providers(entity_aux))
+    else:
+        for chk_file in fset:
+            if _check_entity(chk_file, top_level_entity):
+                top_file = chk_file
+            if extra_modules is not None:
+                for entity_aux in extra_modules:
+                    if _check_entity(chk_file, entity_aux):
+                        extra_files.append(chk_file)
     if top_file is None:
         if top_level_entity is None:
-            logging.critical(
+            logger.critical(
                     'Could not find a top level file because the top '
                     'module is undefined. Continuing with the full file set.')
         else:
-            logging.critical(
+            logger.critical(
                     'Could not find a top level file that provides the '
                     'top_module="%s". Continuing with the full file set.',
                      top_level_entity)
         return fileset
     # Collect only the files that the top level entity is dependant on, by
     # walking the dependancy tree.
-    dep_file_set = set()
-    file_set = set([top_file] + extra_files)
-    while len(file_set) > 0:
-        chk_file = file_set.pop()
-        dep_file_set.add(chk_file)
-        file_set.update(chk_file.depends_on - dep_file_set)
+    if dep_graph is not None:
+        dep_file_set = set(dep_graph.reachable([top_file] + extra_files))
+    else:
+        dep_file_set = set()
+        file_set = set([top_file] + extra_files)
+        while len(file_set) > 0:
+            chk_file = file_set.pop()
+            dep_file_set.add(chk_file)
+            file_set.update(chk_file.depends_on - dep_file_set)
     hierarchy_drivers = [top_level_entity]
     if extra_modules is not None:
         hierarchy_drivers += extra_modules
-    logging.info("Found %d files as dependancies of %s.",
-                 len(dep_file_set), ", ".join(hierarchy_drivers))
+    logger.info("Found %d files as dependancies of %s.",
+                len(dep_file_set), ", ".join(hierarchy_drivers))
     return dep_file_set
+
+
+def make_test_selection(fileset, tops, changed_paths, extra_modules=None,
+                        dep_graph=None):
+    """Get the list of testbench tops (in the given order) that depend,
+    directly or transitively, on any of the files listed in changed_paths
+    (absolute paths).  A top that cannot be found in the design is selected
+    as soon as any file is affected."""
+    impact_set = make_impact_set(fileset, changed_paths, dep_graph=dep_graph)
+    selected = []
+    for top_aux in tops:
+        dep_file_set = make_dependency_set(fileset, top_aux, extra_modules,
+                                           dep_graph=dep_graph)
+        if len(impact_set.intersection(dep_file_set)) > 0:
+            selected.append(top_aux)
+    logger.info("Selected %d of %d testbench tops.",
+                len(selected), len(tops))
+    return selected
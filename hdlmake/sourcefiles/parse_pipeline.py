@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Hdlmake.
+#
+# Hdlmake is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Hdlmake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Hdlmake.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Module providing the background parsing of the HDL files, overlapped
+with the loading of the manifests"""
+
+from __future__ import absolute_import
+import logging
+import sys
+from multiprocessing.pool import ThreadPool
+
+import six
+
+from ..util import context as context_mod
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_file(dep_file):
+    """Parse the file, return (False, None) if it failed.  The error is not
+    raised here: the file may be pruned later, and the solver parses again
+    the files that are not parsed, raising the error where it always did.
+    Any other exception (e.g. an interruption) is returned as the second
+    item, to be raised again in the main thread"""
+    try:
+        dep_file.parser.parse(dep_file)
+    except Exception as parse_error:
+        logger.debug("Background parsing of %s failed: %s",
+                     dep_file.path, parse_error)
+        return False, None
+    except BaseException:
+        return False, sys.exc_info()
+    return True, None
+
+
+class ParsePipeline(object):
+
+    """Queue the HDL files for parsing as soon as the manifest of their
+    module is processed, so the parsing runs while the rest of the module
+    tree is loaded.  The files are parsed by a pool of threads."""
+
+    def __init__(self, jobs=1, context=None):
+        self.jobs = max(jobs, 1)
+        self.context = context or context_mod.current()
+        self._pool = ThreadPool(self.jobs)
+        self._results = []
+        self._queued = set()
+
+    def add(self, fileset):
+        """Queue the HDL files of the fileset not parsed yet"""
+        from .srcfile import VHDLFile, VerilogFile
+        for dep_file in fileset:
+            if (isinstance(dep_file, (VHDLFile, VerilogFile))
+                    and not dep_file.is_parsed
+                    and dep_file.path not in self._queued):
+                self._queued.add(dep_file.path)
+                self._results.append(
+                    self._pool.apply_async(self.context.bind(_parse_file),
+                                           (dep_file,)))
+
+    def wait(self):
+        """Wait until all the queued files are parsed and stop the pool"""
+        self._pool.close()
+        parsed = 0
+        try:
+            for result in self._results:
+                success, exc_info = result.get()
+                if exc_info is not None:
+                    six.reraise(*exc_info)
+                parsed += success
+        finally:
+            self._pool.join()
+        logger.debug("Parsed %d files while loading the manifests "
+                     "(%d failed).", parsed, len(self._results) - parsed)
@@ -21,6 +21,8 @@
 from .dep_file import File
 import logging
 
+logger = logging.getLogger(__name__)
+
 class SourceFileSet(set):
 
     """Class providing a extension of the 'set' object that includes
@@ -34,7 +36,7 @@ class SourceFileSet(set):
     def add(self, files):
         """Add a set of files to the source fileset instance"""
         if files is None:
-            logging.debug("Got None as a file.\n Ommiting")
+            logger.debug("Got None as a file.\n Ommiting")
             return
         if isinstance(files, (SourceFileSet, set)):
             for file_aux in files:
@@ -32,6 +32,8 @@ from ..util import path as path_mod
 from .dep_file import DepFile, File
 import six
 
+logger = logging.getLogger(__name__)
+
 
 class SourceFile(DepFile):
 
@@ -324,7 +326,7 @@ def create_source_file(path, module, library=None, include_dirs=None):
     assert extension[0] == '.'
     # Remove '.'
     extension = extension[1:]
-    logging.debug("add file " + path)
+    logger.debug("add file " + path)
 
     if extension in ['vhd', 'vhdl', 'vho']:
         new_file = VHDLFile(path=path,
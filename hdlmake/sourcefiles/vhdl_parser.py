@@ -29,6 +29,8 @@ import re
 
 from .new_dep_solver import DepParser
 
+logger = logging.getLogger(__name__)
+
 
 class VHDLParser(DepParser):
 
@@ -43,12 +45,12 @@ class VHDLParser(DepParser):
         from .dep_file import DepRelation
         assert not dep_file.is_parsed
 
-        logging.debug("Parsing %s", dep_file.path)
+        logger.debug("Parsing %s", dep_file.path)
 
         def _preprocess(vhdl_file):
             """Preprocess the supplied VHDL file instance"""
             buf = open(vhdl_file.path, "r").read()
-            logging.debug(
+            logger.debug(
                 "preprocess file %s (of length %d) in library %s",
                 vhdl_file.path, len(buf), vhdl_file.library)
             # Remove the comments and strings from the VHDL code
@@ -71,7 +73,7 @@ class VHDLParser(DepParser):
             if lib_name == "work":
                 # Work is an alias for the current library
                 lib_name = dep_file.library
-            logging.debug("use package %s.%s", lib_name, pkg_name)
+            logger.debug("use package %s.%s", lib_name, pkg_name)
             dep_file.add_require(
                 DepRelation(pkg_name, lib_name, DepRelation.PACKAGE))
             return "<hdlmake use_pattern %s.%s>" % (lib_name, pkg_name)
@@ -88,7 +90,7 @@ class VHDLParser(DepParser):
             as indexed plain strings. It adds the found PROVIDE relations
             to the file"""
             ent_name = text.group(1)
-            logging.debug("found entity %s.%s", dep_file.library, ent_name)
+            logger.debug("found entity %s.%s", dep_file.library, ent_name)
             dep_file.add_provide(
                 DepRelation(ent_name, dep_file.library, DepRelation.ENTITY))
             return "<hdlmake entity_pattern %s.%s>" % (dep_file.library, ent_name)
@@ -107,8 +109,8 @@ class VHDLParser(DepParser):
             relations to the file"""
             arch_name = text.group(1)
             ent_name = text.group(2)
-            logging.debug("found architecture %s of entity %s.%s",
-                          arch_name, dep_file.library, ent_name)
+            logger.debug("found architecture %s of entity %s.%s",
+                         arch_name, dep_file.library, ent_name)
             dep_file.add_provide(
                 DepRelation(ent_name, dep_file.library, DepRelation.ARCHITECTURE))
             dep_file.add_require(
@@ -129,7 +131,7 @@ class VHDLParser(DepParser):
             matches as indexed plain strings. It adds the found PROVIDE
             relations to the file"""
             pkg_name = text.group(1)
-            logging.debug("found package %s.%s", dep_file.library, pkg_name)
+            logger.debug("found package %s.%s", dep_file.library, pkg_name)
             dep_file.add_provide(
                 DepRelation(pkg_name, dep_file.library, DepRelation.PACKAGE))
             return "<hdlmake package %s.%s>" % (dep_file.library, pkg_name)
@@ -145,7 +147,7 @@ class VHDLParser(DepParser):
             component_pattern in the VHDL code -- group() returns positive
             matches as indexed plain strings. It doesn't add any relation
             to the file"""
-            logging.debug("found component declaration %s", text.group(1))
+            logger.debug("found component declaration %s", text.group(1))
             return "<hdlmake component %s>" % text.group(1)
 
         buf = re.sub(component_pattern, do_component, buf)
@@ -160,7 +162,7 @@ class VHDLParser(DepParser):
             signal_pattern in the VHDL code -- group() returns positive
             matches as indexed plain strings. It doesn't add any relation
             to the file"""
-            logging.debug("found signal declaration %s", text.group(1))
+            logger.debug("found signal declaration %s", text.group(1))
             return "<hdlmake signal %s>" % text.group(1)
 
         buf = re.sub(signal_pattern, do_signal, buf)
@@ -175,7 +177,7 @@ class VHDLParser(DepParser):
             constant_pattern in the VHDL code -- group() returns positive
             matches as indexed plain strings. It doesn't add any relation
             to the file"""
-            logging.debug("found constant declaration %s", text.group(1))
+            logger.debug("found constant declaration %s", text.group(1))
             return "<hdlmake constant %s>" % text.group(1)
 
         buf = re.sub(constant_pattern, do_constant, buf)
@@ -191,7 +193,7 @@ class VHDLParser(DepParser):
             record_pattern in the VHDL code -- group() returns positive matches
             as indexed plain strings. It doesn't add any relation to the
             file"""
-            logging.debug("found record declaration %s", text.group(1))
+            logger.debug("found record declaration %s", text.group(1))
             return "<hdlmake record %s>" % text.group(1)
 
         buf = re.sub(record_pattern, do_record, buf)
@@ -210,7 +212,7 @@ class VHDLParser(DepParser):
             funtion_pattern in the VHDL code -- group() returns positive
             matches as indexed plain strings. It doesn't add the relations
             to the file"""
-            logging.debug("found function declaration %s", text.group(1))
+            logger.debug("found function declaration %s", text.group(1))
             return "<hdlmake function %s>" % text.group(1)
 
         buf = re.sub(function_pattern, do_function, buf)
@@ -229,8 +231,8 @@ class VHDLParser(DepParser):
             instance_pattern in the VHDL code -- group() returns positive
             matches as indexed plain strings. It adds the found USE
             relations to the file"""
-            logging.debug("-> instantiates %s.%s(%s) as %s",
-                          text.group("LIB"), text.group("ENTITY"), text.group("ARCH"), text.group("LABEL"))
+            logger.debug("-> instantiates %s.%s(%s) as %s",
+                         text.group("LIB"), text.group("ENTITY"), text.group("ARCH"), text.group("LABEL"))
             lib_name = text.group("LIB")
             if not lib_name or lib_name == "work":
                 lib_name = dep_file.library
@@ -249,10 +251,11 @@ class VHDLParser(DepParser):
             library_pattern in the VHDL code -- group() returns positive
             matches as indexed plain strings. It adds the used libraries
             to the file's 'library' property"""
-            logging.debug("use library %s", text.group(1))
-            libraries.add(text.group(1))
+            logger.debug("use library %s", text.group(1))
+            libraries.add(text.group(1).lower())
             return "<hdlmake library %s>" % text.group(1)
         buf = re.sub(library_pattern, do_library, buf)
-        # logging.debug("\n" + buf) # print modified buffer.
+        dep_file.libraries = libraries
+        # logger.debug("\n" + buf) # print modified buffer.
 
         dep_file.is_parsed = True
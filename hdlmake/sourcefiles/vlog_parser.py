@@ -35,9 +35,12 @@ import logging
 from .new_dep_solver import DepParser
 from .dep_file import DepRelation
 from .srcfile import create_source_file
+from ..util import path as path_mod
 from collections import namedtuple
 import six
 
+logger = logging.getLogger(__name__)
+
 
 class VerilogPreprocessor(object):
 
@@ -70,12 +73,12 @@ class VerilogPreprocessor(object):
         preprocessor search directory"""
         if parent_dir is not None:
             possible_file = os.path.join(parent_dir, filename)
-            if os.path.isfile(possible_file):
-                return os.path.abspath(possible_file)
+            if path_mod.path_isfile(possible_file):
+                return path_mod.abspath(possible_file)
         for searchdir in self.vlog_file.include_dirs:
             probable_file = os.path.join(searchdir, filename)
-            if os.path.isfile(probable_file):
-                return os.path.abspath(probable_file)
+            if path_mod.path_isfile(probable_file):
+                return path_mod.abspath(probable_file)
         raise Exception("Can't find {} for {} in any of the include "
                         "directories: {}".format(filename, self.vlog_file.path,
                         ', '.join(self.vlog_file.include_dirs)))
@@ -187,9 +190,9 @@ class VerilogPreprocessor(object):
                         if enabled:
                             # maybe add a check for recusion here?
                             included_file_path = self._search_include(front.incfile, os.path.dirname(file_name))
-                            logging.debug("File being parsed %s (library %s) "
-                                          "includes %s",
-                                          file_name, library, included_file_path)
+                            logger.debug("File being parsed %s (library %s) "
+                                         "includes %s",
+                                         file_name, library, included_file_path)
                             # add include file to the dependancies
                             self.included_files.add(included_file_path)
                             # tokenize the file & prepend to the current stack
@@ -220,8 +223,8 @@ class VerilogPreprocessor(object):
             return re.sub(r'^\s*\n','', _proc_macros_layer(parts, vpp_macros)[0], flags=re.MULTILINE)
 
         # init dependencies
-        logging.debug("preprocess file %s (of length %d) in library %s",
-                      file_name, len(file_content), library)
+        logger.debug("preprocess file %s (of length %d) in library %s",
+                     file_name, len(file_content), library)
         buf = _filter_protected_regions(_remove_comment(file_content))
 
         return _handle_macros(buf)
@@ -491,14 +494,14 @@ class VerilogParser(DepParser):
         """Parse the provided Verilog file and add to its properties
         all of the detected dependency relations"""
         assert not dep_file.is_parsed
-        logging.debug("Parsing %s", dep_file.path)
+        logger.debug("Parsing %s", dep_file.path)
         # assert isinstance(dep_file, DepFile), print("unexpected type: " +
         # str(type(dep_file)))
 
         # Preprocess the file and add included files as dependencies
         buf = self.preprocessor.preprocess(dep_file)
         dep_file.included_files = self.preprocessor.included_files
-        logging.debug("%s has %d includes.", str(dep_file), len(dep_file.included_files))
+        logger.debug("%s has %d includes.", str(dep_file), len(dep_file.included_files))
 
         # look for packages used inside in file
         # it may generate false dependencies as package in SV can be used by:
@@ -518,8 +521,8 @@ class VerilogParser(DepParser):
             matches as indexed plain strings. It adds the found USE
             relations to the file"""
             pkg_name = text.group(1)
-            logging.debug("file %s imports/uses %s.%s package",
-                          dep_file.path, dep_file.library, pkg_name)
+            logger.debug("file %s imports/uses %s.%s package",
+                         dep_file.path, dep_file.library, pkg_name)
             dep_file.add_require(
                 DepRelation(pkg_name, dep_file.library, DepRelation.PACKAGE))
         import_pattern.subn(do_imports, buf)
@@ -534,7 +537,7 @@ class VerilogParser(DepParser):
             matches as indexed plain strings. It adds the found PROVIDE
             relations to the file"""
             pkg_name = text.group(1)
-            logging.debug("found pacakge %s.%s", dep_file.library, pkg_name)
+            logger.debug("found pacakge %s.%s", dep_file.library, pkg_name)
             dep_file.add_provide(
                 DepRelation(pkg_name, dep_file.library, DepRelation.PACKAGE))
         m_inside_package.subn(do_package, buf)
@@ -557,7 +560,7 @@ class VerilogParser(DepParser):
             positive  matches as indexed plain strings. It adds the found
             PROVIDE relations to the file"""
             module_name = text.group(1)
-            logging.debug("found module %s.%s", dep_file.library, module_name)
+            logger.debug("found module %s.%s", dep_file.library, module_name)
             dep_file.add_provide(
                 DepRelation(module_name, dep_file.library, DepRelation.MODULE))
 
@@ -570,8 +573,8 @@ class VerilogParser(DepParser):
                 if mod_name in self.reserved_words:
                     # A gate (and, or, ...)
                     return
-                logging.debug("-> instantiates %s.%s as %s",
-                              dep_file.library, mod_name, text.group(2))
+                logger.debug("-> instantiates %s.%s as %s",
+                             dep_file.library, mod_name, text.group(2))
                 dep_file.add_require(
                     DepRelation(mod_name, dep_file.library, DepRelation.MODULE))
             for stmt in [x for x in m_stmt.split(text.group(2)) if x and x[-1] == ")"]:
@@ -30,6 +30,8 @@ from .new_dep_solver import DepParser
 from .dep_file import DepRelation
 from ..sourcefiles.srcfile import create_source_file
 
+logger = logging.getLogger(__name__)
+
 class XCIParser(DepParser):
     """Class providing the Xilinx XCI parser"""
 
@@ -39,7 +41,7 @@ class XCIParser(DepParser):
     def parse(self, dep_file):
         """Parse a Xilinx XCI IP description file to determine the provided module(s)"""
         assert not dep_file.is_parsed
-        logging.debug("Parsing %s", dep_file.path)
+        logger.debug("Parsing %s", dep_file.path)
 
         with open(dep_file.path) as f:
             # extract namespaces with a regex -- not really ideal, but without pulling in
@@ -50,7 +52,7 @@ class XCIParser(DepParser):
             value = ET.fromstring(xml).find('spirit:componentInstances/spirit:componentInstance/spirit:instanceName', nsmap)
             if not value is None:
                 module_name = value.text
-                logging.debug("found module %s.%s", dep_file.library, module_name)
+                logger.debug("found module %s.%s", dep_file.library, module_name)
                 dep_file.add_provide(
                     DepRelation(module_name, dep_file.library, DepRelation.MODULE))
 
@@ -27,6 +27,7 @@ from __future__ import absolute_import
 
 from .makefilesyn import MakefileSyn
 from ..sourcefiles.srcfile import VerilogFile, PCFFile
+from .primitives import ICE40_PRIMITIVES
 
 
 class ToolIcestorm(MakefileSyn):
@@ -42,6 +43,8 @@ class ToolIcestorm(MakefileSyn):
 
     STANDARD_LIBS = []
 
+    PRIMITIVES = ICE40_PRIMITIVES
+
     SUPPORTED_FILES = {PCFFile: None}
 
     HDL_FILES = {VerilogFile: 'read_verilog $(sourcefile)'}
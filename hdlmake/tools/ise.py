@@ -32,6 +32,7 @@ from .makefilesyn import MakefileSyn
 from ..util import shell
 from ..sourcefiles.srcfile import (VHDLFile, VerilogFile, SVFile,
                                    UCFFile, CDCFile, NGCFile, BMMFile, XCOFile)
+from .primitives import XILINX_PRIMITIVES
 
 FAMILY_NAMES = {
     "XC6S": "Spartan6",
@@ -62,6 +63,8 @@ class ToolISE(MakefileSyn):
     STANDARD_LIBS = ['ieee', 'ieee_proposed', 'iSE', 'simprims', 'std',
                      'synopsys', 'unimacro', 'unisim', 'XilinxCoreLib']
 
+    PRIMITIVES = XILINX_PRIMITIVES
+
     SUPPORTED_FILES = {
         UCFFile: 'xfile add $(sourcefile)',
         CDCFile: 'xfile add $(sourcefile)',
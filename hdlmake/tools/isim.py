@@ -33,6 +33,7 @@ import logging
 from .makefilesim import MakefileSim
 from ..util import shell
 from ..sourcefiles.srcfile import VerilogFile, VHDLFile
+from .primitives import XILINX_PRIMITIVES
 
 
 class ToolISim(MakefileSim):
@@ -51,6 +52,8 @@ class ToolISim(MakefileSim):
                      'simprims_ver', 'unisims_ver', 'uni9000_ver',
                      'unimacro_ver', 'xilinxcorelib_ver', 'secureip']
 
+    PRIMITIVES = XILINX_PRIMITIVES
+
     HDL_FILES = {VerilogFile: '', VHDLFile: ''}
 
     CLEAN_TARGETS = {'clean': ["xilinxsim.ini $(LIBS)", "fuse.xmsgs",
@@ -116,7 +119,8 @@ class ToolISim(MakefileSim):
     def _makefile_syn_file_rule(self, file_aux):
         """Generate target and prerequisites for :param file_aux:"""
         self.write("{}: {} ".format(self.get_stamp_file(file_aux), file_aux.rel_path()))
-        self.writeln(' '.join([fname.rel_path() for fname in file_aux.depends_on]))
+        self.writeln(' '.join([fname.rel_path()
+                               for fname in self.get_dependencies(file_aux)]))
 
     def _makefile_sim_compilation(self):
         """Print the compile simulation target for Xilinx ISim"""
@@ -197,7 +201,7 @@ fuse:
             # recompile only what is needed (out of date)
             # if len(vhdl_file.depends_on) != 0:
             self.write(os.path.join(lib, purename, "." + purename) + ":")
-            for dep_file in vhdl_file.depends_on:
+            for dep_file in self.get_dependencies(vhdl_file):
                 self.write(" \\\n" + self.get_stamp_file(dep_file))
             self.write('\n')
             self._makefile_touch_stamp_file()
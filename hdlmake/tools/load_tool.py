@@ -3,6 +3,8 @@
 
 import logging
 
+logger = logging.getLogger(__name__)
+
 def load_syn_tool(tool_name):
     """Funtion that checks the provided module_pool and generate an
     initialized instance of the the appropriated synthesis tool"""
@@ -23,7 +25,7 @@ def load_syn_tool(tool_name):
                        'liberosoc': ToolLiberoSoC,
                        'icestorm': ToolIcestorm}
     if tool_name in available_tools:
-        logging.debug("Synthesis tool to be used found: %s", tool_name)
+        logger.debug("Synthesis tool to be used found: %s", tool_name)
         return available_tools[tool_name]()
     else:
         raise Exception("Unknown synthesis tool: " + tool_name
@@ -48,7 +50,7 @@ def load_sim_tool(tool_name):
                        'ghdl': ToolGHDL,
                        'vivado_sim': ToolVivadoSim}
     if tool_name in available_tools:
-        logging.debug("Simulation tool to be used found: %s", tool_name)
+        logger.debug("Simulation tool to be used found: %s", tool_name)
         return available_tools[tool_name]()
     else:
         raise Exception("Unknown simulation tool: " + tool_name
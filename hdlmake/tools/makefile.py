@@ -30,6 +30,10 @@ import six
 
 from ..util import shell
 from ..util import path as path_mod
+from ..util import context as context_mod
+from ..sourcefiles import new_dep_solver as dep_solver
+
+logger = logging.getLogger(__name__)
 
 
 class ToolMakefile(object):
@@ -39,6 +43,7 @@ class ToolMakefile(object):
     HDL_FILES = {}
     TOOL_INFO = {}
     STANDARD_LIBS = []
+    PRIMITIVES = frozenset()
     CLEAN_TARGETS = {}
     SUPPORTED_FILES = {}
 
@@ -47,6 +52,8 @@ class ToolMakefile(object):
         self._file = None
         self._initialized = False
         self.fileset = None
+        self.dep_graph = None
+        self.context = context_mod.current()
         self.manifest_dict = {}
         self._filename = "Makefile"
 
@@ -58,6 +65,10 @@ class ToolMakefile(object):
         """Get the standard libs supported by the tool"""
         return self.STANDARD_LIBS
 
+    def get_primitives(self):
+        """Get the primitives and vendor library units provided by the tool"""
+        return self.PRIMITIVES
+
     def get_parseable_files(self):
         """Get the parseable HDL file types supported by the tool"""
         return self.HDL_FILES
@@ -73,13 +84,33 @@ class ToolMakefile(object):
         if filename:
             self._filename = filename
 
+    def get_compile_waves(self):
+        """Get the HDL files grouped in waves that can be compiled in
+        parallel, every wave depending only on the previous ones"""
+        return dep_solver.make_dependency_waves(self.fileset,
+                                                dep_graph=self.dep_graph)
+
+    def get_dependencies(self, dep_file):
+        """Get the files the given file depends on, from the compact
+        dependency graph if available"""
+        if self.dep_graph is not None and dep_file in self.dep_graph:
+            return self.dep_graph.get_dependencies(dep_file)
+        return dep_file.depends_on
+
+    def get_included_files(self, dep_file):
+        """Get the paths of the files included by the given file, from the
+        compact dependency graph if available"""
+        if self.dep_graph is not None and dep_file in self.dep_graph:
+            return self.dep_graph.get_included_files(dep_file)
+        return dep_file.included_files
+
     def _get_path(self):
         """Get the directory in which the tool binary is at Host"""
         bin_name = self.get_tool_bin()
         locations = shell.which(bin_name)
         if len(locations) == 0:
             return None
-        logging.debug("location for %s: %s", bin_name, locations[0])
+        logger.debug("location for %s: %s", bin_name, locations[0])
         return os.path.dirname(locations[0])
 
     def _is_in_path(self, path_key):
@@ -110,31 +141,31 @@ class ToolMakefile(object):
     def makefile_check_tool(self, path_key):
         """Check if the binary is available in the O.S. environment"""
         name = self.TOOL_INFO['name']
-        logging.debug("Checking if " + name + " tool is available on PATH")
+        logger.debug("Checking if " + name + " tool is available on PATH")
         if path_key in self.manifest_dict:
             if self._is_in_path(path_key):
-                logging.info("%s found under HDLMAKE_%s: %s",
-                             name, path_key.upper(),
-                             self.manifest_dict[path_key])
+                logger.info("%s found under HDLMAKE_%s: %s",
+                            name, path_key.upper(),
+                            self.manifest_dict[path_key])
             else:
-                logging.warning("%s NOT found under HDLMAKE_%s: %s",
-                                name, path_key.upper(),
-                                self.manifest_dict[path_key])
+                logger.warning("%s NOT found under HDLMAKE_%s: %s",
+                               name, path_key.upper(),
+                               self.manifest_dict[path_key])
                 self.manifest_dict[path_key] = ''
         else:
             if self._check_in_system_path():
                 self.manifest_dict[path_key] = self._get_path()
-                logging.info("%s found in system PATH: %s",
-                             name, self.manifest_dict[path_key])
+                logger.info("%s found in system PATH: %s",
+                            name, self.manifest_dict[path_key])
             else:
-                logging.warning("%s cannnot be found in system PATH", name)
+                logger.warning("%s cannnot be found in system PATH", name)
                 self.manifest_dict[path_key] = ''
 
     def makefile_includes(self):
         """Add the included makefiles that need to be previously loaded"""
         if self.manifest_dict.get("incl_makefiles") is not None:
             for file_aux in self.manifest_dict["incl_makefiles"]:
-                if os.path.exists(file_aux):
+                if path_mod.path_exists(file_aux):
                     self.writeln("include %s" % file_aux)
             self.writeln()
 
@@ -159,10 +190,11 @@ class ToolMakefile(object):
 
     def initialize(self):
         """Open the Makefile file and print a header"""
-        if os.path.exists(self._filename):
-            os.remove(self._filename)
+        filename = self.context.abspath(self._filename)
+        if os.path.exists(filename):
+            os.remove(filename)
 
-        self._file = open(self._filename, "w")
+        self._file = open(filename, "w")
         self.writeln("########################################")
         self.writeln("#  This file was generated by hdlmake  #")
         self.writeln("#  http://ohwr.org/projects/hdl-make/  #")
@@ -1,7 +1,6 @@
 """Module providing the simulation functionality for writing Makefiles"""
 
 from __future__ import absolute_import
-import os
 import sys
 import logging
 
@@ -86,16 +85,17 @@ TOP_MODULE := {top_module}
 
     def _makefile_sim_file_rule(self, file_aux):
         """Generate target and prerequisites for :param file_aux:"""
-        cwd = os.getcwd()
+        cwd = self.context.root_dir
         self.write("{}: {}".format(self.get_stamp_file(file_aux), file_aux.rel_path()))
         # list dependencies, do not include the target file
-        for dep_file in sorted(file_aux.depends_on, key=(lambda x: x.path)):
+        for dep_file in sorted(self.get_dependencies(file_aux),
+                               key=(lambda x: x.path)):
             if dep_file is file_aux:
                 # Do not depend on itself.
                 continue
             self.write(" \\\n" + self.get_stamp_file(dep_file))
         # Add included files
-        for dep_file in sorted(file_aux.included_files):
+        for dep_file in sorted(self.get_included_files(file_aux)):
             self.write(" \\\n{}".format(path_mod.relpath(dep_file, cwd)))
         self.writeln()
 
@@ -9,6 +9,8 @@ from ..util import shell
 
 from ..sourcefiles.srcfile import VerilogFile, SVFile
 
+logger = logging.getLogger(__name__)
+
 
 def _check_synthesis_manifest(top_manifest):
     """Check the manifest contains all the keys for a synthesis project"""
@@ -41,7 +43,7 @@ class MakefileSyn(ToolMakefile):
         self._makefile_syn_clean()
         self._makefile_syn_phony()
         self.makefile_close()
-        logging.info(self.TOOL_INFO['name'] + " synthesis makefile generated.")
+        logger.info(self.TOOL_INFO['name'] + " synthesis makefile generated.")
 
     def _makefile_syn_top(self):
         """Create the top part of the synthesis Makefile"""
@@ -28,6 +28,7 @@ from __future__ import absolute_import
 import os
 
 from .makefilevsim import MakefileVsim
+from .primitives import ALTERA_PRIMITIVES
 
 
 class ToolModelsim(MakefileVsim):
@@ -41,6 +42,8 @@ class ToolModelsim(MakefileVsim):
 
     STANDARD_LIBS = ['ieee', 'std', 'altera_mf']
 
+    PRIMITIVES = ALTERA_PRIMITIVES
+
     CLEAN_TARGETS = {'clean': ["modelsim.ini", "transcript"],
                      'mrproper': ["*.vcd", "*.wlf"]}
 
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Hdlmake.
+#
+# Hdlmake is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Hdlmake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Hdlmake.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Catalogs of the primitives and vendor library units that are provided
+by the tools, so they do not need to be found in any source file"""
+
+# Most used cells from the Xilinx UNISIM library
+XILINX_PRIMITIVES = frozenset([
+    'bufg', 'bufgce', 'bufgce_div', 'bufgctrl', 'bufgmux', 'bufgmux_ctrl',
+    'bufh', 'bufhce', 'bufio', 'bufio2', 'bufmr', 'bufmrce', 'bufr',
+    'ibuf', 'ibufg', 'ibufds', 'ibufds_diff_out', 'ibufds_gte2',
+    'ibufds_gte3', 'ibufds_gte4', 'ibufgds', 'iobuf', 'iobufds', 'obuf',
+    'obufds', 'obuft', 'obuftds', 'pullup', 'pulldown', 'keeper',
+    'iddr', 'iddr2', 'iddre1', 'oddr', 'oddr2', 'oddre1',
+    'idelaye2', 'idelaye3', 'odelaye2', 'odelaye3', 'idelayctrl',
+    'iodelay2', 'iserdes2', 'iserdese2', 'iserdese3', 'oserdes2',
+    'oserdese2', 'oserdese3',
+    'dcm_sp', 'dcm_clkgen', 'pll_adv', 'pll_base',
+    'mmcme2_adv', 'mmcme2_base', 'mmcme3_adv', 'mmcme3_base',
+    'mmcme4_adv', 'mmcme4_base', 'plle2_adv', 'plle2_base',
+    'plle3_adv', 'plle3_base', 'plle4_adv', 'plle4_base',
+    'fdce', 'fdpe', 'fdre', 'fdse', 'ldce', 'ldpe',
+    'lut1', 'lut2', 'lut3', 'lut4', 'lut5', 'lut6', 'lut6_2',
+    'muxf7', 'muxf8', 'carry4', 'carry8', 'srl16e', 'srlc32e',
+    'ramb16bwer', 'ramb18e1', 'ramb36e1', 'ramb18e2', 'ramb36e2',
+    'fifo18e1', 'fifo36e1', 'fifo18e2', 'fifo36e2',
+    'dsp48a1', 'dsp48e1', 'dsp48e2',
+    'startup_spartan6', 'startupe2', 'startupe3', 'icap_spartan6',
+    'icape2', 'icape3', 'bscan_spartan6', 'bscane2', 'dna_port', 'xadc',
+    'sysmone1', 'sysmone4', 'gtpe2_channel', 'gtpe2_common',
+    'gtxe2_channel', 'gtxe2_common', 'gthe2_channel', 'gthe2_common',
+    'gnd', 'vcc', 'glbl'])
+
+# Altera/Intel megafunctions (altera_mf, lpm) and low level primitives
+ALTERA_PRIMITIVES = frozenset([
+    'altsyncram', 'altdpram', 'altshift_taps', 'altpll', 'altera_pll',
+    'altclkctrl', 'altddio_in', 'altddio_out', 'altddio_bidir',
+    'altiobuf_in', 'altiobuf_out', 'altiobuf_bidir', 'altlvds_rx',
+    'altlvds_tx', 'altmult_add', 'altmult_accum', 'altsource_probe',
+    'dcfifo', 'dcfifo_mixed_widths', 'scfifo', 'sld_virtual_jtag',
+    'sld_signaltap',
+    'lpm_add_sub', 'lpm_compare', 'lpm_constant', 'lpm_counter',
+    'lpm_decode', 'lpm_divide', 'lpm_ff', 'lpm_mult', 'lpm_mux',
+    'lpm_ram_dq', 'lpm_rom', 'lpm_shiftreg',
+    'alt_inbuf', 'alt_inbuf_diff', 'alt_outbuf', 'alt_outbuf_diff',
+    'alt_outbuf_tri', 'alt_iobuf', 'global', 'lcell', 'dffe', 'opndrn',
+    'tri'])
+
+# Lattice iCE40 technology library
+ICE40_PRIMITIVES = frozenset([
+    'sb_io', 'sb_gb', 'sb_gb_io', 'sb_pll40_core', 'sb_pll40_pad',
+    'sb_pll40_2_pad', 'sb_pll40_2f_core', 'sb_pll40_2f_pad',
+    'sb_ram40_4k', 'sb_ram40_4knr', 'sb_ram40_4knw', 'sb_ram40_4knrnw',
+    'sb_dff', 'sb_dffe', 'sb_dffr', 'sb_dffs', 'sb_dffer', 'sb_dffes',
+    'sb_dffsr', 'sb_dffesr', 'sb_lut4', 'sb_carry', 'sb_warmboot',
+    'sb_hfosc', 'sb_lfosc', 'sb_spram256ka', 'sb_mac16', 'sb_rgba_drv',
+    'sb_i2c', 'sb_spi', 'sb_ledda_ip'])
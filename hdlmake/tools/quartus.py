@@ -24,7 +24,6 @@
 """Module providing support for Altera Quartus synthesis"""
 
 from __future__ import absolute_import
-import os
 import sys
 import logging
 
@@ -34,6 +33,9 @@ from ..util import shell
 from ..sourcefiles.srcfile import (VHDLFile, VerilogFile, SVFile, DPFFile,
                                    SignalTapFile, SDCFile, QIPFile, QSYSFile,
                                    QSFFile, BSFFile, BDFFile, TDFFile, GDFFile)
+from .primitives import ALTERA_PRIMITIVES
+
+logger = logging.getLogger(__name__)
 
 
 class ToolQuartus(MakefileSyn):
@@ -49,6 +51,8 @@ class ToolQuartus(MakefileSyn):
 
     STANDARD_LIBS = ['altera', 'altera_mf', 'lpm', 'ieee', 'std']
 
+    PRIMITIVES = ALTERA_PRIMITIVES
+
     _QUARTUS_SOURCE = 'set_global_assignment -name {0} $(sourcefile)'
 
     SUPPORTED_FILES = {
@@ -126,7 +130,7 @@ class ToolQuartus(MakefileSyn):
                 for key in family_names:
                     if re.match(key, device.upper()):
                         family = family_names[key]
-                        logging.debug(
+                        logger.debug(
                             "Auto-guessed syn_family to be %s (%s => %s)",
                             family, device, key)
             if family is None:
@@ -213,9 +217,9 @@ class ToolQuartus(MakefileSyn):
         if "quartus_preflow" in self.manifest_dict:
             path = shell.tclpath(path_mod.compose(
                 self.manifest_dict["quartus_preflow"]))
-            if not os.path.exists(path):
+            if not path_mod.path_exists(path):
                 raise Exception("quartus_preflow file listed in "
-                                + os.getcwd() + " doesn't exist: "
+                                + self.context.root_dir + " doesn't exist: "
                                 + path + ".\nExiting.")
             preflow = '"' + 'quartus_sh:' + path + '"'
             command_list.append(self._emit_property(self.SET_GLOBAL_ASSIGNMENT,
@@ -224,9 +228,9 @@ class ToolQuartus(MakefileSyn):
         if "quartus_postmodule" in self.manifest_dict:
             path = shell.tclpath(path_mod.compose(
                 self.manifest_dict["quartus_postmodule"]))
-            if not os.path.exists(path):
+            if not path_mod.path_exists(path):
                 raise Exception("quartus_postmodule file listed in "
-                                + os.getcwd() + " doesn't exist: "
+                                + self.context.root_dir + " doesn't exist: "
                                 + path + ".\nExiting.")
             postmodule = '"' + 'quartus_sh:' + path + '"'
             command_list.append(self._emit_property(self.SET_GLOBAL_ASSIGNMENT,
@@ -235,9 +239,9 @@ class ToolQuartus(MakefileSyn):
         if "quartus_postflow" in self.manifest_dict:
             path = shell.tclpath(path_mod.compose(
                 self.manifest_dict["quartus_postflow"]))
-            if not os.path.exists(path):
+            if not path_mod.path_exists(path):
                 raise Exception("quartus_postflow file listed in "
-                                + os.getcwd() + " doesn't exist: "
+                                + self.context.root_dir + " doesn't exist: "
                                 + path + ".\nExiting.")
             postflow = '"' + 'quartus_sh:' + path + '"'
             command_list.append(self._emit_property(self.SET_GLOBAL_ASSIGNMENT,
@@ -26,6 +26,7 @@
 
 from __future__ import print_function
 from .makefilevsim import MakefileVsim
+from .primitives import XILINX_PRIMITIVES
 
 # as of 2014.06, these are the standard libraries
 # included in an installation
@@ -74,6 +75,8 @@ class ToolRiviera(MakefileVsim):
 
     STANDARD_LIBS = RIVIERA_STANDARD_LIBS
 
+    PRIMITIVES = XILINX_PRIMITIVES
+
     CLEAN_TARGETS = {'clean': ["*.asdb"],
                      'mrproper': ["*.vcd"]}
 
@@ -27,6 +27,7 @@
 from __future__ import absolute_import
 from .makefilesim import MakefileSim
 from ..sourcefiles.srcfile import VerilogFile, VHDLFile, SVFile
+from .primitives import XILINX_PRIMITIVES
 
 class ToolVivadoSim(MakefileSim):
 
@@ -41,6 +42,8 @@ class ToolVivadoSim(MakefileSim):
 
     STANDARD_LIBS = ['ieee', 'std']
 
+    PRIMITIVES = XILINX_PRIMITIVES
+
     HDL_FILES = {VerilogFile: '', VHDLFile: '', SVFile: ''}
 
     CLEAN_TARGETS = {'clean': [".Xil", "*.jou", "*.log", "*.pb",
@@ -27,8 +27,11 @@
 from __future__ import absolute_import
 from .makefilesyn import MakefileSyn
 from ..sourcefiles.srcfile import VHDLFile, VerilogFile, SVFile, TCLFile
+from .primitives import XILINX_PRIMITIVES
 import logging
 
+logger = logging.getLogger(__name__)
+
 
 class ToolXilinx(MakefileSyn):
 
@@ -45,6 +48,8 @@ class ToolXilinx(MakefileSyn):
 
     SUPPORTED_FILES = {TCLFile: 'source $(sourcefile)'}
 
+    PRIMITIVES = XILINX_PRIMITIVES
+
     CLEAN_TARGETS = {'mrproper': ["*.bit", "*.bin"]}
 
     _XILINX_RUN = '''\
@@ -112,7 +117,7 @@ $(TCL_CLOSE)'''
                     if name_list[1] == "options":
                         tmp = prop_opt
                     else:
-                        logging.error('Unknown project property: %s', prop[0])
+                        logger.error('Unknown project property: %s', prop[0])
                 if len(prop) == 2:
                     name_hierarchy = name_list[0].split(".")
                     if name_hierarchy[0] == "steps":
@@ -128,7 +133,7 @@ $(TCL_CLOSE)'''
                 elif len(prop) == 3:
                     project_new.append(tmp.format(prop[0], prop[1], prop[2]))
                 else:
-                    logging.error('Unknown project property: %s', prop[0])
+                    logger.error('Unknown project property: %s', prop[0])
         tmp_dict = {}
         tmp_dict["project"] = self._tcl_controls["project"]
         tmp_dict["synthesize"] = self._tcl_controls["synthesize"]
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Hdlmake.
+#
+# Hdlmake is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Hdlmake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Hdlmake.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+"""Module providing the context of an hdlmake run: the state that used to
+be taken from the process (current directory, shell flavour, logging), so
+that several runs can be executed concurrently in the same process"""
+
+from __future__ import absolute_import
+import contextlib
+import logging
+import os
+import threading
+
+
+# The modules of hdlmake log through the children of this logger
+LOGGER_NAME = "hdlmake"
+
+_local = threading.local()
+_dispatch_handler = []
+_dispatch_lock = threading.Lock()
+
+
+class Context(object):
+
+    """State of an hdlmake run.
+
+    root_dir is the directory of the top manifest: the relative paths
+    handled by hdlmake (module paths, output files, shell commands) are
+    relative to it.  commands_os selects the flavour of the shell commands
+    ('auto', 'unix' or 'windows').  If a logger is given, the messages of
+    the run are sent to it, at the level of that logger whatever the level
+    of the root logger.  An isolated run never changes the process
+    state, so the manifests are evaluated without changing the current
+    directory or sys.stdout."""
+
+    def __init__(self, root_dir=None, commands_os='auto', logger=None,
+                 isolated=False):
+        self.root_dir = os.path.abspath(root_dir or os.getcwd())
+        self.commands_os = commands_os
+        self.logger = logger
+        self.isolated = isolated
+        # Per-run caches
+        self.fs_cache = None
+        # (parent, purged keys, InheritedContext) of the last manifest
+        self.inherited_context = None
+
+    def abspath(self, path):
+        """Get the absolute path of a path relative to the root directory"""
+        return os.path.normpath(os.path.join(self.root_dir, path))
+
+    @contextlib.contextmanager
+    def activate(self):
+        """Make this context the current one of the thread in the with
+        block"""
+        if self.logger is not None and len(_dispatch_handler) == 0:
+            _install_dispatch_handler()
+        previous = getattr(_local, "context", None)
+        _local.context = self
+        try:
+            yield self
+        finally:
+            _local.context = previous
+
+    def bind(self, function):
+        """Wrap the function so it runs with this context as the current
+        one, e.g. in the threads of a pool"""
+        def _run_in_context(*args, **kwargs):
+            with self.activate():
+                return function(*args, **kwargs)
+        return _run_in_context
+
+
+class _DispatchHandler(logging.Handler):
+
+    """Handler of the hdlmake logger sending the records emitted by the
+    threads of a run to the logger of its context.  The records emitted
+    outside of such a run are handled as if they were propagated to the
+    root logger"""
+
+    def emit(self, record):
+        context = getattr(_local, "context", None)
+        if context is None or context.logger is None:
+            root = logging.getLogger()
+            if root.isEnabledFor(record.levelno):
+                root.callHandlers(record)
+            return
+        # The logger of the run may propagate the record back to us
+        if (getattr(_local, "dispatching", False)
+                or not context.logger.isEnabledFor(record.levelno)):
+            return
+        _local.dispatching = True
+        try:
+            context.logger.handle(record)
+        finally:
+            _local.dispatching = False
+
+
+def _install_dispatch_handler():
+    """Make the hdlmake logger send its records to the dispatch handler
+    only.  Its level is the lowest one, so the records are only filtered
+    by the level of the run (or of the root logger outside of the runs)"""
+    with _dispatch_lock:
+        if len(_dispatch_handler) > 0:
+            return
+        handler = _DispatchHandler()
+        hdlmake_logger = logging.getLogger(LOGGER_NAME)
+        hdlmake_logger.addHandler(handler)
+        hdlmake_logger.propagate = False
+        hdlmake_logger.setLevel(1)
+        _dispatch_handler.append(handler)
+
+
+class _ProcessContext(Context):
+
+    """Context used outside of the runs, taken from the process state"""
+
+    @property
+    def root_dir(self):
+        return os.getcwd()
+
+    @root_dir.setter
+    def root_dir(self, _):
+        pass
+
+
+_process_context = _ProcessContext()
+
+
+def current():
+    """Get the context of the run in the current thread.  Outside of a run,
+    the context of the process (its current directory) is returned"""
+    context = getattr(_local, "context", None)
+    if context is None:
+        return _process_context
+    return context
@@ -24,7 +24,27 @@
 
 from __future__ import print_function
 from __future__ import absolute_import
+import fnmatch
+import logging
 import os
+import re
+import stat
+import sys
+
+from . import context as context_mod
+
+logger = logging.getLogger(__name__)
+
+
+def sparse_parse(url):
+    """
+    Filter the sparse paths of a remote module: the module URL is followed
+    by '#' and a comma separated list of the directories to check out
+    """
+    if "#" in url:
+        url_clean, paths = url.split("#", 1)
+        return (url_clean, [p for p in paths.split(",") if p])
+    return (url, None)
 
 
 def url_parse(url):
@@ -71,6 +91,19 @@ def url_basename(url):
     return ret
 
 
+def archive_basename(url):
+    """
+    Get basename from an archive url: the file name without the archive
+    extension
+    """
+    name = url.rstrip("/").split("/")[-1]
+    for extension in (".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz",
+                      ".txz", ".tar", ".zip"):
+        if name.lower().endswith(extension):
+            return name[:-len(extension)]
+    return name
+
+
 def svn_basename(url):
     """
     Get basename from an SVN url
@@ -88,13 +121,20 @@ def is_abs_path(path):
     return os.path.isabs(path)
 
 
+def abspath(path):
+    """Get the absolute path, relative paths are taken from the root
+    directory of the current run"""
+    return context_mod.current().abspath(path)
+
+
 def relpath(path1, path2=None):
-    """Return the relative path of one path with respect to the other"""
+    """Return the relative path of one path with respect to the other
+    (the root directory of the current run by default)"""
     if path2 is None:
-        path2 = os.getcwd()
+        path2 = context_mod.current().root_dir
     if path1 == path2:
         return '.'
-    return os.path.relpath(path1, path2)
+    return os.path.relpath(abspath(path1), abspath(path2))
 
 
 def rel2abs(path, base):
@@ -110,15 +150,14 @@ def rel2abs(path, base):
     if os.path.isabs(path):
         return path
     retval = os.path.join(base, path)
-    return os.path.abspath(retval)
+    return abspath(retval)
 
 
 def compose(path, base=None):
     """Get the relative path composition of the provided path"""
-    if base is None:
-        base = os.getcwd()
-    return os.path.relpath(os.path.abspath(
-        os.path.join(base, path)))
+    root_dir = context_mod.current().root_dir
+    base = abspath(base or root_dir)
+    return os.path.relpath(abspath(os.path.join(base, path)), root_dir)
 
 
 def flatten_list(sth):
@@ -129,3 +168,229 @@ def flatten_list(sth):
     else:
         sth = []
     return sth
+
+
+def get_cache_dir(cache_dir=None, subdir=None):
+    """Get the directory used by hdlmake to cache data between runs:
+    the given one, $HDLMAKE_CACHE_DIR or ~/.cache/hdlmake"""
+    if cache_dir is None:
+        cache_dir = os.environ.get("HDLMAKE_CACHE_DIR")
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.expanduser("~"), ".cache", "hdlmake")
+    cache_dir = abspath(cache_dir)
+    if subdir is not None:
+        cache_dir = os.path.join(cache_dir, subdir)
+    return cache_dir
+
+
+def tree_size(path):
+    """Get the total size in bytes of the files of a tree"""
+    size = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                size += os.path.getsize(os.path.join(dirpath, filename))
+            except OSError:
+                pass
+    return size
+
+
+class FsCache(object):
+
+    """Per-run cache of the file system: the directory listings (path ->
+    (sorted (name, is_dir, is_symlink) entries, complete listing)) and the
+    kind of the paths (path -> 'file', 'dir', 'other' or None if missing),
+    with the count of the calls done and avoided"""
+
+    def __init__(self):
+        self.dirs = {}
+        self.kinds = {}
+        self.stats = {"syscalls": 0, "avoided": 0}
+
+
+def fs_cache():
+    """Get the file system cache of the current run"""
+    context = context_mod.current()
+    if context.fs_cache is None:
+        context.fs_cache = FsCache()
+    return context.fs_cache
+
+
+def reset_fs_cache():
+    """Forget everything the file system cache knows"""
+    context_mod.current().fs_cache = FsCache()
+
+
+def invalidate_fs_cache(path):
+    """Forget what is known about the path, its parent directory listing
+    and everything below it, after it has been changed on disk"""
+    cache = fs_cache()
+    path = abspath(path)
+    prefix = os.path.join(path, "")
+    for entries in (cache.dirs, cache.kinds):
+        for key in list(entries):
+            if key == path or key.startswith(prefix):
+                del entries[key]
+    cache.dirs.pop(os.path.dirname(path), None)
+
+
+def report_fs_cache():
+    """Log the file system cache statistics"""
+    stats = fs_cache().stats
+    logger.debug("File system cache: %d calls done, %d avoided.",
+                 stats["syscalls"], stats["avoided"])
+
+
+def scan_dir(path):
+    """Get the sorted (name, is_dir, is_symlink) entries of the directory,
+    listing it only once per run.  Empty if it cannot be listed"""
+    cache = fs_cache()
+    path = abspath(path)
+    cached = cache.dirs.get(path)
+    if cached is not None:
+        cache.stats["avoided"] += 1
+        if hasattr(sys, "audit"):
+            # Let the manifest cache know the directory has been read.
+            sys.audit("hdlmake.scan_dir", path)
+        return cached[0]
+    cache.stats["syscalls"] += 1
+    entries = []
+    complete = True
+    try:
+        if hasattr(os, "scandir"):
+            for entry in os.scandir(path):
+                entries.append((entry.name, entry.is_dir(),
+                                entry.is_symlink()))
+                if entry.is_dir():
+                    cache.kinds[entry.path] = 'dir'
+                elif entry.is_file():
+                    cache.kinds[entry.path] = 'file'
+        else:
+            for name in os.listdir(path):
+                name_path = os.path.join(path, name)
+                entries.append((name, os.path.isdir(name_path),
+                                os.path.islink(name_path)))
+    except OSError:
+        complete = False
+    entries.sort()
+    cache.dirs[path] = (entries, complete)
+    if complete:
+        cache.kinds[path] = 'dir'
+    return entries
+
+
+def list_dir(path):
+    """Get the sorted names in the directory (cached os.listdir).  Raise
+    OSError if it cannot be listed"""
+    entries = scan_dir(path)
+    if not fs_cache().dirs[abspath(path)][1]:
+        raise OSError("Cannot list the directory: {}".format(path))
+    return [name for name, _, _ in entries]
+
+
+def _path_kind(path):
+    """Get the cached kind of the path: 'file', 'dir', 'other' or None if
+    it does not exist"""
+    cache = fs_cache()
+    path = abspath(path)
+    if path in cache.kinds:
+        cache.stats["avoided"] += 1
+        return cache.kinds[path]
+    parent, name = os.path.split(path)
+    listing = cache.dirs.get(parent)
+    if listing is not None and listing[1] and os.path.normcase(name) not in [
+            os.path.normcase(name_aux) for name_aux, _, _ in listing[0]]:
+        # Not in the complete listing of its directory
+        cache.stats["avoided"] += 1
+        kind = None
+    else:
+        cache.stats["syscalls"] += 1
+        try:
+            mode = os.stat(path).st_mode
+        except OSError:
+            kind = None
+        else:
+            if stat.S_ISDIR(mode):
+                kind = 'dir'
+            elif stat.S_ISREG(mode):
+                kind = 'file'
+            else:
+                kind = 'other'
+    cache.kinds[path] = kind
+    return kind
+
+
+def path_exists(path):
+    """Cached os.path.exists"""
+    return _path_kind(path) is not None
+
+
+def path_isdir(path):
+    """Cached os.path.isdir"""
+    return _path_kind(path) == 'dir'
+
+
+def path_isfile(path):
+    """Cached os.path.isfile"""
+    return _path_kind(path) == 'file'
+
+
+def has_magic(pattern):
+    """Check if the path is a glob pattern"""
+    return re.search(r"[*?[{]", pattern) is not None
+
+
+def _expand_braces(pattern):
+    """Expand the first {a,b,...} group of the pattern, recursively"""
+    match = re.search(r"\{([^{}]*)\}", pattern)
+    if match is None:
+        return [pattern]
+    patterns = []
+    for alternative in match.group(1).split(","):
+        patterns.extend(_expand_braces(
+            pattern[:match.start()] + alternative + pattern[match.end():]))
+    return patterns
+
+
+def _walk_dirs(path):
+    """Get the directory and all its subdirectories (without following
+    the symbolic links)"""
+    dirs = [path]
+    for name, is_dir, is_symlink in scan_dir(path):
+        if is_dir and not is_symlink:
+            dirs.extend(_walk_dirs(os.path.join(path, name)))
+    return dirs
+
+
+def glob_files(pattern, base=None):
+    """Get the sorted absolute paths of the files matching the pattern,
+    relative to base (current directory by default).  Besides the usual
+    '*', '?' and '[...]' wildcards, '**' matches any number of
+    subdirectories and '{a,b}' any of the alternatives, e.g.
+    'rtl/**/*.{vhd,v}'"""
+    base = abspath(base or context_mod.current().root_dir)
+    found = set()
+    for pattern_aux in _expand_braces(pattern):
+        pattern_aux = os.path.join(base, pattern_aux)
+        drive, pattern_aux = os.path.splitdrive(pattern_aux)
+        parts = pattern_aux.replace("\\", "/").split("/")
+        current = [drive + "/"]
+        for index, part in enumerate(parts):
+            last = index == len(parts) - 1
+            if part in ("", "."):
+                continue
+            matched = []
+            for dir_aux in current:
+                if part == "**":
+                    matched.extend(_walk_dirs(dir_aux))
+                elif not has_magic(part):
+                    matched.append(os.path.join(dir_aux, part))
+                else:
+                    matched.extend([
+                        os.path.join(dir_aux, name)
+                        for name, is_dir, _ in scan_dir(dir_aux)
+                        if fnmatch.fnmatch(name, part) and (is_dir or last)])
+            current = matched
+        found.update([os.path.normpath(path_aux) for path_aux in current
+                      if path_isfile(path_aux)])
+    return sorted(found)
@@ -28,41 +28,54 @@ import os
 import sys
 import platform
 import logging
-from subprocess import PIPE, Popen, CalledProcessError
+from subprocess import PIPE, Popen, CalledProcessError, call
 
+from . import context as context_mod
 
-commands_os = 'auto'
+logger = logging.getLogger(__name__)
 
 
 def set_commands_os(name):
-    """Select the OS for commands"""
-    global commands_os
+    """Select the OS for commands of the current run"""
     if name == 'windows' and not check_windows_tools():
-        logging.warning("Setting 'make' to windows may not work on non-windows platforms")
-    commands_os = name
+        logger.warning("Setting 'make' to windows may not work on non-windows platforms")
+    context_mod.current().commands_os = name
 
 
 def run(command):
-    """Execute a command in the shell and print the output lines as a list"""
+    """Execute a command in the shell and return the first output line"""
+    lines = run_lines(command)
+    if len(lines) == 0:
+        return None
+    return lines[0]
+
+
+def run_lines(command):
+    """Execute a command in the shell and return the output lines as a list.
+    The command is run from the root directory of the current run"""
     try:
-        logging.debug("run: {}".format(command))
+        logger.debug("run: {}".format(command))
         command_out = Popen(command,
             stdout=PIPE,
             stdin=PIPE,
             stderr=PIPE,
             close_fds=not check_windows_tools(), # FIXME: comment
-            shell=True)
+            shell=True,
+            cwd=context_mod.current().root_dir)
         lines = command_out.stdout.readlines()
         if command_out.wait() != 0:
-            logging.error("Shell command failed: %s", command)
-            quit(1)
-        if len(lines) == 0:
-            return None
-        return lines[0].strip().decode('utf-8')
+            raise Exception("Shell command failed: {}".format(command))
+        return [line.strip().decode('utf-8') for line in lines]
     except CalledProcessError as process_error:
-        logging.error("Cannot execute the shell command: %s",
-            process_error.output)
-        quit(1)
+        raise Exception("Cannot execute the shell command: {}".format(
+            process_error.output))
+
+
+def system(command):
+    """Execute a command in the shell (like os.system) from the root
+    directory of the current run, and return its exit status"""
+    logger.debug("system: {}".format(command))
+    return call(command, shell=True, cwd=context_mod.current().root_dir)
 
 
 def tclpath(path):
@@ -77,6 +90,7 @@ def check_windows_tools():
 def check_windows_commands():
     """Check if we are using windows commands (del/type).
        False on cygwin"""
+    commands_os = context_mod.current().commands_os
     if commands_os == 'auto':
         return platform.system() == 'Windows'
     else:
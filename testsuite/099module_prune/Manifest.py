@@ -0,0 +1,8 @@
+action = "simulation"
+
+sim_tool="modelsim"
+
+top_module = "top"
+
+files = [ "top.v" ]
+modules = { 'local': ['used', 'unused']}
@@ -0,0 +1,3 @@
+module top;
+  leaf l();
+endmodule
@@ -0,0 +1 @@
+files = [ "unused.v", "vendor.v" ]
@@ -0,0 +1,5 @@
+`include "notfound.vh"
+
+module unused;
+  leaf l();
+endmodule
@@ -0,0 +1,3 @@
+// Vendor model, (c) Socit Gnrale
+module vendor_model;
+endmodule
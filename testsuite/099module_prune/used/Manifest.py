@@ -0,0 +1 @@
+files = [ "leaf.v" ]
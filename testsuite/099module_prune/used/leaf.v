@@ -0,0 +1,3 @@
+module leaf;
+  wire w;
+endmodule
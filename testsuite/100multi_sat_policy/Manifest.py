@@ -0,0 +1,11 @@
+action = "simulation"
+
+sim_tool="modelsim"
+sim_path="fake_bin"
+
+top_module = "gate3"
+
+files = [ "../files/gate3.vhd", "../files/gate.vhdl", "lgate.vhdl" ]
+
+dep_resolution = "single"
+dep_providers = { "gate": "../files/gate.vhdl" }
@@ -0,0 +1,7 @@
+action = "simulation"
+
+sim_tool = "isim"
+
+sim_top = "clk_top"
+
+files = [ "clk_top.v" ]
@@ -0,0 +1,5 @@
+module clk_top(input clk_p, input clk_n, output clk);
+  wire clk_ibuf;
+  IBUFDS ibuf(.I(clk_p), .IB(clk_n), .O(clk_ibuf));
+  BUFG bufg(.I(clk_ibuf), .O(clk));
+endmodule
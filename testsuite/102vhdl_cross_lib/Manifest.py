@@ -0,0 +1,9 @@
+action = "simulation"
+
+sim_tool="modelsim"
+sim_path="fake_bin"
+
+top_module = "gate3"
+
+files = [ "gate3.vhd" ]
+modules = { 'local': 'gates'}
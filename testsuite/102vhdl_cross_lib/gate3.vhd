@@ -0,0 +1,16 @@
+library sublib;
+
+entity gate3 is
+  port (i : in bit;
+        o : out bit);
+end gate3;
+
+architecture behav of gate3 is
+  component gate is
+    port (i : in bit;
+          o : out bit);
+  end component;
+begin
+  inst: gate
+    port map (i, o);
+end behav;
@@ -0,0 +1,3 @@
+library = 'sublib'
+
+files = [ '../../files/gate.vhdl']
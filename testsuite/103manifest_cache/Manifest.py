@@ -0,0 +1,9 @@
+action = "simulation"
+
+sim_tool = "iverilog"
+
+top_module = "level1"
+
+files = open("files.txt").read().split()
+
+print("files: {}".format(" ".join(files)))
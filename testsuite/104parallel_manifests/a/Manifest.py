@@ -0,0 +1,5 @@
+files = open("files.txt").read().split()
+
+print("module {}: {}".format(manifest_dir.split("/")[-1], " ".join(files)))
+
+assert manifest_path(files[0]) == manifest_dir + "/" + files[0]
@@ -0,0 +1,2 @@
+module mod_a;
+endmodule
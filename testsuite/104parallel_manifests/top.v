@@ -0,0 +1,5 @@
+module top;
+  mod_a a();
+  mod_b b();
+  mod_c c();
+endmodule
@@ -0,0 +1,9 @@
+action = "simulation"
+
+sim_tool = "iverilog"
+
+top_module = "top"
+
+files = [ "top.v" ]
+
+modules = { "local": [ "a", "b" ] }
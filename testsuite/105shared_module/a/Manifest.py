@@ -0,0 +1,3 @@
+files = [ "a.v" ]
+
+modules = { "local": [ "../shared", "../empty" ] }
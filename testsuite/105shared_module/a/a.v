@@ -0,0 +1,3 @@
+module mod_a;
+  shared s();
+endmodule
@@ -0,0 +1,3 @@
+files = [ "b.v" ]
+
+modules = { "local": [ "../shared", "../empty" ] }
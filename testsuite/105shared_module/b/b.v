@@ -0,0 +1,3 @@
+module mod_b;
+  shared s();
+endmodule
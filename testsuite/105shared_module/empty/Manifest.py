@@ -0,0 +1 @@
+print("empty module parsed")
@@ -0,0 +1,3 @@
+files = [ "shared.v" ]
+
+print("shared module parsed")
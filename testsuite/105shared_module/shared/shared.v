@@ -0,0 +1,2 @@
+module shared;
+endmodule
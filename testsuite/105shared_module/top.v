@@ -0,0 +1,4 @@
+module top;
+  mod_a a();
+  mod_b b();
+endmodule
@@ -0,0 +1 @@
+files = manifest_glob("src/*.v")
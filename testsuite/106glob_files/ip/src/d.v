@@ -0,0 +1,2 @@
+module d_mod;
+endmodule
@@ -0,0 +1,2 @@
+module e_mod;
+endmodule
@@ -0,0 +1,3 @@
+module a_mod;
+  b_mod inst();
+endmodule
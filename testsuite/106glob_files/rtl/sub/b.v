@@ -0,0 +1,3 @@
+module b_mod;
+  c_mod inst();
+endmodule
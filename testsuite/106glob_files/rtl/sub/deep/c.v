@@ -0,0 +1,2 @@
+module c_mod;
+endmodule
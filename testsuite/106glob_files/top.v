@@ -0,0 +1,4 @@
+module top;
+  d_mod inst_d();
+  a_mod inst();
+endmodule
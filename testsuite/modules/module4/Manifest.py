@@ -0,0 +1 @@
+files = [ "rtl/mod4.vhdl" ]
@@ -2,11 +2,22 @@
 # Just run 'pytest' in this directory.
 
 import hdlmake.main
+from hdlmake.action.commands import Commands
+from hdlmake.fetch import mirror as mirror_mod
+from hdlmake.fetch.git import Git
+from hdlmake.fetch.mirror import MirrorCache
+from hdlmake.fetch import store as store_mod
 from hdlmake.manifest_parser.configparser import ConfigParser
+from hdlmake.sourcefiles.vlog_parser import VerilogParser
+from hdlmake.util import path as path_mod
+from hdlmake.util.context import Context
+import json
+import logging
 import os
 import os.path
 import pytest
 import shutil
+import threading
 
 class Config(object):
     def __init__(self, path=None, my_os='unx', fakebin="linux_fakebin"):
@@ -225,6 +236,391 @@ def test_git_fetch_err():
         run(['fetch'], path="075err_git")
     shutil.rmtree('ipcores', ignore_errors=True)
 
+def test_parallel_fetch_107(caplog):
+    # The failing module does not prevent the others (and the submodule
+    # of module3) from being fetched.
+    with pytest.raises(SystemExit) as _:
+        run(['-j', '3', 'fetch'], path="107parallel_fetch")
+    assert sorted(os.listdir("107parallel_fetch/ipcores")) == [
+        'module1', 'module2', 'module3']
+    assert "Unable to fetch 1 module(s):\n git@test.org:tester/unknown.git" \
+        in caplog.text
+    shutil.rmtree("107parallel_fetch/ipcores")
+
+def test_parallel_fetch_worker_error(monkeypatch):
+    # An unexpected exception in a fetch thread is raised in the main thread
+    # instead of leaving it waiting forever for the module.
+    class FetchAborted(BaseException):
+        pass
+
+    def fetch_module(self, module):
+        raise FetchAborted(module.url)
+
+    monkeypatch.setattr(Commands, "_fetch_module", fetch_module)
+    outcome = []
+
+    def run_fetch():
+        try:
+            run(['-j', '3', 'fetch'], path="107parallel_fetch")
+        except BaseException as error:
+            outcome.append(error)
+
+    thread = threading.Thread(target=run_fetch)
+    thread.daemon = True
+    thread.start()
+    thread.join(30)
+    assert not thread.is_alive()
+    assert isinstance(outcome[0], FetchAborted)
+    assert not os.path.exists("107parallel_fetch/ipcores")
+
+def make_git_repo(path, files):
+    """Create a git repository with the given files committed"""
+    os.makedirs(path)
+    for name, content in files.items():
+        with open(os.path.join(path, name), "w") as repo_file:
+            repo_file.write(content)
+    git = "git -C {} -c user.name=t -c user.email=t@t ".format(path)
+    assert os.system("git init -q -b master {}".format(path)) == 0
+    assert os.system(git + "add .") == 0
+    assert os.system(git + "commit -q -m init") == 0
+
+def test_git_mirrors(tmp_path, caplog):
+    repo = str(tmp_path / "repos" / "ipcore")
+    make_git_repo(repo, {"Manifest.py": 'files = ["core.v"]\n',
+                         "core.v": "module core;\nendmodule\n"})
+    top = tmp_path / "top"
+    make_git_repo(str(top), {"Manifest.py":
+        'fetchto = "ipcores"\n'
+        'modules = {{"git": ["file://{}::master"]}}\n'.format(repo)})
+    cache = str(tmp_path / "cache")
+    context = Context(root_dir=str(top))
+    hdlmake.main.hdlmake(['--cache-dir', cache, '--git-mirrors', 'fetch'],
+                         context=context)
+    assert os.path.isfile(str(top / "ipcores" / "ipcore" / "core.v"))
+    assert len([name for name in os.listdir(os.path.join(cache, "mirrors"))
+                if name.endswith(".git")]) == 1
+    # Fetch again without the original repository
+    shutil.rmtree(str(top / "ipcores"))
+    shutil.move(repo, repo + ".moved")
+    hdlmake.main.hdlmake(['--cache-dir', cache, '--offline', 'fetch'],
+                         context=context)
+    assert os.path.isfile(str(top / "ipcores" / "ipcore" / "core.v"))
+    origin = os.popen("git -C {} remote get-url origin".format(
+        top / "ipcores" / "ipcore")).read().strip()
+    assert origin == "file://" + repo
+    # No mirror for the repository in another cache
+    shutil.rmtree(str(top / "ipcores"))
+    with pytest.raises(SystemExit) as _:
+        hdlmake.main.hdlmake(['--cache-dir', str(tmp_path / "other"),
+                              '--offline', 'fetch'], context=context)
+    assert "(offline mode)" in caplog.text
+    # The mirrors beyond the size limit are evicted
+    stale = os.path.join(cache, "mirrors", "stale-0.git")
+    os.makedirs(stale)
+    with open(os.path.join(stale, "packed-refs"), "w") as stale_file:
+        stale_file.write("x" * 4096)
+    os.utime(stale, (0, 0))
+    hdlmake.main.hdlmake(['--cache-dir', cache, '--offline',
+                          '--mirror-max-size', '0', 'fetch'],
+                         context=context)
+    assert len([name for name in os.listdir(os.path.join(cache, "mirrors"))
+                if name.endswith(".git")]) == 1
+    assert not os.path.exists(stale)
+
+def test_git_mirror_cache_sharing(tmp_path, monkeypatch):
+    # The cache is shared by the processes of the machine: a mirror created
+    # meanwhile by another process is used instead of the new copy, and a
+    # mirror locked by another process is not evicted.
+    fcntl = pytest.importorskip("fcntl")
+    cache = MirrorCache(str(tmp_path), max_size=0)
+    url = "file:///repos/ipcore"
+    mirror = cache.mirror_path(url)
+
+    def run_concurrent_mirror(command):
+        os.makedirs(os.path.join(mirror, "refs"))
+        os.makedirs(os.path.join(command.split('"')[1], "objects"))
+
+    monkeypatch.setattr(mirror_mod.shell, "run", run_concurrent_mirror)
+    with cache.use(url) as path:
+        assert path == mirror
+    assert os.listdir(mirror) == ["refs"]
+    assert [name for name in os.listdir(str(tmp_path))
+            if name.endswith(".tmp")] == []
+    with open(os.path.join(mirror, "refs", "packed"), "w") as refs_file:
+        refs_file.write("x" * 4096)
+    with open(mirror + ".lock", "a") as lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        cache.evict()
+        assert os.path.isdir(mirror)
+    cache.evict()
+    assert not os.path.exists(mirror)
+
+def test_git_shallow_fetch(tmp_path, monkeypatch):
+    repo = str(tmp_path / "repos" / "ipcore")
+    make_git_repo(repo, {"Manifest.py": 'files = ["core.v"]\n',
+                         "core.v": "module core;\nendmodule\n"})
+    first = os.popen("git -C {} rev-parse HEAD".format(repo)).read().strip()
+    assert os.system("git -C {} -c user.name=t -c user.email=t@t "
+                     "tag -a -m first v1.0".format(repo)) == 0
+    with open(os.path.join(repo, "core.v"), "w") as core_file:
+        core_file.write("module core2;\nendmodule\n")
+    assert os.system("git -C {} -c user.name=t -c user.email=t@t "
+                     "commit -q -a -m second".format(repo)) == 0
+    # The full SHA and the tag are fetched shallow, the abbreviated SHA is
+    # refused and the module falls back to a partial clone.
+    for pin, content in [("::master", "core2"), ("@@" + first, "core;"),
+                         ("@@" + first[:10], "core;"), ("@@v1.0", "core;")]:
+        top = tmp_path / "top{}".format(len(pin))
+        make_git_repo(str(top), {"Manifest.py":
+            'fetchto = "ipcores"\n'
+            'modules = {{"git": ["file://{}{}"]}}\n'.format(repo, pin)})
+        hdlmake.main.hdlmake(['fetch'], context=Context(root_dir=str(top)))
+        clone = str(top / "ipcores" / "ipcore")
+        with open(os.path.join(clone, "core.v")) as core_file:
+            assert content in core_file.read()
+        shallow = os.popen("git -C {} rev-parse --is-shallow-repository"
+                           .format(clone)).read().strip()
+        assert shallow == ("true" if len(pin) != 12 else "false")
+    # The shallow clone is replaced by a partial one if it cannot be
+    # checked out.
+    checkout = Git._checkout
+    monkeypatch.setattr(Git, "_checkout", staticmethod(
+        lambda module, mod_path, checkout_id: checkout_id != "FETCH_HEAD"
+        and checkout(module, mod_path, checkout_id)))
+    shutil.rmtree(str(top / "ipcores"))
+    hdlmake.main.hdlmake(['fetch'], context=Context(root_dir=str(top)))
+    with open(os.path.join(clone, "core.v")) as core_file:
+        assert "core;" in core_file.read()
+    assert os.popen("git -C {} rev-parse --is-shallow-repository".format(
+        clone)).read().strip() == "false"
+
+def test_git_sparse_fetch(tmp_path):
+    repo = str(tmp_path / "repos" / "mono")
+    make_git_repo(repo, {"Manifest.py": 'files = ["core.v"]\n'})
+    for subdir in ("core", "other"):
+        os.makedirs(os.path.join(repo, "rtl", subdir))
+        with open(os.path.join(repo, "rtl", subdir, "core.v"), "w") as f:
+            f.write("module {};\nendmodule\n".format(subdir))
+    with open(os.path.join(repo, "Manifest.py"), "w") as f:
+        f.write('files = ["rtl/core/core.v"]\n')
+    assert os.system("git -C {0} add . && git -C {0} -c user.name=t "
+                     "-c user.email=t@t commit -q -m rtl".format(repo)) == 0
+    for pin in ("", "::master"):
+        top = tmp_path / "top{}".format(len(pin))
+        make_git_repo(str(top), {"Manifest.py":
+            'fetchto = "ipcores"\n'
+            'modules = {{"git": ["file://{}{}#rtl/core"]}}\n'.format(
+                repo, pin)})
+        hdlmake.main.hdlmake(['fetch'], context=Context(root_dir=str(top)))
+        clone = top / "ipcores" / "mono"
+        assert (clone / "rtl" / "core" / "core.v").is_file()
+        assert not (clone / "rtl" / "other").exists()
+
+def test_lock_file(tmp_path, caplog):
+    repo = str(tmp_path / "repos" / "ipcore")
+    make_git_repo(repo, {"Manifest.py": 'files = ["core.v"]\n',
+                         "core.v": "module core;\nendmodule\n"})
+    top = tmp_path / "top"
+    make_git_repo(str(top), {"Manifest.py":
+        'fetchto = "ipcores"\n'
+        'modules = {{"git": ["file://{}::master"]}}\n'.format(repo)})
+    context = Context(root_dir=str(top))
+    hdlmake.main.hdlmake(['fetch'], context=context)
+    assert not (top / "hdlmake.lock").exists()
+    hdlmake.main.hdlmake(['lock'], context=context)
+    with open(str(top / "hdlmake.lock")) as lock_file:
+        lock = json.load(lock_file)
+    locked = lock["modules"]["file://" + repo]["revision"]
+    assert locked == os.popen("git -C {} rev-parse HEAD".format(
+        repo)).read().strip()
+    hdlmake.main.hdlmake(['verify'], context=context)
+    # A new commit on the branch is ignored by the locked fetch
+    with open(os.path.join(repo, "core.v"), "w") as core_file:
+        core_file.write("module core2;\nendmodule\n")
+    assert os.system("git -C {} -c user.name=t -c user.email=t@t "
+                     "commit -q -a -m second".format(repo)) == 0
+    shutil.rmtree(str(top / "ipcores"))
+    hdlmake.main.hdlmake(['-j', '2', 'fetch'], context=context)
+    with open(str(top / "ipcores" / "ipcore" / "core.v")) as core_file:
+        assert "core;" in core_file.read()
+    hdlmake.main.hdlmake(['-j', '2', 'verify'], context=context)
+    # The workspace does not match another lock
+    lock["modules"]["file://" + repo]["revision"] = "0" * 40
+    with open(str(top / "other.lock"), "w") as lock_file:
+        json.dump(lock, lock_file)
+    with pytest.raises(SystemExit) as _:
+        hdlmake.main.hdlmake(['--lock-file', 'other.lock', 'verify'],
+                             context=context)
+    assert "locked at {}".format("0" * 40) in caplog.text
+
+def test_update(tmp_path):
+    repos = tmp_path / "repos"
+    core, extra = str(repos / "core"), str(repos / "extra")
+    make_git_repo(core, {"Manifest.py": 'files = ["core.v"]\n',
+                         "core.v": "module core;\nendmodule\n"})
+    make_git_repo(extra, {"Manifest.py": 'files = ["extra.v"]\n',
+                          "extra.v": "module extra;\nendmodule\n"})
+    first = os.popen("git -C {} rev-parse HEAD".format(core)).read().strip()
+    top = tmp_path / "top"
+    manifest = 'fetchto = "ipcores"\nmodules = {{"git": ["file://{}{}"]}}\n'
+    make_git_repo(str(top), {"Manifest.py": manifest.format(core, "::master")})
+    context = Context(root_dir=str(top))
+    hdlmake.main.hdlmake(['fetch'], context=context)
+    clone = top / "ipcores" / "core"
+    (clone / "marker").write_text("not removed by an update")
+    # The new commit requires another module
+    with open(os.path.join(core, "core.v"), "w") as core_file:
+        core_file.write("module core2;\nendmodule\n")
+    with open(os.path.join(core, "Manifest.py"), "a") as manifest_file:
+        manifest_file.write('fetchto = "../"\n'
+                            'modules = {{"git": ["file://{}::master"]}}\n'
+                            .format(extra))
+    assert os.system("git -C {} -c user.name=t -c user.email=t@t "
+                     "commit -q -a -m second".format(core)) == 0
+    hdlmake.main.hdlmake(['-j', '2', 'update'], context=context)
+    assert "core2" in (clone / "core.v").read_text()
+    assert (clone / "marker").exists()
+    assert (top / "ipcores" / "extra" / "extra.v").exists()
+    # Pin the module to its first commit
+    (top / "Manifest.py").write_text(manifest.format(core, "@@" + first))
+    hdlmake.main.hdlmake(['update'], context=context)
+    assert "core;" in (clone / "core.v").read_text()
+    assert (clone / "marker").exists()
+
+def test_archive_fetch(tmp_path, caplog):
+    import hashlib
+    import tarfile
+    import zipfile
+    dist = tmp_path / "dist"
+    release = dist / "vendor_ip-1.0"
+    release.mkdir(parents=True)
+    (release / "Manifest.py").write_text('files = ["ip.vhd"]\n')
+    (release / "ip.vhd").write_text("entity ip is\nend ip;\n")
+    tar_path = str(dist / "vendor_ip-1.0.tar.gz")
+    with tarfile.open(tar_path, "w:gz") as tar_file:
+        tar_file.add(str(release), arcname="vendor_ip-1.0")
+    zip_path = str(dist / "other.zip")
+    with zipfile.ZipFile(zip_path, "w") as zip_file:
+        zip_file.writestr("Manifest.py", 'files = ["other.vhd"]\n')
+        zip_file.writestr("other.vhd", "entity other is\nend other;\n")
+    digests = []
+    for path in (tar_path, zip_path):
+        with open(path, "rb") as archive:
+            digests.append(hashlib.sha256(archive.read()).hexdigest())
+    cache = str(tmp_path / "cache")
+    for name in ("ws1", "ws2"):
+        top = tmp_path / name
+        top.mkdir()
+        (top / "Manifest.py").write_text(
+            'fetchto = "ipcores"\n'
+            'modules = {{"archive": ["../dist/vendor_ip-1.0.tar.gz@@{}",\n'
+            '                        "file://{}@@sha256:{}"]}}\n'.format(
+                digests[0], zip_path, digests[1]))
+        context = Context(root_dir=str(top))
+        hdlmake.main.hdlmake(['--cache-dir', cache, 'fetch'],
+                             context=context)
+        assert (top / "ipcores" / "vendor_ip-1.0" / "ip.vhd").is_file()
+        assert (top / "ipcores" / "other" / "other.vhd").is_file()
+        if name == "ws1":
+            # The second workspace is extracted from the cache
+            os.remove(tar_path)
+            os.remove(zip_path)
+    assert len(os.listdir(os.path.join(cache, "archives"))) == 2
+    hdlmake.main.hdlmake(['--cache-dir', cache, 'update'], context=context)
+    hdlmake.main.hdlmake(['--cache-dir', cache, 'lock'], context=context)
+    hdlmake.main.hdlmake(['--cache-dir', cache, 'verify'], context=context)
+    # The archive paths are recorded relative to the top manifest, so the
+    # lock file still matches once the workspace is moved.
+    with open(str(top / "hdlmake.lock")) as lock_file:
+        locked = json.load(lock_file)["modules"]
+    assert "../dist/vendor_ip-1.0.tar.gz" in locked
+    moved = tmp_path / "moved"
+    moved.mkdir()
+    shutil.move(str(top), str(moved / "ws2"))
+    shutil.move(str(dist), str(moved / "dist"))
+    top, dist = moved / "ws2", moved / "dist"
+    context = Context(root_dir=str(top))
+    hdlmake.main.hdlmake(['--cache-dir', cache, 'verify'], context=context)
+    # The archives are verified before being added to a cache
+    (dist / "vendor_ip-1.0.tar.gz").write_text("not the release")
+    shutil.rmtree(str(top / "ipcores"))
+    with pytest.raises(SystemExit) as _:
+        hdlmake.main.hdlmake(['--cache-dir', str(tmp_path / "other"),
+                              'fetch'], context=context)
+    assert "Wrong sha256 digest" in caplog.text
+
+def test_module_store(tmp_path, monkeypatch):
+    repo = str(tmp_path / "repos" / "core")
+    make_git_repo(repo, {"Manifest.py": 'files = ["core.v"]\n',
+                         "core.v": "module core;\nendmodule\n"})
+    first = os.popen("git -C {} rev-parse HEAD".format(repo)).read().strip()
+    with open(os.path.join(repo, "core.v"), "w") as core_file:
+        core_file.write("module core2;\nendmodule\n")
+    assert os.system("git -C {} -c user.name=t -c user.email=t@t "
+                     "commit -q -a -m second".format(repo)) == 0
+    second = os.popen("git -C {} rev-parse HEAD".format(repo)).read().strip()
+    manifest = 'fetchto = "ipcores"\nmodules = {{"git": ["file://{}@@{}"]}}\n'
+    store = str(tmp_path / "cache" / "store")
+    store_args = ['--cache-dir', str(tmp_path / "cache"), '--store']
+    # The tree is made read-only once moved into the store (moving a
+    # read-only directory fails without root privileges).
+    read_only = []
+    set_read_only = store_mod._set_read_only
+
+    def record_read_only(path):
+        read_only.append(path)
+        set_read_only(path)
+
+    monkeypatch.setattr(store_mod, "_set_read_only", record_read_only)
+
+    def get_entries():
+        return sorted([name for name in os.listdir(store)
+                       if not name.endswith(".lock")])
+
+    cores = []
+    for name, link in (("ws1", "hardlink"), ("ws2", "hardlink"),
+                       ("ws3", "symlink")):
+        top = tmp_path / name
+        top.mkdir()
+        (top / "Manifest.py").write_text(manifest.format(repo, first))
+        hdlmake.main.hdlmake(store_args + ['--store-link', link, 'fetch'],
+                             context=Context(root_dir=str(top)))
+        clone = top / "ipcores" / "core"
+        assert "core;" in (clone / "core.v").read_text()
+        assert not (clone / ".git").exists()
+        assert os.path.islink(str(clone)) == (link == "symlink")
+        cores.append(os.stat(str(clone / "core.v")).st_ino)
+    # The files are materialized once, and read-only
+    assert len(set(cores)) == 1
+    assert os.stat(str(clone / "core.v")).st_mode & 0o222 == 0
+    assert os.stat(str(clone)).st_mode & 0o200 != 0
+    assert read_only == [os.path.join(store, name) for name in get_entries()]
+    context = Context(root_dir=str(tmp_path / "ws1"))
+    hdlmake.main.hdlmake(store_args + ['lock'], context=context)
+    hdlmake.main.hdlmake(store_args + ['verify'], context=context)
+    hdlmake.main.hdlmake(store_args + ['update'], context=context)
+    # A new revision is linked from a new store entry
+    os.remove(str(tmp_path / "ws1" / "hdlmake.lock"))
+    (tmp_path / "ws1" / "Manifest.py").write_text(
+        manifest.format(repo, second))
+    hdlmake.main.hdlmake(store_args + ['update'], context=context)
+    clone = tmp_path / "ws1" / "ipcores" / "core"
+    assert "core2" in (clone / "core.v").read_text()
+    assert len(get_entries()) == 2
+    hdlmake.main.hdlmake(store_args + ['clean'], context=context)
+    assert not clone.exists()
+    assert "core;" in (tmp_path / "ws2" / "ipcores" / "core" /
+                       "core.v").read_text()
+    # The least recently used entries are evicted, the hard linked
+    # workspaces keep their files.
+    hdlmake.main.hdlmake(store_args + ['--store-max-size', '0', 'fetch'],
+                         context=context)
+    marker = (tmp_path / "ws1" / "ipcores" / ".core.store").read_text()
+    assert get_entries() == marker.split()[:1]
+    assert "core2" in (clone / "core.v").read_text()
+    assert "core;" in (tmp_path / "ws2" / "ipcores" / "core" /
+                       "core.v").read_text()
+
 def test_svn_fetch_err():
     with pytest.raises(SystemExit) as _:
         run(['--full-error', 'fetch'], path="094err_svn")
@@ -242,6 +638,15 @@ def test_svn_fetch_rev():
         hdlmake.main.hdlmake(['fetch'])
         shutil.rmtree('ipcores')
 
+def test_svn_fetch_sparse():
+    with Config(path="108svn_sparse") as _:
+        hdlmake.main.hdlmake(['fetch'])
+        assert os.path.isfile('ipcores/module4/rtl/mod4.vhdl')
+        assert not os.path.exists('ipcores/module4/doc')
+        hdlmake.main.hdlmake(['update'])
+        hdlmake.main.hdlmake(['list-files'])
+        shutil.rmtree('ipcores')
+
 def test_gitsm_fetch():
     with Config(path="022gitsm_fetch") as _:
         hdlmake.main.hdlmake(['fetch'])
@@ -393,6 +798,31 @@ def test_configparser_unexpected_key():
     with pytest.raises(RuntimeError) as _:
         p.add_allowed_key("a", key="k")
 
+def test_configparser_literal(tmp_path, monkeypatch):
+    manifest = tmp_path / "Manifest.py"
+    manifest.write_text(u'"""Doc"""\nfiles = ["a.vhd", "b.vhd"]\n'
+                        u'a = b = {"k": (1, -2.5, None)}\nfiles = ["c.vhd"]\n')
+    p = ConfigParser()
+    p.add_option("files", type=[])
+    # Literal manifests are not executed in the manifest directory.
+    monkeypatch.setattr(os, "chdir", None)
+    assert p.parse(config_file=str(manifest), extra_context={}) == {
+        'files': ['c.vhd'], 'a': {'k': (1, -2.5, None)},
+        'b': {'k': (1, -2.5, None)}}
+
+def test_configparser_inherited(tmp_path):
+    manifest = tmp_path / "Manifest.py"
+    manifest.write_text(u'x = [top_var for _ in range(2)]\n'
+                        u'def __get():\n    return top_var\ny = __get()\n'
+                        u'try:\n    files\nexcept NameError:\n    z = len(x)\n')
+    p = ConfigParser()
+    top = {"top_var": 1, "files": ["top.vhd"], "len": len}
+    extra_context = {}
+    assert p.parse(config_file=str(manifest), extra_context=extra_context,
+                   inherited_context=top) == {'x': [1, 1], 'y': 1, 'z': 2}
+    # The inherited variables are not copied.
+    assert "top_var" not in extra_context
+
 def test_err_manifest_type():
     with pytest.raises(SystemExit) as _:
         run([], path="050err_manifest_type")
@@ -428,6 +858,39 @@ def test_dep_level():
     run(['list-files', '--reverse'], path="053vlog_dep_level")
     run(['list-files', '--top', 'level2'], path="053vlog_dep_level")
 
+def test_waves(capsys):
+    run(['list-files', '--waves'], path="053vlog_dep_level")
+    out = capsys.readouterr().out.splitlines()
+    waves = [[os.path.basename(f) for f in l.split()] for l in out]
+    assert waves == [['level0.v'], ['level1.v'], ['level2.v'], ['vlog.v']]
+
+def test_impact(capsys):
+    run(['impact', 'level1.v'], path="053vlog_dep_level")
+    out = capsys.readouterr().out.split()
+    assert [os.path.basename(f) for f in out] == ['level1.v', 'level2.v', 'vlog.v']
+    run(['impact', '--units', '--top', 'level2', 'level0.v'],
+        path="053vlog_dep_level")
+    out = capsys.readouterr().out.split()
+    assert out == ['work.level0', 'work.level1', 'work.level2']
+
+def test_select_tests(capsys):
+    run(['select-tests', '-t', 'level0', '-t', 'level1', '-t', 'gate',
+         '--format', 'json', 'level1.v'], path="053vlog_dep_level")
+    out = json.loads(capsys.readouterr().out)
+    assert out == {'selected': ['level1', 'gate'], 'skipped': ['level0']}
+    run(['-s', 'sim_tops = ["level0", "level2"]', 'select-tests',
+         '--format', 'make', 'level0.v'], path="053vlog_dep_level")
+    assert capsys.readouterr().out == "TESTS := level0 level2\n"
+
+def test_module_prune_099(capsys):
+    # The unused module cannot be parsed, but it is pruned before parsing.
+    # Its pre-scan ignores the bytes that cannot be decoded (vendor.v).
+    run(['list-files'], path="099module_prune")
+    out = capsys.readouterr().out.split()
+    assert [os.path.basename(f) for f in out] == ['leaf.v', 'top.v']
+    with pytest.raises(SystemExit) as _:
+        run(['-a', 'list-files'], path="099module_prune")
+
 def test_modelsim_windows():
     assert hdlmake.util.shell.check_windows_tools() is False
     run_compare(path="057msim_windows", my_os='windows')
@@ -509,6 +972,247 @@ def test_err_missing_module():
 def test_library():
     run_compare(path="091library")
 
+def test_vhdl_cross_lib_102():
+    run_compare(path="102vhdl_cross_lib")
+
+def test_manifest_cache_103(tmp_path, capsys, caplog):
+    caplog.set_level(logging.INFO)
+    args = ['--manifest-cache', '--cache-dir', str(tmp_path), 'list-files']
+    run(args, path="103manifest_cache")
+    assert "Manifest cache: 0 hits, 1 misses" in caplog.text
+    out = capsys.readouterr().out
+    caplog.clear()
+    run(args, path="103manifest_cache")
+    assert "Manifest cache: 1 hits, 0 misses" in caplog.text
+    assert capsys.readouterr().out == out
+    # The cached result depends on the files read by the manifest.
+    list_file = os.path.join("103manifest_cache", "files.txt")
+    files = open(list_file).read()
+    try:
+        with open(list_file, "w") as f:
+            f.write("../053vlog_dep_level/level0.v")
+        caplog.clear()
+        run(args, path="103manifest_cache")
+        assert "Manifest cache: 0 hits, 1 misses" in caplog.text
+        assert "level1.v" not in capsys.readouterr().out
+    finally:
+        with open(list_file, "w") as f:
+            f.write(files)
+
+def test_manifest_cache_environ_stat(tmp_path, capsys, caplog, monkeypatch):
+    # The cached result depends on the environment variables read and on
+    # the existence checks done by the manifest, and only on them.
+    caplog.set_level(logging.INFO)
+    top = tmp_path / "top"
+    top.mkdir()
+    (top / "Manifest.py").write_text(
+        u'import os\n'
+        u'action = "simulation"\n'
+        u'sim_tool = "iverilog"\n'
+        u'sim_top = os.environ.get("TOPX", "a")\n'
+        u'from os.path import isfile\n'
+        u'files = ["a.v"] if isfile("a.v") else []\n'
+        u'print("top: {} files: {}".format(sim_top, files))\n')
+    args = ['--manifest-cache', '--cache-dir', str(tmp_path / "cache"),
+            'list-files']
+    monkeypatch.delenv("TOPX", raising=False)
+
+    def run_top(expected, hits):
+        caplog.clear()
+        hdlmake.main.hdlmake(args, context=Context(root_dir=str(top)))
+        assert "Manifest cache: {} hits".format(hits) in caplog.text
+        assert expected in capsys.readouterr().out
+
+    run_top("top: a files: []", 0)
+    run_top("top: a files: []", 1)
+    monkeypatch.setenv("UNRELATED_JOB_ID", "1234")
+    run_top("top: a files: []", 1)
+    monkeypatch.setenv("TOPX", "b")
+    run_top("top: b files: []", 0)
+    (top / "a.v").write_text(u"module a; endmodule\n")
+    run_top("top: b files: ['a.v']", 0)
+    run_top("top: b files: ['a.v']", 1)
+    # The tracking does not change the os module of the process
+    assert os.stat is os.__dict__["stat"] and os.path.isfile.__module__ in (
+        "genericpath", "posixpath", "ntpath")
+
+def test_parallel_manifests_104(capsys, monkeypatch):
+    run(['list-files'], path="104parallel_manifests")
+    out = capsys.readouterr().out
+    assert "> module b: b.v" in out
+    # With --parallel-manifests, the manifests are evaluated concurrently
+    # without changing the current directory, the output is the same.
+    with Config(path="104parallel_manifests") as _:
+        monkeypatch.setattr(os, "chdir", None)
+        hdlmake.main.hdlmake(['-j', '3', '--parallel-manifests',
+                              'list-files'])
+        monkeypatch.undo()
+    assert capsys.readouterr().out == out
+
+def test_jobs_keep_manifest_dir(tmp_path, capsys):
+    # Several jobs alone do not change how the manifests are evaluated:
+    # they still run from their own directory.
+    (tmp_path / "Manifest.py").write_text(
+        u'action = "simulation"\n'
+        u'sim_tool = "iverilog"\n'
+        u'modules = { "local": [ "sub" ] }\n')
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "Manifest.py").write_text(
+        u'import glob\n'
+        u'files = glob.glob("*.v")\n')
+    (tmp_path / "sub" / "sub.v").write_text(u"module sub; endmodule\n")
+    hdlmake.main.hdlmake(['-j', '2', 'list-files'],
+                         context=Context(root_dir=str(tmp_path)))
+    assert "sub.v" in capsys.readouterr().out
+
+def test_shared_module_105(capsys):
+    run(['list-mods'], path="105shared_module")
+    out = capsys.readouterr().out
+    # The modules used by both a and b are created and parsed only once,
+    # even if the manifest defines no variable.
+    assert out.count("shared module parsed") == 1
+    assert out.count("empty module parsed") == 1
+    assert out.count("# MODULE START -> ") == 5
+
+def test_glob_files_106(capsys):
+    run(['list-files'], path="106glob_files")
+    out = capsys.readouterr().out.split()
+    assert sorted([os.path.relpath(f, "106glob_files") for f in out]) == [
+        'ip/src/d.v', 'rtl/a.v', 'rtl/sub/b.v', 'rtl/sub/deep/c.v', 'top.v']
+    # Every directory is listed only once
+    scanned = []
+    with Config(path="106glob_files") as _:
+        path_mod.reset_fs_cache()
+        path_mod.scan_dir("rtl")
+        scanned.extend(path_mod.glob_files("rtl/**/*.v"))
+        scanned.extend(path_mod.glob_files("*/**/[a-d].{v,vh}"))
+        assert len(path_mod.fs_cache().dirs) == 6
+    assert len(scanned) == 7
+
+def test_fs_cache(tmp_path):
+    path_mod.reset_fs_cache()
+    new_file = str(tmp_path / "new.v")
+    assert path_mod.list_dir(str(tmp_path)) == []
+    # Answered from the listing of the directory
+    assert not path_mod.path_exists(new_file)
+    assert path_mod.fs_cache().stats == {"syscalls": 1, "avoided": 1}
+    open(new_file, "w").close()
+    assert not path_mod.path_isfile(new_file)
+    path_mod.invalidate_fs_cache(new_file)
+    assert path_mod.path_isfile(new_file)
+    assert path_mod.path_isdir(str(tmp_path))
+    assert path_mod.list_dir(str(tmp_path)) == ["new.v"]
+    with pytest.raises(OSError):
+        path_mod.list_dir(new_file)
+
+def test_fs_cache_generated_file(tmp_path, capsys):
+    # The directory is listed before the manifest generates its file
+    (tmp_path / "Manifest.py").write_text(
+        u'action = "simulation"\n'
+        u'sim_tool = "iverilog"\n'
+        u'sim_top = "gen"\n'
+        u'with open("gen.v", "w") as gen:\n'
+        u'    gen.write("module gen; endmodule\\n")\n'
+        u'files = ["gen.v"]\n')
+    hdlmake.main.hdlmake(['list-files'],
+                         context=Context(root_dir=str(tmp_path)))
+    assert capsys.readouterr().out.split() == [str(tmp_path / "gen.v")]
+
+def test_parse_pipeline(capsys):
+    for path in ["053vlog_dep_level", "099module_prune", "106glob_files"]:
+        run(['list-files'], path=path)
+        out = capsys.readouterr().out
+        run(['--pipeline', '-j', '3', 'list-files'], path=path)
+        assert capsys.readouterr().out == out
+    with Config(path="083icarus_include") as _:
+        hdlmake.main.hdlmake(['--pipeline', 'makefile'])
+        compare_makefile()
+
+def test_parse_pipeline_worker_error(monkeypatch):
+    # An unexpected exception in a parsing thread is raised by the run
+    # instead of blocking it.
+    class ParseAborted(BaseException):
+        pass
+
+    def parse(self, dep_file):
+        raise ParseAborted(dep_file.path)
+
+    monkeypatch.setattr(VerilogParser, "parse", parse)
+    outcome = []
+
+    def run_pipeline():
+        try:
+            run(['--pipeline', '-j', '3', 'list-files'],
+                path="053vlog_dep_level")
+        except BaseException as error:
+            outcome.append(error)
+
+    thread = threading.Thread(target=run_pipeline)
+    thread.daemon = True
+    thread.start()
+    thread.join(30)
+    assert not thread.is_alive()
+    assert isinstance(outcome[0], ParseAborted)
+
+def test_concurrent_runs(monkeypatch, caplog):
+    # Independent runs in threads of the same process: no run changes the
+    # current directory, and the messages go to the logger of every run.
+    caplog.set_level(logging.INFO)
+    paths = ["008ghdl", "012icarus", "019vsim", "083icarus_include"]
+    errors = []
+    records = dict([(path, []) for path in paths])
+
+    class ListHandler(logging.Handler):
+        def __init__(self, path):
+            super(ListHandler, self).__init__()
+            self.path = path
+
+        def emit(self, record):
+            records[self.path].append(record.threadName)
+
+    def run_thread(path):
+        logger = logging.getLogger("hdlmake_test." + path)
+        logger.propagate = False
+        logger.addHandler(ListHandler(path))
+        context = Context(root_dir=path, isolated=True, logger=logger)
+        try:
+            hdlmake.main.hdlmake(['-j', '2', 'makefile'], context=context)
+        except BaseException as error:
+            errors.append(error)
+
+    monkeypatch.setattr(os, "chdir", None)
+    threads = [threading.Thread(target=run_thread, args=(path,), name=path)
+               for path in paths]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    monkeypatch.undo()
+    assert errors == []
+    for path in paths:
+        assert len(records[path]) > 0
+        assert set(records[path]) == set([path])
+        with Config(path=path) as _:
+            compare_makefile()
+
+def test_context_logger_level(caplog):
+    # The level of a run with its own logger is not limited by the level
+    # of the root logger.
+    caplog.set_level(logging.INFO)
+    levels = []
+
+    class LevelHandler(logging.Handler):
+        def emit(self, record):
+            levels.append(record.levelno)
+
+    logger = logging.getLogger("hdlmake_test.debug")
+    logger.propagate = False
+    logger.addHandler(LevelHandler())
+    context = Context(root_dir="012icarus", logger=logger)
+    hdlmake.main.hdlmake(['--log', 'debug', 'list-mods'], context=context)
+    assert logging.DEBUG in levels
+    assert logging.DEBUG not in [record.levelno for record in caplog.records]
+
 def test_err_filetype():
     with pytest.raises(SystemExit) as _:
         run([], path="092bad_filetype")
@@ -517,6 +1221,56 @@ def test_err_filetype():
 def test_multi_sat():
     run_compare(path="093multi_sat")
 
+def test_multi_sat_policy_100(capsys):
+    run_compare(path="100multi_sat_policy")
+    capsys.readouterr()
+    # Without the override, the tie is broken by the file path.
+    run(['-s', 'dep_providers = {}', 'list-files'], path="100multi_sat_policy")
+    out = capsys.readouterr().out.split()
+    assert [os.path.basename(f) for f in out] == ['lgate.vhdl', 'gate3.vhd']
+
+def test_compact_graph(capsys):
+    with Config(path="083icarus_include") as _:
+        hdlmake.main.hdlmake(['--compact-graph', 'makefile'])
+        compare_makefile()
+    with Config(path="010isim") as _:
+        hdlmake.main.hdlmake(['--compact-graph', 'makefile'])
+        compare_makefile_xilinx()
+    run(['--compact-graph', 'impact', '--units', '--top', 'level2',
+         'level0.v'], path="053vlog_dep_level")
+    out = capsys.readouterr().out.split()
+    assert out == ['work.level0', 'work.level1', 'work.level2']
+
+def test_compact_graph_dependencies(monkeypatch):
+    # The per-file sets are released, the dependencies are still available
+    # to the actions (e.g. the tree) through the graph.
+    impact = Commands.impact
+    deps = []
+
+    def impact_and_record(self):
+        impact(self)
+        deps.append(dict([
+            (os.path.basename(f.path),
+             sorted([os.path.basename(d.path)
+                     for d in self.get_dependencies(f)]))
+            for f in self.parseable_fileset]))
+
+    monkeypatch.setattr(Commands, "impact", impact_and_record)
+    for args in [[], ['--compact-graph']]:
+        run(args + ['impact', '--top', 'level2', 'level0.v'],
+            path="053vlog_dep_level")
+    assert deps[0] == deps[1]
+    assert deps[1]["level2.v"] == ["level1.v"]
+
+def test_vendor_primitives_101(caplog):
+    run(['list-files'], path="101vendor_primitives")
+    assert "not satisfied" not in caplog.text
+    caplog.clear()
+    # Icarus does not provide the Xilinx primitives
+    run(['-s', 'sim_tool = "iverilog"', 'list-files'],
+        path="101vendor_primitives")
+    assert "module 'work.bufg' in clk_top.v not satisfied" in caplog.text
+
 def test_sys_package_097():
     with Config(path="097sys_package") as _:
         hdlmake.main.hdlmake([])